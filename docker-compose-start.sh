@@ -6,6 +6,7 @@ docker-compose build
 # Start a new web container to run migrations
 # Use --rm to remove the container when the command completes
 docker-compose run --rm app /venv/bin/python /code/monthly_expenses/manage.py migrate
+docker-compose run --rm app /venv/bin/python /code/monthly_expenses/manage.py createcachetable
 
 # Run everything in the background with -d
 docker-compose up -d
\ No newline at end of file
@@ -2,39 +2,133 @@
 from __future__ import unicode_literals
 import json
 
+from django.conf.urls import url
 from django.contrib import admin
-from django.utils.html import format_html_join
-from django.utils.safestring import mark_safe
+from django.core.exceptions import PermissionDenied
+from django.core.urlresolvers import reverse
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.utils.html import format_html, format_html_join
 
 from apps.spendings.models import Spending
-from apps.bills.models import Bill
+from apps.bills.models import Bill, ParsedItem, ParseJob
 
 
 class SpendingInline(admin.TabularInline):
+    # spendings are changed only with rewrite of bill spendings,
+    # which keeps daily rollups in sync
     model = Spending
+    readonly_fields = ('name', 'quantity', 'amount', 'date', 'user')
+    can_delete = False
+    extra = 0
+
+    def has_add_permission(self, request):
+        return False
+
+
+class ParsedItemInline(admin.TabularInline):
+    # parsed items are changed only by parser
+    model = ParsedItem
+    readonly_fields = ('name', 'quantity', 'amount')
+    can_delete = False
+    extra = 0
+
+    def has_add_permission(self, request):
+        return False
 
 
 class BillAdmin(admin.ModelAdmin):
-    inlines = (SpendingInline, )
-    readonly_fields = ('parsed_data', )
+    inlines = (SpendingInline, ParsedItemInline)
+    list_display = ('__str__', 'user', 'create_time', 'parser_version')
+    readonly_fields = (
+        'parsed_data', 'parser_version', 'parse_error', 'parse_trace_link')
+    actions = ('reparse', )
+
+    def reparse(self, request, queryset):
+        # bills are parsed again by background worker
+        scheduled = ParseJob.objects.schedule_reparse(
+            queryset.only('id'))
+        self.message_user(
+            request,
+            '%d bills scheduled for reparsing' % scheduled)
+    reparse.short_description = 'Reparse selected bills in background'
 
     def parsed_data(self, bill):
         # print json of parsed bill
-        # or error if bill can niot be parsed
+        # or parsing status if bill is not parsed yet
+        # OCR is never run here: bill is parsed in background
+        parse_status, data, error = bill.get_parse_status()
+        if data is not None:
+            return format_html(
+                '<pre>{}</pre>',
+                json.dumps(data))
+        return format_html(
+            '<span class="errors">{}: {}</span>',
+            parse_status,
+            error or '')
+
+    def get_urls(self):
+        return [
+            url(
+                r'^(?P<bill_id>\d+)/parse-trace/$',
+                self.admin_site.admin_view(self.parse_trace_view),
+                name='bills_bill_parse_trace'),
+        ] + super(BillAdmin, self).get_urls()
+
+    def parse_trace_link(self, bill):
+        # bill is parsed again for the trace,
+        # so it is shown only on request
+        if bill.pk is None:
+            return '-'
+        return format_html(
+            '<a href="{}">Show parser decisions</a>',
+            reverse('admin:bills_bill_parse_trace', args=(bill.pk, )))
+    parse_trace_link.short_description = 'Parse trace'
+
+    def parse_trace_view(self, request, bill_id):
+        bill = get_object_or_404(Bill, pk=bill_id)
+        if not self.has_change_permission(request, bill):
+            raise PermissionDenied
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            original=bill,
+            title='Parse trace of %s' % bill,
+            parse_trace=self.parse_trace(bill))
+        return TemplateResponse(
+            request, 'admin/bills/bill/parse_trace.html', context)
+
+    def parse_trace(self, bill):
+        # show parser decisions for stored OCR text
+        # bill is parsed again, but OCR is not run
         try:
-            data = bill.parse_bill()
-            return format_html_join(
-               mark_safe('<pre>'),
-               json.dumps(data),
-               mark_safe('</pre>'),
-            )
+            _, error, events = bill.trace_parse()
         except ValueError as e:
-            error = e.args[0]
-            return format_html_join(
-                mark_safe('<span class="errors">'),
-                error,
-                mark_safe('<span>'),
-            )
+            return e.args[0]
+        rows = format_html_join(
+            '\n',
+            '<tr><td>{}</td><td>{}</td></tr>',
+            (
+                (
+                    event.pop('event'),
+                    json.dumps(event, ensure_ascii=False))
+                for event in events
+            ))
+        return format_html(
+            '<table>{}</table>{}',
+            rows,
+            format_html(
+                '<span class="errors">{}</span>', error) if error else '')
+
+
+class ParseJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'bill', 'status', 'attempts', 'update_time', 'first_view_hit')
+    list_filter = ('status', 'first_view_hit')
+    readonly_fields = (
+        'bill', 'create_time', 'update_time',
+        'first_view_time', 'first_view_hit')
 
 
 admin.site.register(Bill, BillAdmin)
+admin.site.register(ParseJob, ParseJobAdmin)
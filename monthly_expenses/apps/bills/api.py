@@ -4,7 +4,6 @@ REST API endpoints to parse and upload bills images
 import logging
 
 from django.db import transaction, IntegrityError
-from django.db.models import Count
 from django.contrib.auth.models import User
 from rest_framework import (
     mixins,
@@ -13,12 +12,20 @@ from rest_framework import (
 
 from apps.budgets.models import Category, BillCategory
 from apps.users.permissions import IsOwner
-from .models import Bill
+from .models import Bill, ParseJob, PARSE_STATUS_PENDING
+from .pagination import BillsCursorPagination
 from .utils import generate_hash_from_image
 
 
 logger = logging.getLogger(__name__)
 IMAGE_ALREADY_UPLOADED_ERROR = 'This image was already uploaded'
+BULK_UPLOAD_MAX_FILES = 500
+BULK_UPLOAD_MAX_FILE_SIZE = 20 * 1024 * 1024
+# total size of extracted archive members
+BULK_UPLOAD_MAX_ARCHIVE_SIZE = 200 * 1024 * 1024
+BULK_UPLOAD_CHUNK_SIZE = 64 * 1024
+TOO_MANY_FILES_ERROR = \
+    'Not more than %d images can be uploaded at once' % BULK_UPLOAD_MAX_FILES
 
 
 class CreateBillSerializer(
@@ -41,20 +48,32 @@ class CreateBillSerializer(
         """
         Try save serializer or return bill
         if same image was already uploaded
+        Image hash is calculated by upload handler while request
+        is received, so existing bill is found before image
+        is written to disk
         Returns flag, that shows if bill was created
         and bill
         """
         # TODO: move to the Bill model
+        image = self.validated_data['image']
+        sha256_hash_hex = \
+            getattr(image, 'sha256_hash_hex', None) or \
+            generate_hash_from_image(image)
+        bill = Bill.objects.\
+            filter(sha256_hash_hex=sha256_hash_hex).\
+            first()
+        if bill:
+            return (False, bill)
         try:
             with transaction.atomic():
                 return (
-                    True, self.save())
+                    True,
+                    self.save(sha256_hash_hex=sha256_hash_hex))
         except IntegrityError as e:
+            # same image was uploaded concurrently
             logger.debug(
                 'Can not create new bill '
                 'Original error: %s' % str(e))
-            sha256_hash_hex = generate_hash_from_image(
-                self.validated_data['image'])
             return (
                 False, 
                 Bill.objects.get(sha256_hash_hex=sha256_hash_hex))
@@ -67,6 +86,10 @@ class ListBillsSerialiser(
     Shows if bills were categorised
     """
     image = serializers.SerializerMethodField()
+    # annotated by list queryset
+    has_categories = serializers.BooleanField(
+        source='is_categorised',
+        read_only=True)
 
     def get_image(self, obj):
         # Remove standart drf behaviour of generating
@@ -95,7 +118,12 @@ class ListUploadUniqueBillAPI(
         Problems with upload:
             - status code: 400
     GET:
-        List bills for current user
+        List bills for current user ordered by upload time
+        Query params:
+            - uncategorised: list only bills without categories
+            - limit: number of bills on the page.
+              All bills are listed if limit is not passed
+            - cursor: page cursor from url of the next page
         Successfull response:
             - status code: 200
             - format: [
@@ -105,9 +133,14 @@ class ListUploadUniqueBillAPI(
                    'has_categories': [true if bill was categorised]
                 }
             ]
+            - format with limit: {
+                'next': [url of the next page or null],
+                'results': [list of bills in the same format]
+            }
     """
     permission_classes = (
         permissions.IsAuthenticated, )
+    pagination_class = BillsCursorPagination
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -123,14 +156,14 @@ class ListUploadUniqueBillAPI(
         """
         user = self.request.user
         qs = Bill.objects.\
-            prefetch_related('categories').\
-            filter(user=user)
+            annotate_is_categorised().\
+            only('id', 'image', 'create_time').\
+            filter(user=user).\
+            order_by('create_time', 'id')
         if self.request.GET.get('uncategorised'):
             # filter out bills
             # with categories
-            qs = qs.\
-                annotate(categories_number=Count('categories')).\
-                filter(categories_number=0)
+            qs = qs.filter(is_categorised=False)
         return qs
 
     def get(self, request, *args, **kwargs):
@@ -141,6 +174,9 @@ class ListUploadUniqueBillAPI(
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         is_created, bill = serializer.save_or_get_existing()
+        if is_created:
+            # parse in background before user opens the bill
+            ParseJob.objects.schedule(bill)
         response_data = {
             'bill': bill.id
         }
@@ -151,6 +187,188 @@ class ListUploadUniqueBillAPI(
             status=result_status)
 
 
+## API endpoint to upload bills in bulk
+
+
+class BulkUploadBillsSerializer(
+        serializers.Serializer):
+    """
+    Validate images passed as list of files
+    or as zip archive
+    """
+    images = serializers.ListField(
+        child=serializers.ImageField(),
+        required=False)
+    archive = serializers.FileField(
+        required=False)
+
+    def validate_archive(self, archive):
+        """
+        Extract images from zip archive
+        Every archive member should be valid image
+        Members are extracted to temporary files, and sizes
+        are checked on extracted data, not only on archive headers
+        """
+        import zipfile
+        import zlib
+        try:
+            archive_file = zipfile.ZipFile(archive)
+        except zipfile.BadZipfile:
+            raise serializers.ValidationError(
+                'Archive is not a zip file')
+        members = [
+            member for member in archive_file.infolist()
+            if not member.filename.endswith('/')
+        ]
+        if len(members) > BULK_UPLOAD_MAX_FILES:
+            raise serializers.ValidationError(
+                TOO_MANY_FILES_ERROR)
+        if sum(member.file_size for member in members) > \
+                BULK_UPLOAD_MAX_ARCHIVE_SIZE:
+            raise serializers.ValidationError(
+                'Archive is too big')
+        images = []
+        image_field = serializers.ImageField()
+        extracted_size = 0
+        for member in members:
+            if member.file_size > BULK_UPLOAD_MAX_FILE_SIZE:
+                raise serializers.ValidationError(
+                    'File %s is too big' % member.filename)
+            try:
+                image = self._extract_member(archive_file, member)
+            except (zipfile.BadZipfile, zlib.error):
+                raise serializers.ValidationError(
+                    'File %s is corrupted' % member.filename)
+            extracted_size += image.size
+            if extracted_size > BULK_UPLOAD_MAX_ARCHIVE_SIZE:
+                raise serializers.ValidationError(
+                    'Archive is too big')
+            try:
+                images.append(
+                    image_field.run_validation(image))
+            except serializers.ValidationError as e:
+                raise serializers.ValidationError(
+                    '%s: %s' % (member.filename, e.detail[0]))
+        return images
+
+    def _extract_member(self, archive_file, member):
+        """
+        Copy archive member to temporary upload file by chunks
+        Fails if member is bigger than declared in its header
+        """
+        import os
+        from django.core.files.uploadedfile import TemporaryUploadedFile
+        image = TemporaryUploadedFile(
+            name=os.path.basename(member.filename),
+            content_type=None,
+            size=0,
+            charset=None)
+        member_file = archive_file.open(member)
+        try:
+            while True:
+                chunk = member_file.read(BULK_UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                image.size += len(chunk)
+                if image.size > member.file_size:
+                    image.close()
+                    raise serializers.ValidationError(
+                        'File %s is bigger than declared' %
+                        member.filename)
+                image.write(chunk)
+        finally:
+            member_file.close()
+        image.seek(0)
+        return image
+
+    def validate(self, data):
+        images = data.get('images', []) + data.get('archive', [])
+        if not images:
+            raise serializers.ValidationError(
+                'No images passed')
+        if len(images) > BULK_UPLOAD_MAX_FILES:
+            raise serializers.ValidationError(
+                TOO_MANY_FILES_ERROR)
+        return {
+            'images': images
+        }
+
+    def save_or_get_existing(self):
+        """
+        Create bills for images that were not uploaded yet
+        Returns list of dictionaries in format:
+        [
+            {
+                'name': [image file name],
+                'bill': [bill id],
+                'created': [true if bill was created]
+            }
+        ]
+        """
+        images = self.validated_data['images']
+        try:
+            bills = Bill.objects.create_unique_in_bulk(
+                self.context['request'].user, images)
+        finally:
+            # temporary files extracted from archive
+            # are not closed with request files
+            for image in images:
+                image.close()
+        return [
+            {
+                'name': image.name,
+                'bill': bill_id,
+                'created': is_created
+            }
+            for image, (is_created, bill_id) in zip(images, bills)
+        ]
+
+
+class BulkUploadBillsAPI(
+        generics.GenericAPIView):
+    """
+    POST:
+        Upload many bills in one request
+        Images can be passed as multiple "images" files
+        or as zip archive in "archive" file
+
+        Successfull response:
+            - status code: 201 if any bill was created, 200 otherwise
+            - format: {
+                'bills': [
+                    {
+                        'name': [image file name],
+                        'bill': [bill id],
+                        'created': [true if bill was created]
+                    }
+                ]
+            }
+
+        Problems with upload:
+            - status code: 400
+    """
+    serializer_class = BulkUploadBillsSerializer
+    permission_classes = (
+        permissions.IsAuthenticated, )
+
+    def post(
+            self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        bills = serializer.save_or_get_existing()
+        # parse in background before user opens the bills
+        ParseJob.objects.schedule_in_bulk(
+            bill['bill'] for bill in bills if bill['created'])
+        result_status = status.HTTP_201_CREATED \
+            if any(bill['created'] for bill in bills) \
+            else status.HTTP_200_OK
+        return response.Response(
+            {
+                'bills': bills
+            },
+            status=result_status)
+
+
 ## API endpoint to retrieve bill
 
 
@@ -165,17 +383,6 @@ class CategorySerialiser(
         read_only=False)
     name = serializers.CharField(read_only=True)
 
-    def validate_id(self, value):
-        """
-        Make sure that id belongs to existing category
-        """
-        if Category.objects.\
-                filter(id=value).\
-                exists() == False:
-            raise serializers.ValidationError(
-                'Non existing categoru')
-        return value
-
     class Meta:
         model = Category
         fields = ('name', 'id')
@@ -212,17 +419,32 @@ class RetrieveUpdateBillSerializer(
         # Full urls
         return obj.image.url
 
+    def validate_categories(self, value):
+        """
+        Make sure that all categories exist
+        Found categories are reused on update
+        """
+        self.categories_by_id = Bill.get_categories_by_id(value)
+        missing_ids = set(
+            category['category']['id'] for category in value) - \
+            set(self.categories_by_id)
+        if missing_ids:
+            raise serializers.ValidationError(
+                'Non existing categories: %s' % ', '.join(
+                    str(category_id)
+                    for category_id in sorted(missing_ids)))
+        return value
+
     @transaction.atomic
     def update(
             self, instance, validated_data):
         """
         Update categories, linked to bill
-        Rewrites all the categories by deleting previous categories links
-        and creating brand new ones
+        Only changed categories links are written
         """
-        instance.categories.clear()
-        instance.create_categories_in_bulk(
-            validated_data['bill_to_category'])
+        instance.update_categories_in_bulk(
+            validated_data['bill_to_category'],
+            categories_by_id=getattr(self, 'categories_by_id', None))
         return instance
 
     class Meta:
@@ -266,4 +488,58 @@ class RetrieveUpdateBillAPI(
     serializer_class = RetrieveUpdateBillSerializer
     permission_classes = (
         permissions.IsAuthenticated, 
-        IsOwner)
\ No newline at end of file
+        IsOwner)
+
+## API endpoint to poll background parsing
+
+
+class BillParseStatusAPI(
+        generics.GenericAPIView):
+    """
+    GET:
+    Retrieve status of background bill parsing
+    Schedules parsing if bill was not parsed yet
+    Successfull response:
+        - status code: 200
+        - format: {
+            'bill': [bill id],
+            'status': [pending, done or failed],
+            'error': [parsing error or None]
+        }
+        Failed bills are not parsed again
+        until parser is updated
+
+    POST:
+    Schedule parsing of the bill again
+    Successfull response:
+        - status code: 202
+        - format: same as GET response
+    """
+    lookup_url_kwarg = 'bill_id'
+    queryset = Bill.objects.all()
+    permission_classes = (
+        permissions.IsAuthenticated,
+        IsOwner)
+
+    def post(self, request, *args, **kwargs):
+        bill = self.get_object()
+        bill.request_reparse()
+        return response.Response(
+            {
+                'bill': bill.id,
+                'status': PARSE_STATUS_PENDING,
+                'error': None
+            },
+            status=status.HTTP_202_ACCEPTED)
+
+    def get(self, request, *args, **kwargs):
+        bill = self.get_object()
+        parse_status, _, parse_error = \
+            bill.get_parse_status()
+        return response.Response(
+            {
+                'bill': bill.id,
+                'status': parse_status,
+                'error': parse_error
+            },
+            status=status.HTTP_200_OK)
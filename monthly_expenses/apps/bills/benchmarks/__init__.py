@@ -0,0 +1,64 @@
+"""
+Corpus of bills texts for parsers benchmarks
+
+Texts are stored in versioned directories: corpus/v1/*.txt
+Existing versions should not be changed,
+so results of benchmarks are comparable.
+New texts are added in new version of the corpus,
+which includes texts of previous version named in its "base" file
+
+Throughput of parsers depends on the machine, so it is compared
+relative to throughput of reference workload measured in the same run
+"""
+import io
+import os
+import re
+
+
+CORPUS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'corpus')
+CORPUS_VERSION = 'v2'
+BASELINES_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+
+def load_corpus(version=None):
+    """
+    Load bills texts of corpus version
+    and texts of versions it is based on
+    Returns list of tuples (name, text) ordered by name
+    """
+    corpus_dir = os.path.join(
+        CORPUS_DIR, version or CORPUS_VERSION)
+    texts = {}
+    base_path = os.path.join(corpus_dir, 'base')
+    if os.path.isfile(base_path):
+        with open(base_path) as base_file:
+            texts.update(load_corpus(base_file.read().strip()))
+    for file_name in os.listdir(corpus_dir):
+        name, extension = os.path.splitext(file_name)
+        if extension != '.txt':
+            continue
+        with io.open(
+                os.path.join(corpus_dir, file_name),
+                encoding='utf-8') as text_file:
+            texts[name] = text_file.read()
+    return sorted(texts.items())
+
+
+REFERENCE_LINE_RE = re.compile(
+    r'^(?P<name>.*?)\s+(?P<amount>-?\d+[.,]\d{2})\s*$')
+
+
+def run_reference_workload(texts):
+    """
+    Parser-like work which does not depend on parsers code:
+    every line is split and matched with item regex.
+    Its throughput is measured on the same machine as parsers
+    """
+    items = 0
+    for text in texts:
+        for line in text.splitlines():
+            if REFERENCE_LINE_RE.match(line.strip().upper()):
+                items += 1
+    return items
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Generator of synthetic finnish bills texts
+
+Generated texts are saved to the corpus,
+so changes of the generator do not change existing corpus versions
+"""
+import io
+import os
+import random
+
+from django.utils.six import text_type
+
+
+PRODUCTS = [
+    'MAITO', 'RUISLEIPA', 'VOI', 'KANANMUNA', 'BANAANI', 'OMENA',
+    'TOMAATTI', 'KURKKU', 'JAUHELIHA', 'KANAN FILEE', 'LOHIFILEE',
+    'PASTA', 'RIISI', 'KAHVI', 'TEE', 'MEHU', 'JUUSTO', 'JOGURTTI',
+    'KAURAPUURO', 'PESUAINE', 'SUKLAA', 'PERUNA', 'SIPULI', 'PORKKANA',
+]
+SIZES = ['1L', '500G', '1KG', '400G', '10KPL', '200G', '']
+NOISE = '~-_|!il1:;.,\'"`^*'
+
+
+def generate_bill(
+        seed, items_number, noise_ratio=0.0,
+        with_total=True, with_date=True):
+    """
+    Generate text of finnish bill with given number of items.
+    Part of lines defined by noise_ratio is replaced
+    by OCR noise
+    """
+    generator = random.Random(seed)
+    lines = [
+        'K-MARKET TESTI %d' % generator.randint(1, 999),
+        'Kauppias Oy, Y-tunnus %07d-%d' % (
+            generator.randint(0, 9999999), generator.randint(0, 9)),
+        'Puh. 0%d %07d' % (
+            generator.randint(10, 99), generator.randint(0, 9999999)),
+        '',
+    ]
+    if with_date:
+        lines.append(
+            'KASSA %d  %02d.%02d.%d %02d:%02d' % (
+                generator.randint(1, 20),
+                generator.randint(1, 28), generator.randint(1, 12),
+                generator.randint(2016, 2018),
+                generator.randint(7, 22), generator.randint(0, 59)))
+    total = 0
+    for _ in range(items_number):
+        name = ('%s %s' % (
+            generator.choice(PRODUCTS), generator.choice(SIZES))).strip()
+        kind = generator.random()
+        if kind < 0.7:
+            amount = generator.randint(10, 2000) / 100.0
+            lines.append('%-32s%8.2f' % (name, amount))
+        elif kind < 0.85:
+            quantity = generator.randint(2, 6)
+            price = generator.randint(10, 500) / 100.0
+            amount = quantity * price
+            lines.append('%-32s%8.2f' % (name, amount))
+            lines.append(
+                '    %d KPL      %.2f EUR/KPL' % (quantity, price))
+        else:
+            weight = generator.randint(100, 2000) / 1000.0
+            price = generator.randint(100, 1500) / 100.0
+            amount = weight * price
+            lines.append('%-32s%8.2f' % (name, amount))
+            lines.append(
+                '    %.3f KG   %.2f EUR/KG' % (weight, price))
+        total += amount
+        if generator.random() < noise_ratio:
+            lines.append(''.join(
+                generator.choice(NOISE)
+                for _ in range(generator.randint(3, 40))))
+    lines.append('-' * 40)
+    if with_total:
+        lines.append('%-32s%8.2f' % ('YHTEENSA', total))
+    lines.extend([
+        'KORTTITAPAHTUMA',
+        'Kortti:                   Mastercard',
+        'Veloitus                      %.2f EUR' % total,
+        'ALV      Veroton      Vero    Verollinen',
+        '14%%       %.2f       %.2f     %.2f' % (
+            total / 1.14, total - total / 1.14, total),
+        'Kiitos kaynnista!',
+    ])
+    return '\n'.join(lines) + '\n'
+
+
+SYNTHETIC_BILLS = [
+    # name, seed, items number, noise ratio, with total, with date
+    ('synthetic_long', 1, 200, 0.0, True, True),
+    ('synthetic_noisy', 2, 30, 0.5, True, True),
+    ('synthetic_no_total', 3, 20, 0.1, False, True),
+    ('synthetic_no_date', 4, 15, 0.1, True, False),
+]
+
+
+def write_synthetic_corpus(corpus_dir):
+    """
+    Save synthetic bills texts to corpus directory
+    """
+    for name, seed, items_number, noise_ratio, with_total, with_date \
+            in SYNTHETIC_BILLS:
+        text = generate_bill(
+            seed, items_number, noise_ratio, with_total, with_date)
+        with io.open(
+                os.path.join(corpus_dir, name + '.txt'),
+                'w', encoding='utf-8') as text_file:
+            text_file.write(text_type(text))
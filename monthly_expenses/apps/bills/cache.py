@@ -0,0 +1,74 @@
+"""
+Cache of OCR and parsing results shared between bills
+
+OCR text is stored under sha256 hash of the image.
+Parsed data is stored under hash of the image, parser name
+and parser version, so parser changes do not return stale results.
+Cache size is bounded by cache backend (see BILLS_CACHE setting)
+"""
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+OCR_TEXT_KEY = 'bills:ocr:%s'
+PARSED_DATA_KEY = 'bills:parsed:%s:%s'
+
+
+def get_cache():
+    return caches[settings.BILLS_CACHE]
+
+
+def get_ocr_text_key(sha256_hash_hex):
+    return OCR_TEXT_KEY % sha256_hash_hex
+
+
+def get_parsed_data_key(sha256_hash_hex, parser):
+    return PARSED_DATA_KEY % (
+        sha256_hash_hex, parser.get_version())
+
+
+def get_ocr_text(sha256_hash_hex):
+    """
+    Returns cached OCR text of the image or None
+    """
+    return get_cache().get(
+        get_ocr_text_key(sha256_hash_hex))
+
+
+def get_ocr_texts(hashes):
+    """
+    Returns dictionary of cached OCR texts by images hashes.
+    Images without cached text are not included
+    """
+    cached_texts = get_cache().get_many(
+        [get_ocr_text_key(sha256_hash_hex) for sha256_hash_hex in hashes])
+    return {
+        sha256_hash_hex: cached_texts[get_ocr_text_key(sha256_hash_hex)]
+        for sha256_hash_hex in hashes
+        if get_ocr_text_key(sha256_hash_hex) in cached_texts
+    }
+
+
+def set_ocr_text(sha256_hash_hex, bill_text):
+    get_cache().set(
+        get_ocr_text_key(sha256_hash_hex), bill_text, None)
+
+
+def get_parsed_data(sha256_hash_hex, parser):
+    """
+    Returns data parsed from the image by given parser or None
+    """
+    parsed_data = get_cache().get(
+        get_parsed_data_key(sha256_hash_hex, parser))
+    if parsed_data is None:
+        return None
+    return json.loads(parsed_data)
+
+
+def set_parsed_data(sha256_hash_hex, parser, parsed_data):
+    get_cache().set(
+        get_parsed_data_key(sha256_hash_hex, parser),
+        json.dumps(parsed_data),
+        None)
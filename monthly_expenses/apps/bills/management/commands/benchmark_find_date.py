@@ -0,0 +1,63 @@
+"""
+Compare bill date search by known date formats
+and by dateutil only
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.bills.benchmarks import load_corpus
+from apps.bills.parsers import load_parser
+
+
+class Command(BaseCommand):
+    help = 'Measure time of bill date search on bills texts corpus'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--parser',
+            default='fi_parser',
+            help='Name of the parser')
+        parser.add_argument(
+            '--corpus',
+            default=None,
+            help='Version of bills texts corpus. Defaults to latest')
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=100,
+            help='Number of times every text is processed')
+
+    def handle(self, *args, **options):
+        bill_parser = load_parser(options['parser'])
+        bills_words = [
+            text.split() for _, text in load_corpus(options['corpus'])
+        ]
+        self._report(
+            'known formats with dateutil fallback',
+            len(bills_words) * options['repeat'],
+            self._measure(
+                bill_parser._find_date,
+                bills_words, options['repeat']))
+        self._report(
+            'dateutil only',
+            len(bills_words) * options['repeat'],
+            self._measure(
+                bill_parser._find_date_by_dateutil,
+                bills_words, options['repeat']))
+
+    def _measure(self, find_date, bills_words, repeat):
+        start = time.time()
+        for _ in range(repeat):
+            for bill_words in bills_words:
+                try:
+                    find_date(bill_words)
+                except ValueError:
+                    pass
+        return time.time() - start
+
+    def _report(self, name, bills_number, duration):
+        self.stdout.write(
+            '%s: %d bills in %.2fs, %.2f bills/s' % (
+                name, bills_number, duration,
+                bills_number / duration))
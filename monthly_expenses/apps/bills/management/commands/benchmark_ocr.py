@@ -0,0 +1,106 @@
+"""
+Compare OCR throughput of tesseract process per image,
+single persistent OCR engine and pool of persistent OCR engines
+
+Engine cost is measured by sequential runs of both engines
+and pool scaling by comparing the pool with sequential
+persistent engine
+"""
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.bills import ocr
+from apps.bills.ocr import OCRPool, PersistentEngine, SubprocessEngine
+from apps.bills.preprocessing import open_image
+
+
+class Command(BaseCommand):
+    help = 'Measure OCR throughput in images per second'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'images',
+            nargs='*',
+            help='Images to recognize. Defaults to test check image')
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Number of times every image is recognized')
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=None,
+            help='Number of OCR processes. Defaults to number of CPUs')
+
+    def handle(self, *args, **options):
+        tmp_dir = None
+        image_paths = options['images']
+        if not image_paths:
+            tmp_dir = tempfile.mkdtemp()
+            image_paths = [self._write_test_image(tmp_dir)]
+        image_paths = image_paths * options['repeat']
+        try:
+            self._report(
+                'tesseract process per image',
+                len(image_paths),
+                self._run_engine(SubprocessEngine(), image_paths))
+            sequential_duration = None
+            if ocr.tesserocr is not None:
+                engine = PersistentEngine()
+                # warm up engine as pool engines are warmed up
+                engine.image_to_text(open_image(image_paths[0]))
+                sequential_duration = self._run_engine(
+                    engine, image_paths)
+                self._report(
+                    'single persistent engine',
+                    len(image_paths),
+                    sequential_duration)
+            else:
+                self.stdout.write(
+                    'tesserocr is not installed. '
+                    'Pool uses tesseract process per image')
+            with OCRPool(options['processes']) as pool:
+                # warm up engines: language data is loaded once
+                # per process and is not part of steady throughput
+                pool.images_to_text(image_paths[:pool.processes])
+                pool_duration = self._run_pool(pool, image_paths)
+                self._report(
+                    'pool of %d persistent engines' % pool.processes,
+                    len(image_paths),
+                    pool_duration)
+            if sequential_duration:
+                self.stdout.write(
+                    'pool speedup over single persistent engine: '
+                    '%.2fx' % (sequential_duration / pool_duration))
+        finally:
+            if tmp_dir:
+                shutil.rmtree(tmp_dir)
+
+    def _write_test_image(self, tmp_dir):
+        from apps.bills.tests.check_image import CHECK_IMAGE
+        image_path = os.path.join(tmp_dir, 'check.jpg')
+        with open(image_path, 'wb') as image_file:
+            image_file.write(CHECK_IMAGE)
+        return image_path
+
+    def _run_engine(self, engine, image_paths):
+        start = time.time()
+        for image_path in image_paths:
+            engine.image_to_text(open_image(image_path))
+        return time.time() - start
+
+    def _run_pool(self, pool, image_paths):
+        start = time.time()
+        pool.images_to_text(image_paths)
+        return time.time() - start
+
+    def _report(self, name, images_number, duration):
+        self.stdout.write(
+            '%s: %d images in %.2fs, %.2f images/s' % (
+                name, images_number, duration,
+                images_number / duration))
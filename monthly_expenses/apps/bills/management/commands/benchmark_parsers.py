@@ -0,0 +1,176 @@
+"""
+Measure throughput of bills parsers on bills texts corpus
+and compare it with stored baselines
+
+Absolute throughput depends on the machine,
+so parsers are compared with reference workload measured
+in the same run. Fails if relative throughput of any parser
+is lower than baseline by more than threshold
+"""
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.bills.benchmarks import (
+    BASELINES_PATH, CORPUS_VERSION, load_corpus, run_reference_workload)
+from apps.bills.parsers import get_parsers_names, load_parser
+
+
+class Command(BaseCommand):
+    help = 'Measure lines/s and bills/s of bills parsers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--parser',
+            action='append',
+            dest='parsers',
+            help='Name of the parser. Defaults to all parsers')
+        parser.add_argument(
+            '--corpus',
+            default=CORPUS_VERSION,
+            help='Version of bills texts corpus. Defaults to latest')
+        parser.add_argument(
+            '--rounds',
+            type=int,
+            default=11,
+            help='Number of measurements. Median relative throughput '
+                 'is compared with baseline')
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=10,
+            help='Number of times corpus is parsed in every round')
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.2,
+            help='Allowed relative throughput decrease '
+                 'comparing to baseline')
+        parser.add_argument(
+            '--baselines',
+            default=BASELINES_PATH,
+            help='File with stored baselines')
+        parser.add_argument(
+            '--save-baselines',
+            action='store_true',
+            help='Save measured throughput as new baselines')
+
+    def handle(self, *args, **options):
+        corpus = load_corpus(options['corpus'])
+        baselines = self._load_baselines(options['baselines'])
+        corpus_baselines = baselines.setdefault(options['corpus'], {})
+        texts = [text for _, text in corpus]
+        regressions = []
+        for name in options['parsers'] or get_parsers_names():
+            result = self._measure(
+                load_parser(name), texts,
+                options['rounds'], options['repeat'])
+            baseline = corpus_baselines.get(name)
+            self._report(name, result, baseline)
+            if baseline and self._is_regression(
+                    result, baseline, options['threshold']):
+                regressions.append(name)
+            if options['save_baselines']:
+                corpus_baselines[name] = result
+        if options['save_baselines']:
+            self._save_baselines(options['baselines'], baselines)
+        if regressions:
+            raise CommandError(
+                'Throughput of parsers %s is more than %d%% '
+                'lower than baseline' % (
+                    ', '.join(regressions),
+                    options['threshold'] * 100))
+
+    def _measure(self, bill_parser, texts, rounds, repeat):
+        """
+        Parse all corpus texts repeat times in every round.
+        Bills that can not be parsed are counted too:
+        failure is result of the parser
+
+        Reference workload is run right before the parser
+        in every round, so both are slowed down by the same load
+        of the machine. relative_throughput is median over rounds
+        of reference duration divided by parser duration,
+        higher is faster. Only relative throughput is compared
+        with baseline, bills/s and lines/s are of the fastest round
+        """
+        def parse_texts(texts):
+            for text in texts:
+                try:
+                    bill_parser.get_datetime_and_spendings_from_bill(text)
+                except ValueError:
+                    pass
+
+        ratios = []
+        duration = None
+        for _ in range(rounds):
+            reference_duration = self._measure_duration(
+                run_reference_workload, texts, repeat)
+            round_duration = self._measure_duration(
+                parse_texts, texts, repeat)
+            ratios.append(reference_duration / round_duration)
+            if duration is None or round_duration < duration:
+                duration = round_duration
+        ratios.sort()
+        lines_number = sum(len(text.splitlines()) for text in texts)
+        return {
+            'relative_throughput': round(
+                ratios[len(ratios) // 2], 3),
+            'bills_per_second': round(
+                len(texts) * repeat / duration, 1),
+            'lines_per_second': round(
+                lines_number * repeat / duration, 1),
+        }
+
+    def _measure_duration(self, workload, texts, repeat):
+        """
+        Returns duration of running workload on texts repeat times
+        """
+        start = time.time()
+        for _ in range(repeat):
+            workload(texts)
+        return time.time() - start
+
+    def _is_regression(self, result, baseline, threshold):
+        return result['relative_throughput'] < \
+            baseline['relative_throughput'] * (1 - threshold)
+
+    def _report(self, name, result, baseline):
+        message = '%s: %.3f of reference, %.1f bills/s, %.1f lines/s' % (
+            name,
+            result['relative_throughput'],
+            result['bills_per_second'],
+            result['lines_per_second'])
+        if baseline:
+            message += ' (baseline: %.3f of reference)' % (
+                baseline['relative_throughput'])
+        self.stdout.write(message)
+
+    def _load_baselines(self, baselines_path):
+        """
+        bills/s and lines/s are stored only for information,
+        they are not comparable between machines
+        Returns dictionary with format:
+        {
+            [corpus version]: {
+                [parser name]: {
+                    'relative_throughput': [float],
+                    'bills_per_second': [float],
+                    'lines_per_second': [float]
+                }
+            }
+        }
+        """
+        try:
+            with open(baselines_path) as baselines_file:
+                return json.load(baselines_file)
+        except IOError:
+            return {}
+
+    def _save_baselines(self, baselines_path, baselines):
+        with open(baselines_path, 'w') as baselines_file:
+            json.dump(
+                baselines, baselines_file,
+                indent=4, sort_keys=True, separators=(',', ': '))
+            baselines_file.write('\n')
@@ -0,0 +1,105 @@
+"""
+Measure time and memory of every bills images preprocessing stage
+"""
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from apps.bills import preprocessing
+
+
+class Command(BaseCommand):
+    help = 'Measure time and RSS of bills images preprocessing stages'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'images',
+            nargs='*',
+            help='Images to preprocess. Defaults to test check image')
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=10,
+            help='Number of times every image is preprocessed')
+
+    def handle(self, *args, **options):
+        tmp_dir = None
+        image_paths = options['images']
+        if not image_paths:
+            tmp_dir = tempfile.mkdtemp()
+            image_paths = [self._write_test_image(tmp_dir)]
+        try:
+            for image_path in image_paths:
+                self._benchmark_image(
+                    image_path, options['repeat'])
+        finally:
+            if tmp_dir:
+                shutil.rmtree(tmp_dir)
+
+    def _write_test_image(self, tmp_dir):
+        from apps.bills.tests.check_image import CHECK_IMAGE
+        image_path = os.path.join(tmp_dir, 'check.jpg')
+        with open(image_path, 'wb') as image_file:
+            image_file.write(CHECK_IMAGE)
+        return image_path
+
+    def _benchmark_image(self, image_path, repeat):
+        config = settings.OCR_PREPROCESSING
+        self.stdout.write(image_path)
+        self._measure(
+            'full resolution decode',
+            repeat,
+            lambda: self._decode_full_resolution(image_path))
+        image = self._measure(
+            'decode',
+            repeat,
+            lambda: preprocessing.decode(image_path, config))
+        for stage in preprocessing.STAGES:
+            image = self._measure(
+                stage.__name__,
+                repeat,
+                lambda: stage(image, config))
+
+    def _decode_full_resolution(self, image_path):
+        image = Image.open(image_path)
+        image.load()
+        return image
+
+    def _measure(self, name, repeat, stage):
+        """
+        Run stage repeat times and report average time,
+        size of resulting image and RSS of the process
+        """
+        start = time.time()
+        for _ in range(repeat):
+            image = stage()
+        duration = (time.time() - start) / repeat
+        width, height = image.size
+        self.stdout.write(
+            '  %-24s %8.2fms  %5dx%-5d %-3s '
+            'rss %.1fMB  max rss %.1fMB' % (
+                name, duration * 1000,
+                width, height, image.mode,
+                self._get_rss_kb() / 1024.0,
+                resource.getrusage(
+                    resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+        return image
+
+    def _get_rss_kb(self):
+        """
+        Current RSS of the process in KB.
+        Falls back to max RSS if /proc is not available
+        """
+        try:
+            with open('/proc/self/statm') as statm:
+                pages = int(statm.read().split()[1])
+            return pages * resource.getpagesize() / 1024.0
+        except (IOError, IndexError, ValueError):
+            return resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss
@@ -0,0 +1,20 @@
+"""
+Show how often bills are parsed before users view them
+"""
+from django.core.management.base import BaseCommand
+
+from apps.bills.models import ParseJob
+
+
+class Command(BaseCommand):
+    help = (
+        'Show number of bills parsed (hits) and not parsed yet (misses) '
+        'when users viewed their spendings first time')
+
+    def handle(self, *args, **options):
+        stats = ParseJob.objects.get_first_view_stats()
+        views = stats['hits'] + stats['misses']
+        self.stdout.write(
+            'first views: %d, hits: %d, misses: %d, hit rate: %.1f%%' % (
+                views, stats['hits'], stats['misses'],
+                100.0 * stats['hits'] / views if views else 0))
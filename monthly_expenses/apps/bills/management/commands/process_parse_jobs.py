@@ -0,0 +1,101 @@
+"""
+Worker that parses bills scheduled for background parsing
+"""
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.bills import cache
+from apps.bills.models import ParseJob
+from apps.bills.ocr import OCRPool
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Process background bill parsing jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=None,
+            help=(
+                'Number of OCR processes. Defaults to number of CPUs. '
+                'Use 0 to run OCR in worker process'))
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help=(
+                'Number of jobs acquired at once. '
+                'Defaults to number of OCR processes'))
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when queue is empty')
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit when queue is empty')
+
+    def handle(self, *args, **options):
+        pool = None
+        if options['processes'] != 0:
+            pool = OCRPool(options['processes'])
+        batch_size = options['batch_size'] or \
+            (pool.processes if pool else 1)
+        try:
+            while True:
+                jobs = ParseJob.objects.acquire(batch_size)
+                if not jobs:
+                    if options['once']:
+                        return
+                    time.sleep(options['sleep'])
+                    continue
+                self._process_jobs(jobs, pool)
+        finally:
+            if pool:
+                pool.close()
+
+    def _process_jobs(self, jobs, pool):
+        """
+        Extract text from bills images in OCR pool
+        and parse it in worker process
+        """
+        if pool is None:
+            for job in jobs:
+                job.run()
+            return
+        # images that were already recognized are not sent to OCR
+        cached_texts = cache.get_ocr_texts(
+            [job.bill.sha256_hash_hex for job in jobs])
+        ocr_jobs = [
+            job for job in jobs
+            if job.bill.ocr_text is None and
+            job.bill.sha256_hash_hex not in cached_texts
+        ]
+        results = pool.images_to_text(
+            [job.bill.image_path for job in ocr_jobs])
+        for job, (bill_text, error) in zip(ocr_jobs, results):
+            if not error:
+                cache.set_ocr_text(
+                    job.bill.sha256_hash_hex, bill_text)
+        results = dict(zip(ocr_jobs, results))
+        for job in jobs:
+            bill_text, error = results.get(
+                job,
+                (cached_texts.get(job.bill.sha256_hash_hex), None))
+            if error:
+                # failure is saved as parsing failure of the bill,
+                # so image is not sent to OCR again
+                job.bill.save_parse_error(error)
+                job.fail(error)
+            else:
+                job.run(bill_text=bill_text)
+            logger.debug(
+                'Processed parse job for bill %d. Status: %s' % (
+                    job.bill_id, job.status))
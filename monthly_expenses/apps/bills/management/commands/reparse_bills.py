@@ -0,0 +1,155 @@
+"""
+Reparse bills parsed by older parser version
+
+Bills are processed in chunks ordered by id in pool of processes.
+Id of the last processed bill is saved to checkpoint file,
+so interrupted run continues from the last processed chunk
+"""
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.bills import models
+from apps.bills.models import Bill
+
+
+logger = logging.getLogger(__name__)
+
+
+def _close_connection():
+    # database connection inherited from parent process
+    # can not be shared between processes
+    connection.close()
+
+
+def reparse_chunk(bill_ids):
+    """
+    Reparse bills with passed ids.
+    OCR is run only for bills without stored OCR text
+
+    Returns tuple of number of parsed and failed bills
+    """
+    parsed, failed = 0, 0
+    for bill in Bill.objects.filter(id__in=bill_ids).order_by('id'):
+        try:
+            bill.parse_bill(reparse=True)
+        except ValueError as e:
+            logger.debug(
+                'Bill %d can not be reparsed: %s' % (bill.id, e))
+            failed += 1
+        except Exception:
+            # missing image or OCR error should not stop the run
+            logger.exception(
+                'Unexpected error while reparsing bill %d' % bill.id)
+            failed += 1
+        else:
+            parsed += 1
+    return parsed, failed
+
+
+class Command(BaseCommand):
+    help = 'Reparse bills parsed by older parser version'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=None,
+            help=(
+                'Number of processes. Defaults to number of CPUs. '
+                'Use 0 to reparse bills in command process'))
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100,
+            help='Number of bills reparsed by process at once')
+        parser.add_argument(
+            '--checkpoint',
+            default=None,
+            help=(
+                'File with progress of the run. '
+                'Defaults to file in temporary directory '
+                'named by parser version'))
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore progress of previous run')
+
+    def handle(self, *args, **options):
+        checkpoint_path = options['checkpoint'] or os.path.join(
+            tempfile.gettempdir(),
+            'reparse_bills_%s.json' % (
+                models.parser.get_version().replace(':', '_')))
+        last_id = 0
+        if not options['restart']:
+            last_id = self._load_checkpoint(checkpoint_path)
+        bill_ids = list(
+            Bill.objects.stale().\
+                filter(id__gt=last_id).\
+                order_by('id').\
+                values_list('id', flat=True))
+        chunk_size = options['chunk_size']
+        chunks = [
+            bill_ids[index:index + chunk_size]
+            for index in range(0, len(bill_ids), chunk_size)
+        ]
+        self.stdout.write(
+            'Reparsing %d bills by %s starting after bill %d' % (
+                len(bill_ids), models.parser.get_version(), last_id))
+        pool = None
+        if options['processes'] != 0:
+            pool = multiprocessing.Pool(
+                options['processes'], initializer=_close_connection)
+            # connection should not be inherited by forked processes
+            connection.close()
+        parsed, failed = 0, 0
+        start = time.time()
+        try:
+            results = pool.imap(reparse_chunk, chunks) if pool \
+                else (reparse_chunk(chunk) for chunk in chunks)
+            # results are returned in order of chunks,
+            # so all bills before checkpoint are processed
+            for chunk, (chunk_parsed, chunk_failed) in zip(chunks, results):
+                parsed += chunk_parsed
+                failed += chunk_failed
+                self._save_checkpoint(checkpoint_path, chunk[-1])
+                self._report(parsed, failed, time.time() - start)
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.stdout.write('Done')
+        self._report(parsed, failed, time.time() - start)
+
+    def _load_checkpoint(self, checkpoint_path):
+        """
+        Returns id of the last processed bill or 0
+        """
+        try:
+            with open(checkpoint_path) as checkpoint_file:
+                return json.load(checkpoint_file)['last_id']
+        except (IOError, ValueError, KeyError):
+            return 0
+
+    def _save_checkpoint(self, checkpoint_path, last_id):
+        # file is replaced atomically
+        # so interrupted write does not lose progress
+        tmp_path = checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as checkpoint_file:
+            json.dump({'last_id': last_id}, checkpoint_file)
+        os.rename(tmp_path, checkpoint_path)
+
+    def _report(self, parsed, failed, duration):
+        processed = parsed + failed
+        self.stdout.write(
+            '%d bills reparsed, %d failed in %.2fs, %.2f bills/s' % (
+                parsed, failed, duration,
+                processed / duration if duration else 0))
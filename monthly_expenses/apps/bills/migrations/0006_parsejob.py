@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-17 12:15
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bills', '0005_bill_categories'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParseJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[(b'pending', b'Pending'), (b'processing', b'Processing'), (b'done', b'Done'), (b'failed', b'Failed')], db_index=True, default=b'pending', max_length=16)),
+                ('error', models.TextField(blank=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('update_time', models.DateTimeField(auto_now=True)),
+                ('bill', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='parse_job', to='bills.Bill')),
+            ],
+        ),
+    ]
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-17 12:20
+from __future__ import unicode_literals
+
+import apps.bills.storage
+from django.db import migrations, models
+
+
+# bill id -> image name before migration,
+# stored in storage to restore old names on reverse
+MOVED_IMAGES_MANIFEST = 'media/content-addressed-moves.json'
+
+
+def _copy_image(old_path, new_path):
+    """
+    Link or copy image, old image is kept
+    until migration is commited
+    """
+    import os
+    import shutil
+    if os.path.isfile(new_path):
+        # same content is already stored
+        return
+    if not os.path.isdir(os.path.dirname(new_path)):
+        os.makedirs(os.path.dirname(new_path))
+    try:
+        os.link(old_path, new_path)
+    except OSError:
+        shutil.copy2(old_path, new_path)
+
+
+def _load_moved_images(storage):
+    import json
+    if not storage.exists(MOVED_IMAGES_MANIFEST):
+        return {}
+    with open(storage.path(MOVED_IMAGES_MANIFEST)) as manifest:
+        return json.load(manifest)
+
+
+def _save_moved_images(storage, moved_images):
+    import json
+    import os
+    path = storage.path(MOVED_IMAGES_MANIFEST)
+    if not moved_images:
+        if os.path.isfile(path):
+            os.remove(path)
+        return
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as manifest:
+        json.dump(moved_images, manifest, indent=4, sort_keys=True)
+
+
+def _finish_on_commit(schema_editor, storage, moved_images, paths):
+    """
+    Manifest is saved and files are removed
+    only when database changes are commited,
+    so failed migration leaves images in place
+    """
+    import os
+
+    def finish():
+        _save_moved_images(storage, moved_images)
+        for path in paths:
+            if os.path.isfile(path):
+                os.remove(path)
+    schema_editor.connection.on_commit(finish)
+
+
+def move_images_to_content_addressed_paths(apps, schema_editor):
+    """
+    Move images from flat media directory
+    to sharded content addressed paths
+
+    Images are copied first, old images are removed
+    after migration is commited.
+    Bill with the same content as other bill is pointed
+    to the existing image and its hash is not set,
+    as hash is unique
+    """
+    import os
+    from apps.bills.storage import (
+        bill_images_storage, get_content_addressed_name)
+    from apps.bills.utils import generate_hash_from_image
+    Bill = apps.get_model('bills', 'Bill')
+    moved_images = _load_moved_images(bill_images_storage)
+    old_paths = set()
+    for bill in Bill.objects.only(
+            'id', 'image', 'sha256_hash_hex').iterator():
+        old_path = bill_images_storage.path(bill.image.name)
+        if not os.path.isfile(old_path):
+            continue
+        sha256_hash_hex = bill.sha256_hash_hex
+        if not sha256_hash_hex:
+            with open(old_path, 'rb') as image_file:
+                sha256_hash_hex = generate_hash_from_image(image_file)
+        name = get_content_addressed_name(
+            sha256_hash_hex, bill.image.name)
+        if name == bill.image.name:
+            continue
+        new_path = bill_images_storage.path(name)
+        _copy_image(old_path, new_path)
+        fields = {'image': name}
+        if not bill.sha256_hash_hex and not Bill.objects.\
+                filter(sha256_hash_hex=sha256_hash_hex).exists():
+            fields['sha256_hash_hex'] = sha256_hash_hex
+        Bill.objects.filter(id=bill.id).update(**fields)
+        moved_images[str(bill.id)] = bill.image.name
+        old_paths.add(old_path)
+    _finish_on_commit(
+        schema_editor, bill_images_storage, moved_images, old_paths)
+
+
+def restore_images_old_paths(apps, schema_editor):
+    """
+    Copy images back to names they had before migration
+    Content addressed images are removed after migration
+    is commited if no bill is pointed to them
+    """
+    import os
+    from apps.bills.storage import bill_images_storage
+    Bill = apps.get_model('bills', 'Bill')
+    moved_images = _load_moved_images(bill_images_storage)
+    bills = Bill.objects.\
+        filter(id__in=[int(bill_id) for bill_id in moved_images]).\
+        only('id', 'image')
+    new_names = set()
+    for bill in bills.iterator():
+        old_name = moved_images.pop(str(bill.id))
+        new_path = bill_images_storage.path(bill.image.name)
+        if not os.path.isfile(new_path):
+            continue
+        _copy_image(new_path, bill_images_storage.path(old_name))
+        Bill.objects.filter(id=bill.id).update(image=old_name)
+        new_names.add(bill.image.name)
+    used_names = set(
+        Bill.objects.\
+            filter(image__in=new_names).\
+            values_list('image', flat=True))
+    # names of deleted bills are not needed
+    _finish_on_commit(
+        schema_editor, bill_images_storage, {},
+        [
+            bill_images_storage.path(name)
+            for name in new_names - used_names
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bills', '0006_parsejob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bill',
+            name='image',
+            field=models.ImageField(storage=apps.bills.storage.ContentAddressedStorage(), upload_to=apps.bills.storage.bill_image_upload_to),
+        ),
+        migrations.RunPython(
+            move_images_to_content_addressed_paths,
+            restore_images_old_paths),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-17 12:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bills', '0007_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='ocr_text',
+            field=models.BinaryField(null=True),
+        ),
+    ]
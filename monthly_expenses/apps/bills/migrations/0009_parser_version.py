@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-17 12:26
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bills', '0008_bill_ocr_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='parser_version',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='parsejob',
+            name='reparse',
+            field=models.BooleanField(default=False),
+        ),
+    ]
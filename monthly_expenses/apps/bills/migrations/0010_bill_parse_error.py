@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-17 12:33
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bills', '0009_parser_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='parse_error',
+            field=models.TextField(blank=True),
+        ),
+    ]
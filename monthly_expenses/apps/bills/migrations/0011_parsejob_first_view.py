@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-17 12:35
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bills', '0010_bill_parse_error'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parsejob',
+            name='first_view_hit',
+            field=models.NullBooleanField(),
+        ),
+        migrations.AddField(
+            model_name='parsejob',
+            name='first_view_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-17 12:37
+from __future__ import unicode_literals
+
+import logging
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+logger = logging.getLogger(__name__)
+# length of parsed item name column
+NAME_MAX_LENGTH = 128
+
+
+def move_parsed_data_to_parsed_items(apps, schema_editor):
+    """
+    Save dumped json of parsed bills
+    as parsed date and parsed items rows
+    """
+    import json
+    from django.utils import timezone
+    from django.utils.dateparse import parse_datetime
+    Bill = apps.get_model('bills', 'Bill')
+    ParsedItem = apps.get_model('bills', 'ParsedItem')
+    bills = Bill.objects.\
+        exclude(parsed_data='').\
+        only('id', 'parsed_data')
+    for bill in bills.iterator():
+        try:
+            parsed_data = json.loads(bill.parsed_data)
+            parsed_date = parse_datetime(parsed_data['date'])
+        except (ValueError, TypeError, KeyError):
+            # bill is parsed again by background worker
+            continue
+        if timezone.is_naive(parsed_date):
+            parsed_date = timezone.make_aware(
+                parsed_date, timezone.utc)
+        Bill.objects.filter(id=bill.id).update(
+            parsed_date=parsed_date)
+        items = parsed_data.get('items', [])
+        for item in items:
+            if len(item['name']) > NAME_MAX_LENGTH:
+                logger.warning(
+                    'Name of parsed item of bill %d is truncated '
+                    'from %d to %d characters: %s' % (
+                        bill.id, len(item['name']),
+                        NAME_MAX_LENGTH, item['name']))
+        ParsedItem.objects.bulk_create([
+            ParsedItem(
+                bill_id=bill.id,
+                name=item['name'][:NAME_MAX_LENGTH],
+                quantity=item['quantity'],
+                amount=item['amount'])
+            for item in items
+        ])
+
+
+def move_parsed_items_to_parsed_data(apps, schema_editor):
+    """
+    Dump parsed date and parsed items of bills to json
+    """
+    import json
+    from django.utils import timezone
+    Bill = apps.get_model('bills', 'Bill')
+    ParsedItem = apps.get_model('bills', 'ParsedItem')
+    bills = Bill.objects.\
+        filter(parsed_date__isnull=False).\
+        only('id', 'parsed_date')
+    for bill in bills.iterator():
+        items = ParsedItem.objects.\
+            filter(bill_id=bill.id).\
+            order_by('id').\
+            values('name', 'quantity', 'amount')
+        Bill.objects.filter(id=bill.id).update(
+            parsed_data=json.dumps({
+                'date': str(timezone.make_naive(
+                    bill.parsed_date, timezone.utc)),
+                'items': list(items)
+            }))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bills', '0011_parsejob_first_view'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParsedItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=NAME_MAX_LENGTH)),
+                ('quantity', models.IntegerField(default=1)),
+                ('amount', models.FloatField()),
+                ('bill', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parsed_items', to='bills.Bill')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='parsed_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        # default is needed to add the field back on unapply
+        migrations.AlterField(
+            model_name='bill',
+            name='parsed_data',
+            field=models.TextField(default=''),
+        ),
+        migrations.RunPython(
+            move_parsed_data_to_parsed_items,
+            move_parsed_items_to_parsed_data),
+        migrations.RemoveField(
+            model_name='bill',
+            name='parsed_data',
+        ),
+    ]
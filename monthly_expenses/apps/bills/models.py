@@ -1,18 +1,109 @@
 # -*- coding: utf-8 -*-
+import datetime
 import logging
-from PIL import Image
 
 from django.conf import settings
-from django.db import models, transaction
-from pytesseract import image_to_string
+from django.db import models, transaction, IntegrityError
+from django.utils import timezone
 
+from . import cache
+from .ocr import image_to_text
 from .parsers import load_parser
+from .preprocessing import open_image
+from .storage import bill_image_upload_to, bill_images_storage
+from .utils import generate_hash_from_image
 
 
 logger = logging.getLogger(__name__)
 # currently only one parser is supported
 parser = load_parser(settings.PARSER)
 SHA256_LEN_HEX = 64
+# Parsing statuses shown to api clients
+PARSE_STATUS_PENDING = 'pending'
+PARSE_STATUS_DONE = 'done'
+PARSE_STATUS_FAILED = 'failed'
+
+
+class BillManager(models.Manager):
+    """
+    Bills creation logic
+    """
+
+    def create_unique_in_bulk(self, user, images):
+        """
+        Create bills for images that were not uploaded yet.
+        Images are hashed in parallel, already uploaded images
+        are found with one query and new bills are created
+        with one insert
+
+        Returns list of tuples (is_created, bill_id)
+        in order of passed images
+        """
+        from .utils import generate_hashes_in_parallel
+        hashes = generate_hashes_in_parallel(images)
+        try:
+            with transaction.atomic():
+                return self._create_unique_in_bulk(
+                    user, images, hashes)
+        except IntegrityError as e:
+            # some images were uploaded concurrently
+            # they exist now and are not created again
+            logger.debug(
+                'Can not create bills in bulk '
+                'Original error: %s' % str(e))
+            with transaction.atomic():
+                return self._create_unique_in_bulk(
+                    user, images, hashes)
+
+    def stale(self):
+        """
+        Bills that were parsed by older parser version.
+        Bills that were never parsed are not included:
+        they are parsed by background worker
+        """
+        return self.\
+            exclude(parser_version='').\
+            exclude(parser_version=parser.get_version())
+
+    def annotate_is_categorised(self):
+        """
+        Annotate bills with is_categorised flag.
+        Flag is selected by subquery in the same query
+        """
+        from apps.budgets.models import BillCategory
+        return self.annotate(
+            is_categorised=models.Exists(
+                BillCategory.objects.filter(
+                    bill=models.OuterRef('pk'))))
+
+    def _create_unique_in_bulk(self, user, images, hashes):
+        existing_bills = dict(
+            self.filter(sha256_hash_hex__in=set(hashes)).\
+                values_list('sha256_hash_hex', 'id'))
+        new_bills = {}
+        for image, sha256_hash_hex in zip(images, hashes):
+            if sha256_hash_hex in existing_bills or \
+                    sha256_hash_hex in new_bills:
+                continue
+            new_bills[sha256_hash_hex] = self.model(
+                user=user,
+                image=image,
+                sha256_hash_hex=sha256_hash_hex)
+        self.bulk_create(new_bills.values())
+        # ids of created bills are not returned by all databases
+        created_bills = dict(
+            self.filter(sha256_hash_hex__in=new_bills.keys()).\
+                values_list('sha256_hash_hex', 'id'))
+        result = []
+        for sha256_hash_hex in hashes:
+            # only first of duplicated images is created
+            is_created = sha256_hash_hex in created_bills and \
+                sha256_hash_hex not in existing_bills
+            bill_id = existing_bills.get(sha256_hash_hex) or \
+                created_bills[sha256_hash_hex]
+            existing_bills[sha256_hash_hex] = bill_id
+            result.append((is_created, bill_id))
+        return result
 
 
 class Bill(models.Model):
@@ -22,11 +113,13 @@ class Bill(models.Model):
     """
     # TODO: set image width and height requirements so
     # we can avoid too small and unparsable images
+    # Stored under hash of the content
     image = models.ImageField(
-        upload_to='media/',
+        upload_to=bill_image_upload_to,
+        storage=bill_images_storage,
         blank=False,
         null=False)
-    # Is populated by post_save signal
+    # Is calculated on upload or before bill is created
     sha256_hash_hex = models.CharField(
         max_length=SHA256_LEN_HEX,
         unique=True,
@@ -36,9 +129,28 @@ class Bill(models.Model):
         auto_now_add=True,
         blank=False,
         null=False)
-    # Text information from bill
-    # Saved as dumped json
-    parsed_data = models.TextField()
+    # Date and time of the bill found by parser.
+    # Bill is parsed if it is set, parsed items
+    # are stored as ParsedItem rows
+    parsed_date = models.DateTimeField(
+        null=True,
+        blank=True)
+    # Name and version of parser that produced parsed data.
+    # Bills parsed by older versions are reparsed
+    # by reparse_bills command
+    parser_version = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True)
+    # Error of the last parsing by parser_version.
+    # Bill is not parsed again until parser version changes
+    # or reparse is requested
+    parse_error = models.TextField(blank=True)
+    # Raw OCR text of the image compressed with zlib.
+    # Bill is reparsed from it without running OCR again
+    ocr_text = models.BinaryField(
+        null=True,
+        editable=False)
     # Purchase date on the bill
     date = models.DateField(null=True, blank=True)
     user = models.ForeignKey(
@@ -48,42 +160,272 @@ class Bill(models.Model):
         'budgets.Category',
         through='budgets.BillCategory')
 
+    objects = BillManager()
+
+    class Meta:
+        indexes = [
+            # bills list is ordered by create time
+            models.Index(fields=['user', 'create_time', 'id']),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk is None and not self.sha256_hash_hex:
+            # hash is needed to build image path
+            self.sha256_hash_hex = generate_hash_from_image(self.image)
+        return super(Bill, self).save(*args, **kwargs)
+
     @property
-    def has_categories(self):
-        return self.categories.all().exists()
+    def image_path(self):
+        import os
+        from monthly_expenses.settings import MEDIA_ROOT
+        return os.path.join(MEDIA_ROOT, self.image.url)
 
-    def parse_bill(self, reparse=False):
+    def parse_bill(self, reparse=False, bill_text=None):
         """
         Get text information from bill image and
         extract datet ime of the bill, spendings types and amounts
+        Text is not extracted again if bill_text is passed.
+        Results for the same image are taken from cache
+        before OCR is run
 
         Raises ValueError in case bill can not be parsed
+        Parsing error is saved with parser version
+
+        Bill row is locked while it is parsed: concurrent callers
+        wait and get result of the first one instead of running OCR
         """
-        import json
-        if not reparse and self.parsed_data:
-            return json.loads(self.parsed_data)
-        try:
-            bill_text = self._get_text_from_image()
-        except IOError:
-            logger.exception('File not found')
-            raise ValueError('File not found')
+        if not reparse and self.parsed_date:
+            return self.get_parsed_data()
+        with transaction.atomic():
+            locked_bill = Bill.objects.\
+                select_for_update().\
+                only('parsed_date', 'parse_error', 'parser_version').\
+                get(pk=self.pk)
+            if self._is_parsed_concurrently(locked_bill):
+                self.parsed_date = locked_bill.parsed_date
+                self.parse_error = locked_bill.parse_error
+                self.parser_version = locked_bill.parser_version
+                error = self.parse_error
+            else:
+                error = self._parse_and_save(reparse, bill_text)
+        if error:
+            raise ValueError(error)
+        return self.get_parsed_data()
+
+    def _is_parsed_concurrently(self, locked_bill):
+        """
+        Check if bill was parsed by other process
+        after it was loaded
+        """
+        return \
+            locked_bill.parser_version != self.parser_version or \
+            locked_bill.parsed_date != self.parsed_date or \
+            locked_bill.parse_error != self.parse_error
+
+    def _parse_and_save(self, reparse, bill_text):
+        """
+        Parse bill and save result or parsing error
+        Returns parsing error or None
+        """
+        parsed_data = None
+        if not reparse and bill_text is None:
+            parsed_data = cache.get_parsed_data(
+                self.sha256_hash_hex, parser)
+        if parsed_data is None:
+            try:
+                parsed_data = self._parse_bill_text(bill_text)
+            except ValueError as e:
+                self.save_parse_error(e.args[0])
+                return self.parse_error
+        self.save_parsed_data(parsed_data)
+        return None
+
+    @transaction.atomic
+    def save_parse_error(self, error):
+        """
+        Save parsing error with current parser version,
+        so bill is not parsed again until parser is changed.
+        Results of previous parsing are removed,
+        so they are not returned instead of the error
+        """
+        self.parse_error = error
+        self.parser_version = parser.get_version()
+        self.parsed_date = None
+        self.save(update_fields=[
+            'parse_error', 'parser_version', 'parsed_date'])
+        ParsedItem.objects.filter(bill=self).delete()
+
+    def get_parsed_data(self):
+        """
+        Get stored parsing results in format of parser results.
+        Returns None if bill is not parsed
+        """
+        if self.parsed_date is None:
+            return None
+        return {
+            'date': str(timezone.make_naive(
+                self.parsed_date, timezone.utc)),
+            'items': list(
+                self.parsed_items.\
+                    order_by('id').\
+                    values('name', 'quantity', 'amount'))
+        }
+
+    @transaction.atomic
+    def save_parsed_data(self, parsed_data):
+        """
+        Save parsing results of current parser version.
+        Previously parsed items are replaced
+        """
+        from django.utils.dateparse import parse_datetime
+        parsed_date = parse_datetime(parsed_data['date'])
+        if timezone.is_naive(parsed_date):
+            # time on the bill is stored as is
+            parsed_date = timezone.make_aware(
+                parsed_date, timezone.utc)
+        self.parsed_date = parsed_date
+        self.parser_version = parser.get_version()
+        self.parse_error = ''
+        self.save(update_fields=[
+            'parsed_date', 'parser_version', 'parse_error'])
+        ParsedItem.objects.filter(bill=self).delete()
+        ParsedItem.objects.bulk_create([
+            ParsedItem(
+                bill=self,
+                name=ParsedItem.truncate_name(item['name'], self.id),
+                quantity=item['quantity'],
+                amount=item['amount'])
+            for item in parsed_data['items']
+        ])
+
+    def _parse_bill_text(self, bill_text=None):
+        """
+        Parse bill text. Text is extracted
+        from image if it is not passed
+        """
+        if bill_text is None:
+            bill_text = self.get_ocr_text()
+        if self.ocr_text is None:
+            # text is kept even if parsing fails,
+            # so bill can be reparsed by fixed parser
+            self.set_ocr_text(bill_text)
+            self.save(update_fields=['ocr_text'])
         parsed_data = \
             parser.get_datetime_and_spendings_from_bill(bill_text)
-        self.parsed_data = json.dumps(parsed_data)
-        self.save(update_fields=['parsed_data'])
+        cache.set_parsed_data(
+            self.sha256_hash_hex, parser, parsed_data)
         return parsed_data
 
+    def trace_parse(self):
+        """
+        Parse stored OCR text and record parser decisions
+        OCR is never run and parsing results are not saved
+
+        Returns tuple of parsed data (None if parsing failed),
+        parsing error and list of parser decisions
+        Raises ValueError if OCR text is not stored
+        """
+        from .parsers.trace import ParseTrace
+        if self.ocr_text is None:
+            raise ValueError('OCR text is not stored')
+        trace = ParseTrace()
+        try:
+            parsed_data = parser.get_datetime_and_spendings_from_bill(
+                self.get_ocr_text(), trace=trace)
+        except ValueError as e:
+            return None, e.args[0], trace.events
+        return parsed_data, None, parsed_data.pop('trace')
+
+    def get_parse_status(self):
+        """
+        Get parsing results without running OCR.
+        Schedules background parsing if bill was not parsed yet.
+
+        Returns tuple of parsing status (pending, done or failed),
+        parsed data (None if bill is not parsed yet)
+        and parsing error (None if parsing did not fail)
+        """
+        if self.parsed_date:
+            return (
+                PARSE_STATUS_DONE, self.get_parsed_data(), None)
+        parsed_data = cache.get_parsed_data(
+            self.sha256_hash_hex, parser)
+        if parsed_data is not None:
+            # same image was parsed for another bill
+            self.save_parsed_data(parsed_data)
+            return (
+                PARSE_STATUS_DONE, parsed_data, None)
+        is_failure_stale = False
+        if self.parse_error:
+            if self.parser_version == parser.get_version():
+                return (
+                    PARSE_STATUS_FAILED, None, self.parse_error)
+            # parser was changed after the failure
+            is_failure_stale = True
+        job = ParseJob.objects.schedule(
+            self, reparse=is_failure_stale)
+        if job.status == ParseJob.FAILED:
+            return (
+                PARSE_STATUS_FAILED, None, job.error)
+        if job.status == ParseJob.DONE:
+            # bill was loaded before parsed data was saved
+            self.refresh_from_db(fields=['parsed_date'])
+            if self.parsed_date:
+                return (
+                    PARSE_STATUS_DONE, self.get_parsed_data(), None)
+        return (
+            PARSE_STATUS_PENDING, None, None)
+
+    def request_reparse(self):
+        """
+        Schedule background parsing of the bill
+        even if it was already parsed or failed
+        """
+        self.parse_error = ''
+        self.save(update_fields=['parse_error'])
+        return ParseJob.objects.schedule(self, reparse=True)
+
+    def get_ocr_text(self):
+        """
+        Get raw OCR text of the bill.
+        OCR is run only if text was not stored yet
+        """
+        import zlib
+        if self.ocr_text is not None:
+            return zlib.decompress(self.ocr_text).decode('utf-8')
+        return self._get_text_from_image()
+
+    def set_ocr_text(self, bill_text):
+        """
+        Store compressed raw OCR text of the bill
+        Text is not saved to database
+        """
+        import zlib
+        if isinstance(bill_text, bytes):
+            bill_text = bill_text.decode('utf-8')
+        self.ocr_text = zlib.compress(bill_text.encode('utf-8'))
+
     def _get_text_from_image(self):
         """
         Extract text from inmage with OCR
+        Text is cached by image hash
+
+        Raises ValueError if image file is not found
         """
-        import os
-        from monthly_expenses.settings import MEDIA_ROOT
-        image_path = os.path.join(MEDIA_ROOT, self.image.url)
-        image = Image.open(image_path)
-        return image_to_string(image)
+        bill_text = cache.get_ocr_text(self.sha256_hash_hex)
+        if bill_text is not None:
+            return bill_text
+        try:
+            bill_text = image_to_text(
+                open_image(self.image_path))
+        except IOError:
+            logger.exception('File not found')
+            raise ValueError('File not found')
+        cache.set_ocr_text(self.sha256_hash_hex, bill_text)
+        return bill_text
 
-    def create_categories_in_bulk(self, categories):
+    def create_categories_in_bulk(
+            self, categories, categories_by_id=None):
         """
         Accepts list of dictionaries with format:
         [
@@ -97,21 +439,343 @@ class Bill(models.Model):
             }
         ]
         Creates in bulk bill to categories links
+        Categories are found with one query
+        if categories_by_id is not passed
         No format validation is performed
+
+        Raises Category.DoesNotExist if any category does not exist
         """
         from apps.budgets.models import (
             Category, BillCategory)
-        categories_to_be_created = [
-           BillCategory(
-                amount=category['amount'],
-                category=Category.objects.get(
-                    # TODO: shitty solution from performance prospective
-                    # For now it's better fail loudly here
-                    id=category['category']['id']),
-                bill=self
-            )
-           for category in categories
-        ]
+        if categories_by_id is None:
+            categories_by_id = self.get_categories_by_id(categories)
+        categories_to_be_created = []
+        for category in categories:
+            category_id = category['category']['id']
+            if category_id not in categories_by_id:
+                raise Category.DoesNotExist(
+                    'Category %s does not exist' % category_id)
+            categories_to_be_created.append(
+                BillCategory(
+                    amount=category['amount'],
+                    category=categories_by_id[category_id],
+                    bill=self))
         with transaction.atomic():
             BillCategory.objects.bulk_create(
                 categories_to_be_created)
+
+    @transaction.atomic
+    def update_categories_in_bulk(
+            self, categories, categories_by_id=None):
+        """
+        Replace bill to categories links with passed links.
+        Accepts list in format of create_categories_in_bulk argument
+        Only difference with existing links is written:
+        changed amounts are updated with one query,
+        new links are created in bulk and removed links are deleted
+
+        Raises Category.DoesNotExist if any new category does not exist
+        """
+        from apps.budgets.models import BillCategory
+        # {category id: (link id, amount)}
+        existing_links = dict(
+            (category_id, (link_id, amount))
+            for category_id, link_id, amount in
+            BillCategory.objects.\
+                select_for_update().\
+                filter(bill=self).\
+                values_list('category_id', 'id', 'amount'))
+        amounts = dict(
+            (category['category']['id'], category['amount'])
+            for category in categories)
+        removed_ids = [
+            link_id
+            for category_id, (link_id, _) in existing_links.items()
+            if category_id not in amounts
+        ]
+        if removed_ids:
+            BillCategory.objects.filter(id__in=removed_ids).delete()
+        changed = dict(
+            (existing_links[category_id][0], amount)
+            for category_id, amount in amounts.items()
+            if category_id in existing_links and
+            existing_links[category_id][1] != amount)
+        if changed:
+            BillCategory.objects.\
+                filter(id__in=changed.keys()).\
+                update(amount=models.Case(
+                    *[
+                        models.When(id=link_id, then=models.Value(amount))
+                        for link_id, amount in changed.items()
+                    ],
+                    output_field=models.FloatField()))
+        new_categories = [
+            category for category in categories
+            if category['category']['id'] not in existing_links
+        ]
+        if new_categories:
+            self.create_categories_in_bulk(
+                new_categories, categories_by_id)
+
+    @staticmethod
+    def get_categories_by_id(categories):
+        """
+        Find categories of passed bill to categories links
+        with one query. Accepts list in format of
+        create_categories_in_bulk argument
+
+        Returns dictionary {category id: category}
+        Not existing categories are missing
+        """
+        from apps.budgets.models import Category
+        return Category.objects.in_bulk(
+            set(category['category']['id'] for category in categories))
+
+
+class ParsedItem(models.Model):
+    """
+    Item of the bill found by parser.
+    Parsed items are not changed by user,
+    saved spendings are stored separately
+    """
+    NAME_MAX_LENGTH = 128
+
+    bill = models.ForeignKey(
+        Bill,
+        on_delete=models.CASCADE,
+        related_name='parsed_items')
+    name = models.CharField(
+        max_length=NAME_MAX_LENGTH)
+    quantity = models.IntegerField(default=1)
+    # we don't need precise numbers here
+    amount = models.FloatField()
+
+    @classmethod
+    def truncate_name(cls, name, bill_id):
+        """
+        Cut name to column length.
+        Truncation is logged, so too short column can be noticed
+        """
+        if len(name) > cls.NAME_MAX_LENGTH:
+            logger.warning(
+                'Name of parsed item of bill %d is truncated '
+                'from %d to %d characters: %s' % (
+                    bill_id, len(name), cls.NAME_MAX_LENGTH, name))
+        return name[:cls.NAME_MAX_LENGTH]
+
+
+class ParseJobManager(models.Manager):
+    """
+    Background parsing queue
+    """
+
+    def schedule(self, bill, reparse=False):
+        """
+        Add bill to parsing queue.
+        Returns existing job if bill was already scheduled.
+        Finished job is restarted if reparse is requested
+        """
+        job, is_created = self.get_or_create(
+            bill=bill,
+            defaults={
+                'reparse': reparse
+            })
+        if reparse and not is_created and \
+                job.status in (ParseJob.DONE, ParseJob.FAILED):
+            job.status = ParseJob.PENDING
+            job.reparse = True
+            job.error = ''
+            job.attempts = 0
+            job.save(update_fields=[
+                'status', 'reparse', 'error', 'attempts', 'update_time'])
+        return job
+
+    def schedule_in_bulk(self, bill_ids):
+        """
+        Add bills to parsing queue with one insert.
+        Bills that were already scheduled are skipped
+        """
+        bill_ids = set(bill_ids)
+        scheduled = set(
+            self.filter(bill_id__in=bill_ids).\
+                values_list('bill_id', flat=True))
+        try:
+            with transaction.atomic():
+                self.bulk_create([
+                    ParseJob(bill_id=bill_id)
+                    for bill_id in sorted(bill_ids - scheduled)
+                ])
+        except IntegrityError:
+            # some bills were scheduled concurrently
+            for bill_id in bill_ids - scheduled:
+                self.get_or_create(bill_id=bill_id)
+
+    def record_first_view(self, bill, parse_status):
+        """
+        Save if parsing was finished when user viewed
+        parsing results of the bill first time
+        """
+        self.filter(
+            bill=bill,
+            first_view_time__isnull=True).\
+            update(
+                first_view_time=timezone.now(),
+                first_view_hit=parse_status != PARSE_STATUS_PENDING)
+
+    def get_first_view_stats(self):
+        """
+        Number of bills that were parsed (hits) and were not parsed
+        yet (misses) when user viewed parsing results first time
+        Returns dictionary with format:
+        {
+            'hits': [number of hits],
+            'misses': [number of misses]
+        }
+        """
+        stats = dict(
+            self.filter(first_view_hit__isnull=False).\
+                values_list('first_view_hit').\
+                annotate(models.Count('id')))
+        return {
+            'hits': stats.get(True, 0),
+            'misses': stats.get(False, 0)
+        }
+
+    @transaction.atomic
+    def schedule_reparse(self, bills):
+        """
+        Add bills to parsing queue to be parsed again.
+        Existing jobs are restarted.
+        Returns number of scheduled bills
+        """
+        bill_ids = set(bill.id for bill in bills)
+        restarted = set(
+            self.select_for_update().\
+                filter(bill_id__in=bill_ids).\
+                values_list('bill_id', flat=True))
+        self.filter(bill_id__in=restarted).update(
+            status=ParseJob.PENDING,
+            reparse=True,
+            error='',
+            attempts=0,
+            update_time=timezone.now())
+        self.bulk_create([
+            ParseJob(bill_id=bill_id, reparse=True)
+            for bill_id in sorted(bill_ids - restarted)
+        ])
+        # failures are not returned until bills are parsed again
+        Bill.objects.filter(id__in=bill_ids).update(parse_error='')
+        return len(bill_ids)
+
+    @transaction.atomic
+    def acquire(self, limit):
+        """
+        Lock and return up to limit jobs for processing.
+        Pending jobs and jobs that are stuck in processing for too long
+        are acquired. Stuck jobs without attempts left are failed.
+        Locked rows are skipped, so several workers can share the queue
+        """
+        stuck_time = timezone.now() - datetime.timedelta(
+            seconds=settings.PARSE_JOB_TIMEOUT)
+        failed = self.filter(
+            status=ParseJob.PROCESSING,
+            update_time__lt=stuck_time,
+            attempts__gte=settings.PARSE_JOB_MAX_ATTEMPTS).\
+            update(
+                status=ParseJob.FAILED,
+                error=ParseJob.TOO_MANY_ATTEMPTS_ERROR,
+                update_time=timezone.now())
+        if failed:
+            logger.warning(
+                '%d parse jobs failed after %d attempts' % (
+                    failed, settings.PARSE_JOB_MAX_ATTEMPTS))
+        jobs = list(
+            self.select_for_update(skip_locked=True).\
+                filter(
+                    models.Q(status=ParseJob.PENDING) |
+                    models.Q(
+                        status=ParseJob.PROCESSING,
+                        update_time__lt=stuck_time,
+                        attempts__lt=settings.PARSE_JOB_MAX_ATTEMPTS)).\
+                select_related('bill').\
+                order_by('id')[:limit])
+        self.filter(id__in=[job.id for job in jobs]).update(
+            status=ParseJob.PROCESSING,
+            attempts=models.F('attempts') + 1,
+            update_time=timezone.now())
+        return jobs
+
+
+class ParseJob(models.Model):
+    """
+    Background parsing of the bill image.
+    Jobs are processed by process_parse_jobs management command
+    """
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+    TOO_MANY_ATTEMPTS_ERROR = 'Parsing was interrupted too many times'
+
+    bill = models.OneToOneField(
+        Bill,
+        on_delete=models.CASCADE,
+        related_name='parse_job')
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        db_index=True)
+    # Parsing error shown to the user
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    # Parse bill again even if it was already parsed
+    reparse = models.BooleanField(default=False)
+    # When user viewed parsing results first time
+    # and if they were ready at that moment
+    first_view_time = models.DateTimeField(
+        null=True, blank=True)
+    first_view_hit = models.NullBooleanField()
+    create_time = models.DateTimeField(
+        auto_now_add=True)
+    update_time = models.DateTimeField(
+        auto_now=True)
+
+    objects = ParseJobManager()
+
+    def __str__(self):
+        return 'Parse job for bill %d' % self.bill_id
+
+    def run(self, bill_text=None):
+        """
+        Parse the bill and save job result.
+        Text is not extracted from image if bill_text is passed
+        Never raises: parsing errors are saved to the job
+        """
+        try:
+            self.bill.parse_bill(
+                reparse=self.reparse, bill_text=bill_text)
+        except ValueError as e:
+            self.fail(e.args[0])
+        except Exception:
+            logger.exception(
+                'Unexpected error while parsing bill %d' % self.bill_id)
+            self.fail('Unexpected parsing error')
+        else:
+            self.status = self.DONE
+            self.error = ''
+            self.save(update_fields=['status', 'error', 'update_time'])
+
+    def fail(self, error):
+        """
+        Save error of the job
+        """
+        self.status = self.FAILED
+        self.error = error
+        self.save(update_fields=['status', 'error', 'update_time'])
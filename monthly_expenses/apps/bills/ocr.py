@@ -0,0 +1,124 @@
+"""
+OCR engines to extract text from bills images
+
+Starting tesseract process and loading language data takes most of
+the time for small bills images. When tesserocr is installed,
+every process keeps one tesseract engine with loaded language data
+and passes images to it in memory.
+Otherwise tesseract binary is run for every image via pytesseract.
+"""
+import logging
+import multiprocessing
+
+from pytesseract import image_to_string
+
+from .preprocessing import open_image
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+
+logger = logging.getLogger(__name__)
+OCR_LANGUAGE = 'eng'
+# engine of current process
+# is created on first use
+_engine = None
+
+
+class SubprocessEngine(object):
+    """
+    Run tesseract binary for every image
+    """
+
+    def image_to_text(self, image):
+        return image_to_string(
+            image, lang=OCR_LANGUAGE)
+
+
+class PersistentEngine(object):
+    """
+    Keep tesseract engine with loaded language data
+    between images. Images are passed in memory
+    """
+
+    def __init__(self):
+        self.api = tesserocr.PyTessBaseAPI(
+            lang=OCR_LANGUAGE)
+
+    def image_to_text(self, image):
+        self.api.SetImage(image)
+        return self.api.GetUTF8Text()
+
+
+def get_engine():
+    """
+    Return OCR engine of current process
+    """
+    global _engine
+    if _engine is None:
+        if tesserocr is not None:
+            _engine = PersistentEngine()
+        else:
+            logger.warning(
+                'tesserocr is not installed. '
+                'Tesseract process will be started for every image')
+            _engine = SubprocessEngine()
+    return _engine
+
+
+def image_to_text(image):
+    """
+    Extract text from PIL image
+    """
+    return get_engine().image_to_text(image)
+
+
+def _image_file_to_text(image_path):
+    """
+    Extract text from image file in pool worker.
+    Returns text and error (None if text was extracted)
+    """
+    try:
+        return (
+            image_to_text(open_image(image_path)), None)
+    except IOError:
+        logger.exception(
+            'File not found %s' % image_path)
+        return (None, 'File not found')
+    except Exception:
+        logger.exception(
+            'Unexpected OCR error for %s' % image_path)
+        return (None, 'Unexpected parsing error')
+
+
+class OCRPool(object):
+    """
+    Pool of processes with long lived OCR engines.
+    Pool size defaults to number of CPUs
+    """
+
+    def __init__(self, processes=None):
+        self.processes = processes or multiprocessing.cpu_count()
+        self._pool = multiprocessing.Pool(
+            self.processes,
+            initializer=get_engine)
+
+    def images_to_text(self, image_paths):
+        """
+        Extract text from images files in parallel.
+        Returns list of (text, error) tuples in order of passed paths
+        """
+        return self._pool.map(
+            _image_file_to_text, image_paths)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,37 @@
+"""
+Pagination of bills lists
+"""
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from apps.pagination import KeysetPagination
+
+
+class BillsCursorPagination(KeysetPagination):
+    """
+    Keyset pagination of bills ordered by create time and id
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.prepare(request)
+        if self.limit is None:
+            # all bills are listed
+            return None
+        if self.after is not None:
+            create_time, bill_id = self.after
+            queryset = queryset.filter(
+                Q(create_time__gt=create_time) |
+                Q(create_time=create_time, id__gt=bill_id))
+        return self.paginate_items(
+            queryset.order_by('create_time', 'id')[
+                :self.get_fetch_limit()])
+
+    def format_cursor(self, bill):
+        return '%s|%d' % (bill.create_time.isoformat(), bill.id)
+
+    def parse_cursor(self, cursor):
+        create_time, bill_id = cursor.split('|')
+        create_time = parse_datetime(create_time)
+        if create_time is None:
+            raise ValueError('Invalid create time')
+        return create_time, int(bill_id)
@@ -25,3 +25,11 @@ def load_parser(name):
         logger.exception(
             'Parser %s could not be found' % name)
         return __PARSERS['default']
+
+
+def get_parsers_names():
+    """
+    Names of all registered parsers
+    """
+    return sorted(
+        name for name in __PARSERS if name != 'default')
@@ -1,7 +1,13 @@
-import logging
+import copy
+import datetime
+import re
 
-
-logger = logging.getLogger(__name__)
+# common formats of bills dates: 06.06.2018, 6-6-18, 26/03/2018
+DATE_RE = re.compile(r'^(\d{1,2})([./-])(\d{1,2})\2(\d{4}|\d{2})$')
+# ISO date: 2018-06-06
+ISO_DATE_RE = re.compile(r'^(\d{4})-(\d{1,2})-(\d{1,2})$')
+# time following the date: 20:00 or 20:00:15
+TIME_RE = re.compile(r'^(\d{1,2}):(\d{2})(?::(\d{2}))?$')
 
 
 class BaseParser(object):
@@ -11,14 +17,31 @@ class BaseParser(object):
     Processes text string
     Every parser should define own logic of parsing items
     information.
+    NAME and VERSION identify results of the parser,
+    VERSION should be increased when parsing results change
     """
+    NAME = None
+    VERSION = 1
+    # ParseTrace of the current parsing, set on copy of the parser
+    # Decisions are recorded only if trace is set
+    _trace = None
+    # day goes before month in dates
+    DAYFIRST = True
     MIN_DATE_WORD_LENGTH = 6 # 2 - year, 1 - month, 1 - day, 2 - stop symbols
 
+    def get_version(self):
+        """
+        Identify parser and its version.
+        Saved with parsing results
+        """
+        return '%s:%s' % (self.NAME, self.VERSION)
 
-    def get_datetime_and_spendings_from_bill(self, bill_text):
+    def get_datetime_and_spendings_from_bill(self, bill_text, trace=None):
         """
         Get datetime when bill was created and information about spendings:
         type, amount. Throws ValueError if date or items can not be found
+        Parser decisions are recorded to trace if ParseTrace is passed,
+        recorded events are added to result as 'trace'
 
         Returns dictionary with format:
         {
@@ -32,6 +55,17 @@ class BaseParser(object):
             ]
         }
         """
+        if trace is None:
+            return self._parse_bill_text(bill_text)
+        # parser is shared between threads,
+        # so trace is set on its copy
+        traced_parser = copy.copy(self)
+        traced_parser._trace = trace
+        result = traced_parser._parse_bill_text(bill_text)
+        result['trace'] = trace.events
+        return result
+
+    def _parse_bill_text(self, bill_text):
         bill_by_lines = [
             line.strip() for line in bill_text.splitlines()
             if line.strip()]
@@ -45,27 +79,94 @@ class BaseParser(object):
     def _find_date(self, bill_words):
         """
         Find date of the bill.
+        Words are checked for common bills date formats first,
+        other words are parsed by dateutil.
         Returns date in format '%Y-%m-%d %H:%M:%S'
         """
+        date, leftover_words = self._find_date_by_patterns(bill_words)
+        if date is None:
+            date = self._find_date_by_dateutil(leftover_words)
+        if date is None:
+            raise ValueError('No date found')
+        return str(date)
+
+    def _find_date_by_patterns(self, bill_words):
+        """
+        Find first word in common bills date format.
+        Time is used if it follows the date.
+        Returns date or None and words that can not be date
+        in formats known by the parser
+        """
+        leftover_words = []
+        for index, word in enumerate(bill_words):
+            match = DATE_RE.match(word)
+            if match:
+                first, _, second, year = match.groups()
+                day, month = (first, second) if self.DAYFIRST \
+                    else (second, first)
+                if len(year) == 2:
+                    year = '20' + year
+            else:
+                match = ISO_DATE_RE.match(word)
+                if not match:
+                    if len(word) >= self.MIN_DATE_WORD_LENGTH:
+                        leftover_words.append(word)
+                    continue
+                year, month, day = match.groups()
+            try:
+                date = datetime.datetime(
+                    int(year), int(month), int(day))
+            except ValueError:
+                # looks like date, but it's not
+                if self._trace is not None:
+                    self._trace.record('invalid_date', word=word)
+                continue
+            if self._trace is not None:
+                self._trace.record('date', word=word)
+            return (
+                self._add_time(date, bill_words[index + 1:index + 2]),
+                leftover_words)
+        return None, leftover_words
+
+    def _add_time(self, date, next_words):
+        """
+        Add time from the word following the date
+        """
+        match = next_words and TIME_RE.match(next_words[0])
+        if not match:
+            return date
+        hour, minute, second = match.groups()
+        try:
+            return date.replace(
+                hour=int(hour),
+                minute=int(minute),
+                second=int(second or 0))
+        except ValueError:
+            return date
+
+    def _find_date_by_dateutil(self, bill_words):
+        """
+        Find first word that can be parsed by dateutil
+        Returns date or None
+        """
         from dateutil import parser
         # WARING: 4 sumbols dates without stop symbols can not be used here
         for word in bill_words:
             if len(word) < self.MIN_DATE_WORD_LENGTH:
-                logger.debug(
-                    'Length of word %s is not enough to be date' % word)
                 continue
             try:
                 date = parser.parse(
-                    word, dayfirst=True)
-                return str(date)
+                    word, dayfirst=self.DAYFIRST)
             # not date - ok to skip
-            except ValueError as e:
-                logger.debug(
-                    'Word %s is not date: %s' % (word, e))
-            except OverflowError as e:
-                logger.debug(
-                    'Word %s is not date: %s' % (word, e))
-        raise ValueError('No date found')
+            except (ValueError, OverflowError):
+                continue
+            if self._trace is not None:
+                self._trace.record('fuzzy_date', word=word)
+            return date
+        if self._trace is not None:
+            self._trace.record(
+                'no_date', checked_words=len(bill_words))
+        return None
 
     def _find_items(self, bill_lines):
         """
@@ -88,20 +189,20 @@ class BaseParser(object):
             # in case second line in pair was used
             # together with first line to parse the item
             if skip_line:
-                logger.debug(
-                    'Skipped line %s '
-                    'Used to build previous item' % \
-                    bill_lines[line_index])
                 skip_line = False
                 continue
             lines = bill_lines[line_index: line_index + 2]
             # don't proceed further that total sum line
             if self._is_total_line(lines[0]):
-                logger.debug(
-                    'Found total line: "%s"' % lines[0])
+                if self._trace is not None:
+                    self._trace.record('total', line=lines[0])
                 break
             item, skip_line = self._process_line(*lines)
             if item:
+                if self._trace is not None:
+                    self._trace.record(
+                        'item', line=lines[0],
+                        next_line_used=skip_line, item=item)
                 items.append(item)
         if not items:
             raise ValueError('No items found')
@@ -2,81 +2,114 @@
 """
 Parser for finnish checks based on simple regex
 """
-import logging
 import re
 
 from .base import BaseParser
 
 
-logger = logging.getLogger(__name__)
+# item name with optional leading numeric code
+ITEM_NAME_RE = re.compile('^([\d ]+)?([a-zA-Z&\s]+)')
+# quantity in the beginning of the second item line
+QUANTITY_RE = re.compile('^([\d ]+)(kpl|KPL)?')
+# leading not space symbols, leftovers of the item name
+NAME_LEFTOVERS_RE = re.compile(r'^[\S]+')
+# amount as separate word with optional currency
+AMOUNT_RE = re.compile(
+    '(?<!\S)([1-9]\d*[.,]\d+)(?:EUR|eur|€)?(?!\S)')
 
 
 class FIParser(BaseParser):
     """
     Parse test checks images with simple structure
     """
+    NAME = 'fi_parser'
+    VERSION = 2
     # list of words that we assume not to be item names
     # includes words related to taxation information
-    BLOCKED_WORDS = [
+    BLOCKED_WORDS = frozenset([
        'vero',
        'verton',
        'alv'
-    ]
+    ])
 
-    def _process_line(self, line, *args, **kwargs):
-        """
-        Process bill line
-        Returns item or None if item can not be parsed
-        and flag that showa if second line passed was used
-        to construct the item
-        If item is found, line information should be in format:
-        {
-            'name': 'item-name [string]',
-            'quantity': 'item-quantity [int]',
-            'amount': 'item-amount [float]'    
-        }
-        """
-        if len(args) == 1:
-            return self._process_double_lines(line, args[0])
-        else:
-            return self._process_single_line(line), False
+    def _find_items(self, bill_lines):
+        """
+        Find items of the bill in one pass over lines.
+        Information about item can be splitted into two lines:
+        line with item name is kept until next line is checked
+        for quantity and amount.
+        Returns list of items in format:
+        [
+            {
+                'name': 'item-name [string]',
+                'quantity': 'item-quantity [int]',
+                'amount': 'item-amount [float]'
+            }
+        ]
+        """
+        items = []
+        # name and amount from line waiting for the second line
+        # and the line itself
+        pending = None
+        pending_line = None
+        trace = self._trace
+        for line in bill_lines:
+            if pending is not None:
+                item, second_line_was_used = \
+                    self._build_item(pending, line)
+                if trace is not None:
+                    trace.record(
+                        'item' if item else 'not_item',
+                        line=pending_line,
+                        next_line_used=second_line_was_used,
+                        item=item)
+                pending = None
+                if item:
+                    items.append(item)
+                if second_line_was_used:
+                    continue
+            # don't proceed further that total sum line
+            if self._is_total_line(line):
+                if trace is not None:
+                    trace.record('total', line=line)
+                break
+            pending = self._parse_first_bill_line(line)
+            pending_line = line
+            if pending is None and trace is not None:
+                trace.record('skipped', line=line)
+        if pending is not None:
+            name, amount = pending
+            item = {
+                'name': name,
+                'amount': amount,
+                'quantity': 1
+            } if amount else None
+            if trace is not None:
+                trace.record(
+                    'item' if item else 'not_item',
+                    line=pending_line,
+                    next_line_used=False,
+                    item=item)
+            if item:
+                items.append(item)
+        if not items:
+            raise ValueError('No items found')
+        return items
 
-    def _process_double_lines(
-            self, first_line, second_line):
+    def _build_item(self, first_line_result, second_line):
         """
-        Try extract amount, quantity and name from two sequential lines
-        Returns item and flag that shows if second line
+        Build item from result of the first line
+        and quantity and amount from the second line
+        Returns item or None and flag that shows if second line
         was used to build the item
         """
-        try:
-            (
-                name, 
-                first_line_amount, 
-                first_line_quantity
-            ) = self._parse_first_bill_line(first_line)
-        except ValueError:
-            logger.exception(
-                'Can not parse first line %s' % first_line)
-            return None, False
-        second_line_amount = None
-        second_line_quantity = None
-        try:
-            (
-                second_line_amount,
-                second_line_quantity
-            ) = self._parse_second_bill_line(second_line)
-        except ValueError as e:
-            logger.debug(
-                'Falied to parse second line '
-                '%s. Original exception: %s' % (second_line, str(e)))
+        name, first_line_amount = first_line_result
+        second_line_amount, second_line_quantity = \
+            self._parse_second_bill_line(second_line)
         amount = first_line_amount or second_line_amount
-        quantity = second_line_quantity or first_line_quantity
-        if not name or not amount or not quantity:
-            logger.error(
-                'Can not parse lines %s '
-                'Result: name - %s, amount - %s, quantity - %s' % (
-                        str([first_line, second_line]),
-                        name, amount, quantity))
+        # fi checks don't have quantity on the fist line
+        quantity = second_line_quantity or 1
+        if not amount:
             return None, False
         # check if second line was used to build
         # the item
@@ -90,101 +123,52 @@ class FIParser(BaseParser):
         }
         return item, second_line_was_used
 
-    def _process_single_line(self, line):
-        """
-        Parse single line passed
-        """
-        try:
-            (
-                name, 
-                amount, 
-                quantity
-            ) = self._parse_first_bill_line(line)
-        except ValueError:
-            logger.exception(
-                'Can not parse first line %s' % line)
-            return None
-        if not name or not amount or not quantity:
-            logger.error(
-                'Can not parse line %s' % line)
-            return None
-        return {
-            'name': name,
-            'amount': amount,
-            'quantity': quantity
-        }
-
     def _parse_first_bill_line(
             self, line):
         """
-        Use regex to get amount, quantity and item name
-        information from bill
+        Get item name and amount from bill line
+        Returns None if line does not have item name
         """
-        # Try find name
-        name_match = re.search(
-            '^([\d ]+)?([a-zA-Z&\s]+)', line)
+        name_match = ITEM_NAME_RE.match(line)
         if not name_match:
-            raise ValueError(
-                'Can not find item name. Line %s' % line)
+            return None
         name = name_match.group(2).strip()
-        if not self._is_word_can_be_item_name(name):
-            raise ValueError(
-                'Word is not item name: %s. Line %s' % (
-                    name, line))
-        line_after_name = line.split(name)[-1]
+        if not name or not self._is_word_can_be_item_name(name):
+            return None
+        line_after_name = line.rsplit(name, 1)[-1]
         # if there some not space symbols in the beginning
         # of the left line, we should remove them
         # cause they are probably numeric leftovers of the item name
         # which is ok to skip
-        line_after_name = re.sub(r'^[\S]+', '', line_after_name)
-        # Try find amount
-        amount = self._get_amount(line_after_name)
-   
-        return (
-                name,
-                amount,
-                1 # quantity - fi checks don't have quantity on the fist line
-            )
+        line_after_name = NAME_LEFTOVERS_RE.sub('', line_after_name)
+        return name, self._get_amount(line_after_name)
 
     def _parse_second_bill_line(self, line):
         """
-        Try parse quantity and amount from second bill line
+        Get amount and quantity from second bill line
+        Returns tuple of Nones if line does not start with quantity
         """
-        quantity_match = re.search(
-            '^([\d ]+)(kpl|KPL)?', line.strip())
+        quantity_match = QUANTITY_RE.match(line.strip())
         if not quantity_match:
-            raise ValueError(
-                'Can not find quantity. Line "%s"' % line)
+            return None, None
         quantity = quantity_match.group(1)
-        if quantity:
-            line = line.split(quantity)[-1]
-        amount = self._get_amount(line)
-        return (
-                amount,
-                int(quantity.strip())
-            )
+        try:
+            quantity_number = int(quantity.strip())
+        except ValueError:
+            # spaces inside of the number
+            return None, None
+        amount = self._get_amount(line.rsplit(quantity, 1)[-1])
+        return amount, quantity_number
 
     def _get_amount(self, line):
         """
         Extract amount from bill line
+        Last word that looks like amount is used
         """
-        for word in line.split()[::-1]:
-            amount_match = re.match(
-                    '^([1-9]\d*[.,]\d+)(EUR|eur|€)?$', 
-                    word.strip())
-            if not amount_match:
-                logger.debug(
-                    'Word %s does not contain amount. '
-                    'Regex check failed' % word)
-                continue
-            amount = amount_match.group(1)
-            try:
-                return float(amount.replace(',', '.'))
-            except ValueError as e:
-                logger.debug(
-                    'Word %s does not contain amount. '
-                    'Original error: %s' % (word, e))
-        return None
+        amounts = AMOUNT_RE.findall(line)
+        if not amounts:
+            return None
+        return float(amounts[-1].replace(',', '.'))
 
     def _is_total_line(self, line):
         """
@@ -1,18 +1,15 @@
 """
 Test parser based on simple regex
 """
-import logging
-
 from .base import BaseParser
 
 
-logger = logging.getLogger(__name__)
-
-
 class TestParser(BaseParser):
     """
     Parse test check images with simple structure
     """
+    NAME = 'test_parser'
+    VERSION = 2
 
     def _process_line(self, line, *args, **kwargs):
         """
@@ -30,9 +27,9 @@ class TestParser(BaseParser):
             item = self._get_item_from_line(line)
             return item, False
         except ValueError as e:
-            logger.debug(
-                'Line "%s" does not have information about bill items. '
-                'Original error: %s' % (line, e))
+            if self._trace is not None:
+                self._trace.record(
+                    'not_item', line=line, reason=e.args[0])
             return None, False
 
     def _get_item_from_line(self, line):
@@ -55,10 +52,9 @@ class TestParser(BaseParser):
             try:
                 amount = float(word.replace(',', '.'))
                 break
-            except ValueError as e:
-                logger.debug(
-                    'Word %s does not contain amount. '
-                    'Original error: %s' % (word, e))
+            except ValueError:
+                # not amount - ok to skip
+                continue
         if amount is None:
             raise ValueError('Amount not found for item')
         return {
@@ -0,0 +1,33 @@
+"""
+Trace of parser decisions
+
+Parsers record events only when trace is passed to
+get_datetime_and_spendings_from_bill, so parsing without trace
+does not build any messages
+"""
+from collections import deque
+
+
+MAX_EVENTS = 500
+
+
+class ParseTrace(object):
+    """
+    Bounded buffer of parser decisions.
+    Only last max_events events are kept
+    """
+
+    def __init__(self, max_events=MAX_EVENTS):
+        self._events = deque(maxlen=max_events)
+
+    def record(self, event, **data):
+        """
+        Record parser decision.
+        Data should be json serializable
+        """
+        data['event'] = event
+        self._events.append(data)
+
+    @property
+    def events(self):
+        return list(self._events)
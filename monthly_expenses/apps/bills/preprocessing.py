@@ -0,0 +1,144 @@
+"""
+Prepare bills images for OCR
+
+Phone photos are much bigger than bills text needs.
+Images are decoded directly at reduced scale (JPEG draft mode),
+rotated according to EXIF orientation, converted to grayscale
+and binarized before they are passed to OCR engine.
+Every stage is configured with OCR_PREPROCESSING setting.
+"""
+import logging
+
+from django.conf import settings
+from PIL import Image
+
+
+logger = logging.getLogger(__name__)
+EXIF_ORIENTATION_TAG = 274
+# EXIF orientation -> transpose operations to fix it
+ORIENTATION_TRANSPOSES = {
+    2: (Image.FLIP_LEFT_RIGHT, ),
+    3: (Image.ROTATE_180, ),
+    4: (Image.FLIP_TOP_BOTTOM, ),
+    5: (Image.TRANSPOSE, ),
+    6: (Image.ROTATE_270, ),
+    7: (Image.TRANSVERSE, ),
+    8: (Image.ROTATE_90, ),
+}
+
+
+def decode(image_path, config):
+    """
+    Open image and decode it at the smallest scale
+    that keeps target dpi for bill of configured width.
+    Only JPEG images can be decoded at reduced scale
+    """
+    image = Image.open(image_path)
+    if config['target_dpi']:
+        min_side = int(
+            config['target_dpi'] * config['bill_width'])
+        image.draft(
+            'L' if config['grayscale'] else image.mode,
+            (min_side, min_side))
+    image.load()
+    return image
+
+
+def fix_orientation(image, config):
+    """
+    Rotate image according to EXIF orientation
+    """
+    if not config['fix_orientation']:
+        return image
+    orientation = _get_orientation(image)
+    for transpose in ORIENTATION_TRANSPOSES.get(orientation, ()):
+        image = image.transpose(transpose)
+    return image
+
+
+def to_grayscale(image, config):
+    """
+    Convert image to grayscale
+    """
+    if not config['grayscale'] or image.mode == 'L':
+        return image
+    return image.convert('L')
+
+
+def binarize(image, config):
+    """
+    Make pixels brighter than threshold white and others black.
+    Threshold is calculated with Otsu method if it's set to 'otsu'
+    """
+    threshold = config['threshold']
+    if threshold is None or image.mode != 'L':
+        return image
+    if threshold == 'otsu':
+        threshold = otsu_threshold(image.histogram())
+    return image.point(
+        [0] * (threshold + 1) + [255] * (255 - threshold))
+
+
+def otsu_threshold(histogram):
+    """
+    Find threshold that maximizes variance between
+    dark and bright pixels of grayscale image histogram
+    """
+    total = sum(histogram)
+    total_sum = sum(
+        value * count for value, count in enumerate(histogram))
+    dark_sum = 0
+    dark_weight = 0
+    max_variance = 0
+    threshold = 0
+    for value, count in enumerate(histogram):
+        dark_weight += count
+        if not dark_weight:
+            continue
+        bright_weight = total - dark_weight
+        if not bright_weight:
+            break
+        dark_sum += value * count
+        dark_mean = dark_sum / float(dark_weight)
+        bright_mean = (total_sum - dark_sum) / float(bright_weight)
+        variance = \
+            dark_weight * bright_weight * (dark_mean - bright_mean) ** 2
+        if variance > max_variance:
+            max_variance = variance
+            threshold = value
+    return threshold
+
+
+# stages run after image is decoded
+STAGES = (
+    fix_orientation,
+    to_grayscale,
+    binarize,
+)
+
+
+def open_image(image_path, config=None):
+    """
+    Open image and prepare it for OCR
+    Raises IOError if image can not be opened
+    """
+    config = config or settings.OCR_PREPROCESSING
+    image = decode(image_path, config)
+    for stage in STAGES:
+        image = stage(image, config)
+    return image
+
+
+def _get_orientation(image):
+    """
+    Get EXIF orientation of the image or None
+    """
+    try:
+        exif = image._getexif()
+    except (AttributeError, IndexError, KeyError, IOError):
+        logger.debug(
+            'Can not read EXIF of image %s' % image)
+        return None
+    if not exif:
+        return None
+    return exif.get(EXIF_ORIENTATION_TAG)
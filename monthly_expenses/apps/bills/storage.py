@@ -0,0 +1,59 @@
+"""
+Content addressed storage for bills images
+
+Images are stored under sha256 hash of their content
+in sharded directories: media/ab/cd/abcdef...jpg
+Identical images are stored once
+"""
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+IMAGES_DIR = 'media'
+# number of directories levels and length of directories names
+SHARD_LEVELS = 2
+SHARD_LENGTH = 2
+
+
+def get_content_addressed_name(sha256_hash_hex, filename):
+    """
+    Build sharded file name from content hash.
+    File extension is kept
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    shards = [
+        sha256_hash_hex[level * SHARD_LENGTH:(level + 1) * SHARD_LENGTH]
+        for level in range(SHARD_LEVELS)
+    ]
+    return os.path.join(
+        IMAGES_DIR, *(shards + [sha256_hash_hex + extension]))
+
+
+def bill_image_upload_to(bill, filename):
+    """
+    Store bill image under hash of its content.
+    Bill hash should be calculated before image is saved
+    """
+    return get_content_addressed_name(
+        bill.sha256_hash_hex, filename)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that does not write file
+    if file with the same name exists.
+    Should be used with names derived from file content
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is not None and self.exists(name):
+            # same content is already stored
+            return name
+        return super(ContentAddressedStorage, self).save(
+            name, content, max_length=max_length)
+
+
+bill_images_storage = ContentAddressedStorage()
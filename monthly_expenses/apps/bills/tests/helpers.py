@@ -39,6 +39,18 @@ class TestBillMixin(object):
                     content=content,
                     content_type='image/jpeg'))
 
+    def generate_image_content(
+            self, color=0):
+        """
+        Helper to generate small JPEG image of given color.
+        Images of different colors have different content
+        """
+        from io import BytesIO
+        from PIL import Image
+        image_file = BytesIO()
+        Image.new('L', (10, 10), color).save(image_file, 'JPEG')
+        return image_file.getvalue()
+
     def calculate_expected_hash(self):
         """
         Helper to calculate hash of predefined image
@@ -0,0 +1,87 @@
+"""
+Tests for bills parsers benchmarks
+"""
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from apps.bills.benchmarks import CORPUS_VERSION, load_corpus
+
+
+class BenchmarkParsersTestCase(TestCase):
+    """
+    Test parsers throughput benchmark
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.baselines_path = os.path.join(
+            self.tmp_dir, 'baselines.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_benchmark(self, **options):
+        call_command(
+            'benchmark_parsers',
+            parsers=['fi_parser'],
+            rounds=1,
+            repeat=1,
+            baselines=self.baselines_path,
+            stdout=StringIO(),
+            **options)
+
+    def write_baselines(self, relative_throughput):
+        with open(self.baselines_path, 'w') as baselines_file:
+            json.dump(
+                {
+                    CORPUS_VERSION: {
+                        'fi_parser': {
+                            'relative_throughput': relative_throughput,
+                            'bills_per_second': 1,
+                            'lines_per_second': 1
+                        }
+                    }
+                },
+                baselines_file)
+
+    def test_load_corpus__texts_loaded(self):
+        """
+        We load texts of the corpus version and of its base version
+        """
+        names = [name for name, _ in load_corpus()]
+        self.assertIn('fi_groceries', names)
+        self.assertIn('synthetic_long', names)
+        self.assertEqual(len(names), len(set(names)))
+
+    def test_save_baselines__baselines_saved(self):
+        """
+        We save measured throughput as baselines
+        """
+        self.run_benchmark(save_baselines=True)
+        with open(self.baselines_path) as baselines_file:
+            baselines = json.load(baselines_file)
+        self.assertTrue(
+            baselines[CORPUS_VERSION]['fi_parser']['relative_throughput'])
+
+    def test_throughput_lower_than_baseline__error_raised(self):
+        """
+        We fail if throughput relative to reference workload
+        is lower than baseline
+        """
+        self.write_baselines(10 ** 9)
+        with self.assertRaises(CommandError):
+            self.run_benchmark()
+
+    def test_throughput_close_to_baseline__no_error_raised(self):
+        """
+        We do not fail if relative throughput is not lower than baseline
+        """
+        self.write_baselines(10 ** -9)
+        self.run_benchmark()
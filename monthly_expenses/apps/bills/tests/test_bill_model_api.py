@@ -3,7 +3,7 @@ Tests for python API of apps.bills.models.Bill model
 """
 from mock import Mock, patch
 
-from apps.bills.models import Bill
+from apps.bills.models import Bill, ParseJob
 from apps.budgets.models import Category
 from .helpers import BillTestCase
 
@@ -57,12 +57,12 @@ class BillPythonAPITestCase(BillTestCase):
             bill.sha256_hash_hex, expected_hash)
 
     @patch(
-        'apps.bills.models.Image.open')
+        'apps.bills.models.open_image')
     @patch(
-        'apps.bills.models.image_to_string')
+        'apps.bills.models.image_to_text')
     def test_parse_bill__valid_data_returned(
             self, 
-            image_to_string_mock,
+            image_to_text_mock,
             open_mock):
         """
         We return valid datetime and sepndings when parse bill
@@ -74,7 +74,7 @@ class BillPythonAPITestCase(BillTestCase):
         from apps.bills.parsers import TestParser
         models.parser = TestParser()
 
-        image_to_string_mock.return_value = TEST_PARSED_TEXT
+        image_to_text_mock.return_value = TEST_PARSED_TEXT
         open_mock.return_value = Mock()
 
         bill = self.create_bill()
@@ -91,7 +91,7 @@ class BillPythonAPITestCase(BillTestCase):
                 ]})
 
     @patch(
-        'apps.bills.models.Image.open')
+        'apps.bills.models.open_image')
     def test_parse_bill__io_error_rerased_as_value_error(
             self, 
             open_mock):
@@ -104,6 +104,153 @@ class BillPythonAPITestCase(BillTestCase):
         with self.assertRaises(ValueError):
             bill.parse_bill()
 
+    @patch(
+        'apps.bills.models.open_image')
+    @patch(
+        'apps.bills.models.image_to_text')
+    def test_parse_bill__ocr_text_stored(
+            self,
+            image_to_text_mock,
+            open_mock):
+        """
+        We store raw OCR text of the bill
+        """
+        image_to_text_mock.return_value = TEST_PARSED_TEXT
+        bill = self.create_bill()
+        bill.parse_bill()
+        bill = Bill.objects.get(id=bill.id)
+        self.assertEqual(
+            bill.get_ocr_text(), TEST_PARSED_TEXT)
+        self.assertTrue(
+            len(bill.ocr_text) < len(TEST_PARSED_TEXT))
+
+    def test_parse_bill__parsed_items_stored(self):
+        """
+        We store parsed date and items as rows
+        and return them in format of parser results
+        """
+        bill = self.create_bill()
+        bill.parse_bill(bill_text=TEST_PARSED_TEXT)
+        bill = Bill.objects.get(id=bill.id)
+        self.assertEqual(
+            list(bill.parsed_items.values_list('name', 'quantity')),
+            [('HAIR DRYER', 1)])
+        self.assertEqual(
+            bill.get_parsed_data()['date'], '2017-07-04 00:00:00')
+
+    @patch('apps.bills.models.logger')
+    def test_save_long_item_name__truncation_logged(
+            self,
+            logger_mock):
+        """
+        We truncate too long names of parsed items
+        and log the truncation
+        """
+        from apps.bills.models import ParsedItem
+        name = 'A' * (ParsedItem.NAME_MAX_LENGTH + 10)
+        bill = self.create_bill()
+        bill.save_parsed_data({
+            'date': '2018-06-05 00:00:00',
+            'items': [
+                {'name': name, 'quantity': 1, 'amount': 1.0},
+                {'name': 'MILK', 'quantity': 1, 'amount': 1.0}
+            ]
+        })
+        self.assertEqual(
+            sorted(bill.parsed_items.values_list('name', flat=True)),
+            [name[:ParsedItem.NAME_MAX_LENGTH], 'MILK'])
+        self.assertEqual(logger_mock.warning.call_count, 1)
+        self.assertIn(
+            'bill %d' % bill.id,
+            logger_mock.warning.call_args[0][0])
+
+    def test_reparse_bill__parsed_items_replaced(self):
+        """
+        We replace previously parsed items when bill is reparsed
+        """
+        bill = self.create_bill()
+        bill.parse_bill(bill_text=TEST_PARSED_TEXT)
+        bill.parse_bill(reparse=True)
+        self.assertEqual(bill.parsed_items.count(), 1)
+
+    @patch(
+        'apps.bills.models.image_to_text')
+    def test_reparse_bill__ocr_not_run(
+            self,
+            image_to_text_mock):
+        """
+        We reparse bill from stored OCR text
+        """
+        from apps.bills import models
+        from apps.bills.parsers import TestParser
+        models.parser = TestParser()
+        bill = self.create_bill()
+        bill.parse_bill(bill_text=TEST_PARSED_TEXT)
+        bill_data = bill.parse_bill(reparse=True)
+        self.assertFalse(image_to_text_mock.called)
+        self.assertEqual(
+            bill_data['date'], '2017-07-04 00:00:00')
+
+    @patch(
+        'apps.bills.models.image_to_text')
+    def test_parse_bill_parsed_concurrently__ocr_not_run(
+            self,
+            image_to_text_mock):
+        """
+        We return result of concurrent parsing
+        instead of running OCR again
+        """
+        from apps.bills import models
+        from apps.bills.parsers import TestParser
+        models.parser = TestParser()
+        bill = self.create_bill()
+        concurrent_bill = Bill.objects.get(id=bill.id)
+        concurrent_bill.parse_bill(bill_text=TEST_PARSED_TEXT)
+        bill_data = bill.parse_bill()
+        self.assertFalse(image_to_text_mock.called)
+        self.assertEqual(
+            bill_data['date'], '2017-07-04 00:00:00')
+
+    @patch(
+        'apps.bills.models.image_to_text')
+    def test_parse_bill_failed_concurrently__error_raised(
+            self,
+            image_to_text_mock):
+        """
+        We raise error of concurrent parsing
+        instead of running OCR again
+        """
+        bill = self.create_bill()
+        concurrent_bill = Bill.objects.get(id=bill.id)
+        with self.assertRaises(ValueError):
+            concurrent_bill.parse_bill(bill_text='no date')
+        with self.assertRaisesRegexp(ValueError, 'No date found'):
+            bill.parse_bill()
+        self.assertFalse(image_to_text_mock.called)
+
+    def test_trace_parse__decisions_returned(self):
+        """
+        We return parser decisions for stored OCR text
+        """
+        from apps.bills import models
+        from apps.bills.parsers import TestParser
+        models.parser = TestParser()
+        bill = self.create_bill()
+        bill.set_ocr_text(TEST_PARSED_TEXT)
+        bill_data, error, events = bill.trace_parse()
+        self.assertIsNone(error)
+        self.assertNotIn('trace', bill_data)
+        self.assertIn(
+            'item', [event['event'] for event in events])
+
+    def test_trace_parse_without_ocr_text__error_raised(self):
+        """
+        We do not run OCR to trace parsing
+        """
+        bill = self.create_bill()
+        with self.assertRaises(ValueError):
+            bill.trace_parse()
+
     def test_category_linking_in_bulk__success(self):
         """
         We create categories to bill links in bulk
@@ -137,6 +284,94 @@ class BillPythonAPITestCase(BillTestCase):
                 }
             ])
 
+    def test_category_linking_in_bulk__categories_found_in_one_query(
+            self):
+        """
+        We find all linked categories with one query
+        """
+        categories = [
+            Category.objects.create(name='test-%d' % index)
+            for index in range(10)
+        ]
+        bill = self.create_bill()
+        # categories, savepoint, insert, savepoint release
+        with self.assertNumQueries(4):
+            bill.create_categories_in_bulk([
+                {
+                    'category': {
+                        'id': category.id,
+                    },
+                    'amount': 10
+                }
+                for category in categories
+            ])
+        self.assertEqual(bill.categories.count(), 10)
+
+    def test_update_categories_in_bulk__only_difference_written(
+            self):
+        """
+        We update changed amounts, create new links
+        and delete removed links keeping unchanged links
+        """
+        from apps.budgets.models import BillCategory
+        kept, changed, removed, added = [
+            Category.objects.create(name='test-%d' % index)
+            for index in range(4)
+        ]
+        bill = self.create_bill()
+        bill.create_categories_in_bulk([
+            {
+                'category': {
+                    'id': category.id,
+                },
+                'amount': 10
+            }
+            for category in (kept, changed, removed)
+        ])
+        link_ids = dict(
+            BillCategory.objects.values_list('category_id', 'id'))
+        bill.update_categories_in_bulk([
+            {
+                'category': {
+                    'id': category.id,
+                },
+                'amount': amount
+            }
+            for category, amount in ((kept, 10), (changed, 20), (added, 30))
+        ])
+        self.assertEqual(
+            dict(
+                BillCategory.objects.\
+                    filter(bill=bill).\
+                    values_list('category_id', 'amount')),
+            {
+                kept.id: 10,
+                changed.id: 20,
+                added.id: 30
+            })
+        self.assertTrue(
+            BillCategory.objects.filter(
+                id__in=[link_ids[kept.id], link_ids[changed.id]]).\
+                count() == 2)
+
+    def test_update_categories_in_bulk_not_changed__nothing_written(
+            self):
+        """
+        We only select existing links if nothing was changed
+        """
+        category = Category.objects.create(name='test')
+        bill = self.create_bill()
+        categories = [{
+            'category': {
+                'id': category.id,
+            },
+            'amount': 10
+        }]
+        bill.create_categories_in_bulk(categories)
+        # savepoint, links, savepoint release
+        with self.assertNumQueries(3):
+            bill.update_categories_in_bulk(categories)
+
     def test_category_linking_in_bulk__error_raised_for_duplicates(
             self):
         """
@@ -160,3 +395,208 @@ class BillPythonAPITestCase(BillTestCase):
                     'amount': 10
                 }
             ])
+
+
+class BillImageStorageTestCase(BillTestCase):
+    """
+    Test content addressed storage of bills images
+    """
+
+    def test_create_bill__image_stored_under_hash(self):
+        """
+        We store image in sharded directories under its hash
+        """
+        bill = self.create_bill()
+        expected_hash = self.calculate_expected_hash()
+        self.assertEqual(
+            bill.image.name,
+            'media/%s/%s/%s.jpg' % (
+                expected_hash[:2], expected_hash[2:4], expected_hash))
+
+    def test_save_existing_image__image_not_written(self):
+        """
+        We do not write image if the same content is already stored
+        """
+        from django.core.files.base import ContentFile
+        bill = self.create_bill()
+        with patch(
+                'django.core.files.storage.FileSystemStorage._save') \
+                as storage_save_mock:
+            name = bill.image.storage.save(
+                bill.image.name, ContentFile('test'))
+        self.assertEqual(name, bill.image.name)
+        self.assertFalse(storage_save_mock.called)
+
+    def test_delete_bill_with_shared_image__image_kept(self):
+        """
+        We do not delete image used by another bill
+        """
+        import os
+        bill = self.create_bill()
+        another_bill = self.create_bill(content='another image')
+        Bill.objects.filter(id=another_bill.id).update(
+            image=bill.image.name)
+        bill.delete()
+        self.assertTrue(
+            os.path.isfile(another_bill.image.storage.path(
+                bill.image.name)))
+
+    def test_delete_last_bill_with_image__image_deleted(self):
+        """
+        We delete image when last bill using it is deleted
+        """
+        import os
+        bill = self.create_bill()
+        image_path = bill.image.path
+        bill.delete()
+        self.assertFalse(os.path.isfile(image_path))
+
+
+class ContentAddressedImagesMigrationTestCase(BillTestCase):
+    """
+    Test migration of bills images to content addressed paths
+    """
+
+    def setUp(self):
+        import importlib
+        import shutil
+        import tempfile
+        from django.test import override_settings
+        self.migration = importlib.import_module(
+            'apps.bills.migrations.0007_content_addressed_images')
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # changes are commited at once
+        self.schema_editor = Mock()
+        self.schema_editor.connection.on_commit.side_effect = \
+            lambda callback: callback()
+        self.bill = self.create_bill()
+        self.duplicated_bill = self.create_bill(content='another image')
+        self.flat_name = 'media/test_check.jpg'
+        self.write_image(self.flat_name, self.bill.image.read())
+        Bill.objects.filter(id=self.duplicated_bill.id).update(
+            image=self.flat_name, sha256_hash_hex=None)
+
+    def write_image(self, name, content):
+        import os
+        path = self.bill.image.storage.path(name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as image_file:
+            image_file.write(content)
+
+    def migrate(self, backwards=False):
+        from django.apps import apps
+        if backwards:
+            self.migration.restore_images_old_paths(
+                apps, self.schema_editor)
+        else:
+            self.migration.move_images_to_content_addressed_paths(
+                apps, self.schema_editor)
+
+    def test_migrate_duplicated_image__existing_image_used(self):
+        """
+        We point bill to existing image with the same content
+        and do not set hash which is used by another bill
+        """
+        import os
+        self.migrate()
+        bill = Bill.objects.get(id=self.duplicated_bill.id)
+        self.assertEqual(bill.image.name, self.bill.image.name)
+        self.assertIsNone(bill.sha256_hash_hex)
+        self.assertFalse(os.path.isfile(
+            bill.image.storage.path(self.flat_name)))
+
+    def test_migrate_backwards__old_image_restored(self):
+        """
+        We restore image names bills had before migration
+        and keep image used by another bill
+        """
+        import os
+        self.migrate()
+        self.migrate(backwards=True)
+        bill = Bill.objects.get(id=self.duplicated_bill.id)
+        self.assertEqual(bill.image.name, self.flat_name)
+        self.assertTrue(os.path.isfile(bill.image.path))
+        self.assertTrue(os.path.isfile(
+            Bill.objects.get(id=self.bill.id).image.path))
+
+    def test_migrate_failed__old_image_kept(self):
+        """
+        We do not remove old images until migration is commited
+        """
+        import os
+        self.schema_editor.connection.on_commit.side_effect = None
+        self.migrate()
+        self.assertTrue(os.path.isfile(
+            self.bill.image.storage.path(self.flat_name)))
+
+
+class BillParseCacheTestCase(BillTestCase):
+    """
+    Test cache of OCR and parsing results shared between bills
+    """
+
+    def setUp(self):
+        from apps.bills import models
+        from apps.bills.parsers import TestParser
+        models.parser = TestParser()
+
+    def parse_recreated_bill(self):
+        """
+        Helper to parse bill, delete it and create
+        the same bill again
+        """
+        with patch('apps.bills.models.open_image'), \
+                patch('apps.bills.models.image_to_text') \
+                as image_to_text_mock:
+            image_to_text_mock.return_value = TEST_PARSED_TEXT
+            self.create_bill().parse_bill()
+        Bill.objects.all().delete()
+        return self.create_bill()
+
+    @patch('apps.bills.models.image_to_text')
+    def test_parse_recreated_bill__ocr_not_run(
+            self, image_to_text_mock):
+        """
+        We take parsing result of the same image from cache
+        """
+        bill = self.parse_recreated_bill()
+        bill_data = bill.parse_bill()
+        self.assertFalse(image_to_text_mock.called)
+        self.assertEqual(
+            bill_data['date'], '2017-07-04 00:00:00')
+
+    @patch('apps.bills.models.image_to_text')
+    def test_parse_with_new_parser_version__only_parser_run(
+            self, image_to_text_mock):
+        """
+        We do not take parsing result of other parser version
+        from cache, but reuse OCR text
+        """
+        from apps.bills import models
+        bill = self.parse_recreated_bill()
+        models.parser.VERSION = models.parser.VERSION + 1
+        try:
+            bill_data = bill.parse_bill()
+        finally:
+            del models.parser.VERSION
+        self.assertFalse(image_to_text_mock.called)
+        self.assertEqual(
+            bill_data['items'][0]['name'], 'HAIR DRYER')
+
+    def test_get_parse_status_of_recreated_bill__parsed_data_returned(
+            self):
+        """
+        We return parsed data from cache without scheduling parsing
+        """
+        bill = self.parse_recreated_bill()
+        parse_status, data, _ = bill.get_parse_status()
+        self.assertEqual(parse_status, 'done')
+        self.assertEqual(
+            data['date'], '2017-07-04 00:00:00')
+        self.assertFalse(
+            ParseJob.objects.filter(bill=bill).exists())
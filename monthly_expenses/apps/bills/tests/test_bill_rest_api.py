@@ -1,6 +1,8 @@
 """
 Test for REST API for bills
 """
+from mock import patch
+
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.urlresolvers import reverse
 from django.test import TestCase
@@ -75,6 +77,17 @@ class UploadBillRestAPITest(BillTestCase):
                 'bill': bill.id,
             })
 
+    def test_upload_bill__parsing_scheduled(self):
+        """
+        We schedule parsing of uploaded bill
+        """
+        from apps.bills.models import ParseJob
+        response = self.upload_bill()
+        self.assertTrue(
+            ParseJob.objects.filter(
+                bill_id=response.data['bill'],
+                status=ParseJob.PENDING).exists())
+
     def test_upload_bill_already_exists__existing_bill_returned(self):
         """
         We return existing bill if bill was already uploaded
@@ -97,6 +110,34 @@ class UploadBillRestAPITest(BillTestCase):
             response.status_code,
             status.HTTP_200_OK)
 
+    @patch('apps.bills.api.generate_hash_from_image')
+    @patch('apps.bills.models.generate_hash_from_image')
+    def test_upload_bill__hash_calculated_on_upload(
+            self,
+            model_generate_hash_mock,
+            api_generate_hash_mock):
+        """
+        We calculate image hash while upload is received
+        and do not read saved image again
+        """
+        self.upload_bill()
+        self.assertFalse(model_generate_hash_mock.called)
+        self.assertFalse(api_generate_hash_mock.called)
+        self.assertTrue(
+            Bill.objects.filter(
+                sha256_hash_hex=self.calculate_expected_hash()).exists())
+
+    def test_upload_bill_already_exists__image_not_saved(self):
+        """
+        We do not write duplicated image to disk
+        """
+        self.create_bill()
+        with patch(
+                'django.core.files.storage.FileSystemStorage.save') \
+                as storage_save_mock:
+            self.upload_bill()
+        self.assertFalse(storage_save_mock.called)
+
     def test_not_authenticated_tries_load_bill__error_returned(self):
         """
         We return 403 forbidden if user is not logged in
@@ -456,22 +497,17 @@ class ListBillRestAPITest(BillTestCase):
 
     def list_bills(
             self, auth_needed=True,
-            only_uncategorised=False):
+            only_uncategorised=False, **params):
         """
         Helper to upload bill via api
         """
         if auth_needed:
             self.client.force_login(self.user)
-        client_args = []
         if only_uncategorised:
-            client_args = [
-                {
-                    'uncategorised': True
-                }
-            ]
+            params['uncategorised'] = True
         return self.client.get(
             reverse('bill'),
-            *client_args)
+            params)
 
     def test_list_bill__successfull_response(self):
         """
@@ -531,6 +567,87 @@ class ListBillRestAPITest(BillTestCase):
         self.assertListEqual(
             response.data, [])
 
+    def test_list_bills_by_pages__all_bills_returned_once(self):
+        """
+        We return bills in upload order page by page
+        following the next page url
+        """
+        bills = [self.bill] + [
+            self.create_bill(content=self.generate_image_content(color))
+            for color in range(10, 50, 10)
+        ]
+        response = self.list_bills(limit=2)
+        listed_ids = []
+        while True:
+            listed_ids.extend(
+                bill['id'] for bill in response.data['results'])
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertListEqual(
+            listed_ids, [bill.id for bill in bills])
+
+    def test_list_bills_created_at_same_time__all_bills_returned(self):
+        """
+        We do not skip bills with the same upload time
+        on the page border
+        """
+        bills = [self.bill] + [
+            self.create_bill(content=self.generate_image_content(color))
+            for color in range(10, 30, 10)
+        ]
+        Bill.objects.update(create_time=self.bill.create_time)
+        first_page = self.list_bills(limit=2)
+        second_page = self.client.get(first_page.data['next'])
+        self.assertListEqual(
+            [
+                bill['id'] for bill in
+                first_page.data['results'] + second_page.data['results']
+            ],
+            [bill.id for bill in bills])
+
+    def test_list_bills_with_limit__page_returned(self):
+        """
+        We return only first bills and url of the next page
+        if limit is passed
+        """
+        self.create_bill(content=self.generate_image_content(10))
+        response = self.list_bills(limit=1)
+        self.assertListEqual(
+            [bill['id'] for bill in response.data['results']],
+            [self.bill.id])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_list_bills_invalid_cursor__not_found_returned(self):
+        """
+        We return 404 if cursor can not be decoded
+        """
+        response = self.list_bills(limit=1, cursor='invalid')
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_404_NOT_FOUND)
+
+    def test_list_bills__number_of_queries_does_not_grow(self):
+        """
+        We list bills with categories flag in one query
+        """
+        from apps.budgets.models import BillCategory
+        self.create_categories_for_bill(self.bill)
+        category_to_bill = BillCategory.objects.first()
+        for color in range(10, 60, 10):
+            bill = self.create_bill(
+                content=self.generate_image_content(color))
+            BillCategory.objects.create(
+                bill=bill,
+                category=category_to_bill.category,
+                amount=10)
+        self.client.force_login(self.user)
+        # session, user and bills
+        with self.assertNumQueries(3):
+            response = self.list_bills(auth_needed=False)
+        self.assertEqual(
+            len(response.data), 6)
+
     def test_not_authenticated_tries_to_list_bills__error_returned(self):
         """
         We return 403 forbidden if user is not logged in
@@ -540,3 +657,236 @@ class ListBillRestAPITest(BillTestCase):
         self.assertEqual(
             response.status_code,
             status.HTTP_403_FORBIDDEN)
+
+
+class BulkUploadBillsRestAPITest(BillTestCase):
+    """
+    Test rest api endpoint for uploading bills in bulk
+    """
+    def setUp(self):
+        self.user = self.get_or_create_user()
+        self.client.force_login(self.user)
+
+    def make_image(
+            self, name, content):
+        return SimpleUploadedFile(
+            name=name,
+            content=content,
+            content_type='image/jpeg')
+
+    def make_archive(
+            self, files):
+        """
+        Helper to pack files to zip archive
+        """
+        import zipfile
+        from io import BytesIO
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as archive_file:
+            for name, content in files:
+                archive_file.writestr(name, content)
+        return SimpleUploadedFile(
+            name='bills.zip',
+            content=archive.getvalue(),
+            content_type='application/zip')
+
+    def test_bulk_upload__bills_created(self):
+        """
+        We create bill for every uploaded image
+        """
+        response = self.client.post(
+            reverse('bulk-upload-bills'),
+            {
+                'images': [
+                    self.make_image(
+                        'first.jpg', self.generate_image_content(0)),
+                    self.make_image(
+                        'second.jpg', self.generate_image_content(255))
+                ]
+            },
+            format='multipart')
+        self.assertEqual(
+            response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [
+                (bill['name'], bill['created'])
+                for bill in response.data['bills']
+            ],
+            [('first.jpg', True), ('second.jpg', True)])
+        self.assertEqual(
+            set(Bill.objects.filter(user=self.user).
+                values_list('id', flat=True)),
+            set(bill['bill'] for bill in response.data['bills']))
+
+    def test_bulk_upload_existing_and_duplicated__existing_bill_returned(
+            self):
+        """
+        We do not create bills for already uploaded images
+        and for images repeated in the same request
+        """
+        bill = self.create_bill(user=self.user)
+        response = self.client.post(
+            reverse('bulk-upload-bills'),
+            {
+                'images': [
+                    self.make_image(
+                        'existing.jpg', DEFAULT_CHECK_IMAGE),
+                    self.make_image(
+                        'new.jpg', self.generate_image_content()),
+                    self.make_image(
+                        'new_again.jpg', self.generate_image_content())
+                ]
+            },
+            format='multipart')
+        bills = response.data['bills']
+        self.assertEqual(
+            [(b['created'], b['bill']) for b in bills[:1]],
+            [(False, bill.id)])
+        self.assertEqual(
+            [b['created'] for b in bills[1:]], [True, False])
+        self.assertEqual(bills[1]['bill'], bills[2]['bill'])
+        self.assertEqual(Bill.objects.count(), 2)
+
+    def test_bulk_upload__parsing_scheduled(self):
+        """
+        We schedule parsing of created bills
+        """
+        from apps.bills.models import ParseJob
+        response = self.client.post(
+            reverse('bulk-upload-bills'),
+            {
+                'images': [
+                    self.make_image(
+                        'first.jpg', self.generate_image_content(0)),
+                    self.make_image(
+                        'second.jpg', self.generate_image_content(255))
+                ]
+            },
+            format='multipart')
+        self.assertEqual(
+            set(ParseJob.objects.values_list('bill_id', flat=True)),
+            set(bill['bill'] for bill in response.data['bills']))
+
+    def test_bulk_upload_nothing_created__ok_response(self):
+        """
+        We return 200 when all images were already uploaded
+        """
+        self.create_bill(user=self.user)
+        response = self.client.post(
+            reverse('bulk-upload-bills'),
+            {
+                'images': [
+                    self.make_image('existing.jpg', DEFAULT_CHECK_IMAGE)
+                ]
+            },
+            format='multipart')
+        self.assertEqual(
+            response.status_code, status.HTTP_200_OK)
+
+    def test_bulk_upload_archive__bills_created(self):
+        """
+        We create bills for images packed to zip archive
+        """
+        response = self.client.post(
+            reverse('bulk-upload-bills'),
+            {
+                'archive': self.make_archive([
+                    ('bills/first.jpg', self.generate_image_content(0)),
+                    ('bills/second.jpg', self.generate_image_content(255))
+                ])
+            },
+            format='multipart')
+        self.assertEqual(
+            response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [bill['name'] for bill in response.data['bills']],
+            ['first.jpg', 'second.jpg'])
+        self.assertEqual(Bill.objects.count(), 2)
+
+    def test_bulk_upload_archive_with_not_image__bad_request(self):
+        """
+        We do not create any bill when archive contains not image
+        """
+        response = self.client.post(
+            reverse('bulk-upload-bills'),
+            {
+                'archive': self.make_archive([
+                    ('first.jpg', self.generate_image_content()),
+                    ('notes.txt', b'not an image')
+                ])
+            },
+            format='multipart')
+        self.assertEqual(
+            response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Bill.objects.exists())
+
+    @patch('apps.bills.api.BULK_UPLOAD_MAX_ARCHIVE_SIZE', 100)
+    def test_bulk_upload_too_big_archive__bad_request(self):
+        """
+        We limit total size of extracted archive members
+        """
+        response = self.client.post(
+            reverse('bulk-upload-bills'),
+            {
+                'archive': self.make_archive([
+                    ('first.jpg', self.generate_image_content(0)),
+                    ('second.jpg', self.generate_image_content(255))
+                ])
+            },
+            format='multipart')
+        self.assertEqual(
+            response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Bill.objects.exists())
+
+    def test_bulk_upload_archive_with_wrong_sizes__bad_request(self):
+        """
+        We do not trust member sizes declared in archive headers
+        """
+        import struct
+        archive = self.make_archive([
+            ('first.jpg', self.generate_image_content(0))
+        ])
+        content = archive.read()
+        # declare 10 bytes in local and central directory headers
+        for signature, offset in [
+                (b'PK\x03\x04', 22), (b'PK\x01\x02', 24)]:
+            position = content.index(signature) + offset
+            content = content[:position] + struct.pack('<I', 10) + \
+                content[position + 4:]
+        response = self.client.post(
+            reverse('bulk-upload-bills'),
+            {
+                'archive': SimpleUploadedFile(
+                    name='bills.zip',
+                    content=content,
+                    content_type='application/zip')
+            },
+            format='multipart')
+        self.assertEqual(
+            response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Bill.objects.exists())
+
+    def test_bulk_upload_without_images__bad_request(self):
+        """
+        We return 400 when no images are passed
+        """
+        response = self.client.post(
+            reverse('bulk-upload-bills'), {}, format='multipart')
+        self.assertEqual(
+            response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_upload_not_authenticated__forbidden(self):
+        """
+        We allow bulk upload only for authenticated users
+        """
+        self.client.logout()
+        response = self.client.post(
+            reverse('bulk-upload-bills'),
+            {
+                'images': [
+                    self.make_image('first.jpg', DEFAULT_CHECK_IMAGE)
+                ]
+            },
+            format='multipart')
+        self.assertEqual(
+            response.status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,72 @@
+"""
+Test admin of bills
+"""
+from mock import patch
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from rest_framework import status
+
+from apps.bills.models import ParsedItem
+from .helpers import BillTestCase
+
+
+class BillAdminTestCase(BillTestCase):
+    """
+    Test that bill is parsed for trace only on request
+    """
+
+    def setUp(self):
+        self.bill = self.create_bill()
+        self.client.force_login(
+            User.objects.create_superuser(
+                'admin', 'admin@test.com', 'password'))
+
+    @patch('apps.bills.models.Bill.trace_parse')
+    def test_open_bill__trace_not_parsed(self, trace_parse_mock):
+        """
+        We show only link to parse trace on bill page
+        """
+        response = self.client.get(
+            reverse('admin:bills_bill_change', args=(self.bill.id, )))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(
+            response,
+            reverse('admin:bills_bill_parse_trace', args=(self.bill.id, )))
+        self.assertFalse(trace_parse_mock.called)
+
+    @patch('apps.bills.models.Bill.trace_parse')
+    def test_open_parse_trace__parser_decisions_shown(
+            self,
+            trace_parse_mock):
+        """
+        We parse bill and show parser decisions on parse trace page
+        """
+        trace_parse_mock.return_value = (
+            None, 'No items found',
+            [{'event': 'date_found', 'line': 1}])
+        response = self.client.get(
+            reverse('admin:bills_bill_parse_trace', args=(self.bill.id, )))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, 'date_found')
+        self.assertContains(response, 'No items found')
+
+    def test_open_parse_trace_of_missing_bill__not_found(self):
+        """
+        We return not found for parse trace of missing bill
+        """
+        response = self.client.get(
+            reverse('admin:bills_bill_parse_trace', args=(0, )))
+        self.assertEqual(
+            response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_change_bill__parsed_items_not_added(self):
+        """
+        We do not allow to add parsed items in admin
+        """
+        response = self.client.get(
+            reverse('admin:bills_bill_change', args=(self.bill.id, )))
+        formsets = dict(
+            (inline_formset.opts.model, inline_formset.formset)
+            for inline_formset in response.context['inline_admin_formsets'])
+        self.assertEqual(formsets[ParsedItem].max_num, 0)
@@ -3,12 +3,21 @@
 Test set for finnish checks parser
 """
 from unittest import skip
+from mock import patch
 
 from django.test import TestCase
 
+from apps.bills.parsers.trace import ParseTrace
 from apps.bills.parsers.fi import FIParser
 
 
+BILL_TEXT = """
+ALEPA 06-06-2018
+NECTARINE RASIA ALPINE              2.85
+YHTEENSA                            2.85
+"""
+
+
 class FIParserTestCase(TestCase):
     """
     Test parsing of different types of checks
@@ -265,3 +274,102 @@ class FIParserTestCase(TestCase):
         }
         self.compare_parsing_result_and_expected_result(
             CHECK, EXPECTED_RESULT) 
+
+
+class FindDateTestCase(TestCase):
+    """
+    Test search of the bill date
+    """
+
+    def setUp(self):
+        self.parser = FIParser()
+
+    def test_date_with_time__time_returned(self):
+        """
+        We use time that follows the date
+        """
+        self.assertEqual(
+            self.parser._find_date(
+                ['KASSA', '03.04.18', '12:30', 'RE']),
+            '2018-04-03 12:30:00')
+
+    def test_iso_date__date_returned(self):
+        """
+        We recognize ISO dates
+        """
+        self.assertEqual(
+            self.parser._find_date(['2018-06-05']),
+            '2018-06-05 00:00:00')
+
+    def test_invalid_date__next_date_returned(self):
+        """
+        We skip words that look like date but are not valid dates
+        """
+        self.assertEqual(
+            self.parser._find_date(['31.02.2018', '28-02-2018']),
+            '2018-02-28 00:00:00')
+
+    @patch('dateutil.parser.parse')
+    def test_date_in_known_format__dateutil_not_used(
+            self, parse_mock):
+        """
+        We do not parse words with dateutil
+        if date in known format is found
+        """
+        self.parser._find_date(
+            ['Mastercard', 'CUSTOMER', '28.03.2018'])
+        self.assertFalse(parse_mock.called)
+
+    def test_date_in_other_format__date_returned(self):
+        """
+        We parse words in other formats by dateutil
+        """
+        self.assertEqual(
+            self.parser._find_date(['KASSA', '5.June.2018']),
+            '2018-06-05 00:00:00')
+
+    def test_no_date__error_raised(self):
+        """
+        We raise ValueError if bill does not have date
+        """
+        with self.assertRaises(ValueError):
+            self.parser._find_date(['KASSA', 'Mastercard'])
+
+
+class ParseTraceTestCase(TestCase):
+    """
+    Test recording of parser decisions
+    """
+
+    def setUp(self):
+        self.parser = FIParser()
+
+    def test_parse_with_trace__decisions_returned(self):
+        """
+        We return recorded decisions with parsing result
+        """
+        result = self.parser.get_datetime_and_spendings_from_bill(
+            BILL_TEXT, trace=ParseTrace())
+        self.assertEqual(
+            [event['event'] for event in result['trace']],
+            ['date', 'not_item', 'item', 'total'])
+
+    def test_parse_without_trace__no_trace_returned(self):
+        """
+        We do not record decisions if trace is not passed
+        """
+        result = self.parser.get_datetime_and_spendings_from_bill(
+            BILL_TEXT)
+        self.assertNotIn('trace', result)
+        self.assertIsNone(self.parser._trace)
+
+    def test_trace__only_last_events_kept(self):
+        """
+        We keep limited number of events
+        """
+        trace = ParseTrace(max_events=2)
+        self.parser.get_datetime_and_spendings_from_bill(
+            BILL_TEXT, trace=trace)
+        self.assertEqual(
+            [event['event'] for event in trace.events],
+            ['item', 'total'])
@@ -0,0 +1,40 @@
+"""
+Tests for OCR engines
+"""
+from mock import patch
+
+from django.test import TestCase
+
+from apps.bills import ocr
+
+
+class OCRPoolTestCase(TestCase):
+    """
+    Test parallel text extraction from images
+    """
+
+    def test_not_existing_image__error_returned(self):
+        """
+        We return error instead of raising it from pool worker
+        """
+        self.assertEqual(
+            ocr._image_file_to_text('/not/existing/image.jpg'),
+            (None, 'File not found'))
+
+    @patch('apps.bills.ocr.open_image')
+    @patch('apps.bills.ocr.image_to_text')
+    def test_images_to_text__texts_returned_in_order(
+            self, image_to_text_mock, open_mock):
+        """
+        We return texts in order of passed images
+        """
+        open_mock.side_effect = lambda path: path
+        image_to_text_mock.side_effect = lambda image: 'text of %s' % image
+        with ocr.OCRPool(processes=2) as pool:
+            self.assertEqual(
+                pool.images_to_text(['a', 'b', 'c']),
+                [
+                    ('text of a', None),
+                    ('text of b', None),
+                    ('text of c', None)
+                ])
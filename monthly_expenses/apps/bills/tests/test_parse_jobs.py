@@ -0,0 +1,457 @@
+"""
+Tests for background parsing of bills
+"""
+import json
+from mock import patch
+
+from django.core.management import call_command
+from django.utils.six import StringIO
+from django.core.urlresolvers import reverse
+from rest_framework import status
+
+from apps.bills.models import Bill, ParseJob
+from .helpers import BillTestCase
+
+
+TEST_PARSED_DATA = {
+    'date': '2018-06-05 00:00:00',
+    'items': [
+        {
+            'name': 'test-1',
+            'amount': 10.0,
+            'quantity': 1
+        }
+    ]
+}
+
+
+class ParseJobQueueTestCase(BillTestCase):
+    """
+    Test python api of parsing queue
+    """
+
+    def setUp(self):
+        self.bill = self.create_bill()
+
+    def test_schedule_bill__job_created(self):
+        """
+        We create pending job when bill is scheduled for parsing
+        """
+        job = ParseJob.objects.schedule(self.bill)
+        self.assertEqual(job.status, ParseJob.PENDING)
+
+    def test_schedule_bill_twice__existing_job_returned(self):
+        """
+        We do not create second job for already scheduled bill
+        """
+        job = ParseJob.objects.schedule(self.bill)
+        self.assertEqual(
+            ParseJob.objects.schedule(self.bill).id, job.id)
+
+    def test_acquire_jobs__jobs_marked_as_processing(self):
+        """
+        We mark acquired jobs as processing
+        so they are not acquired by other workers
+        """
+        ParseJob.objects.schedule(self.bill)
+        jobs = ParseJob.objects.acquire(10)
+        self.assertEqual(len(jobs), 1)
+        self.assertFalse(ParseJob.objects.acquire(10))
+        self.assertTrue(
+            ParseJob.objects.filter(
+                status=ParseJob.PROCESSING,
+                attempts=1).exists())
+
+    def test_acquire_jobs__stuck_jobs_acquired(self):
+        """
+        We retry jobs that are processed for too long
+        """
+        ParseJob.objects.schedule(self.bill)
+        with self.settings(PARSE_JOB_TIMEOUT=-1):
+            ParseJob.objects.acquire(10)
+            self.assertEqual(
+                len(ParseJob.objects.acquire(10)), 1)
+
+    def test_acquire_jobs__job_without_attempts_left_failed(self):
+        """
+        We fail stuck job instead of retrying it
+        when it has no attempts left
+        """
+        ParseJob.objects.schedule(self.bill)
+        with self.settings(
+                PARSE_JOB_TIMEOUT=-1, PARSE_JOB_MAX_ATTEMPTS=2):
+            self.assertEqual(len(ParseJob.objects.acquire(10)), 1)
+            self.assertEqual(len(ParseJob.objects.acquire(10)), 1)
+            self.assertFalse(ParseJob.objects.acquire(10))
+        job = ParseJob.objects.get(bill=self.bill)
+        self.assertEqual(job.status, ParseJob.FAILED)
+        self.assertEqual(job.error, ParseJob.TOO_MANY_ATTEMPTS_ERROR)
+
+    def test_reparse_failed_job__attempts_restarted(self):
+        """
+        We give all attempts to the job scheduled for reparsing
+        """
+        ParseJob.objects.schedule(self.bill)
+        ParseJob.objects.filter(bill=self.bill).update(
+            status=ParseJob.FAILED, attempts=3)
+        job = ParseJob.objects.schedule(self.bill, reparse=True)
+        self.assertEqual(job.attempts, 0)
+
+    def test_record_first_view__only_first_view_recorded(self):
+        """
+        We record if bill was parsed only on first view
+        """
+        ParseJob.objects.schedule(self.bill)
+        ParseJob.objects.record_first_view(self.bill, 'pending')
+        ParseJob.objects.record_first_view(self.bill, 'done')
+        self.assertEqual(
+            ParseJob.objects.get_first_view_stats(),
+            {
+                'hits': 0,
+                'misses': 1
+            })
+
+    def test_first_view_stats__hits_and_misses_counted(self):
+        """
+        We count bills parsed and not parsed by first view
+        """
+        ParseJob.objects.schedule(self.bill)
+        ParseJob.objects.record_first_view(self.bill, 'done')
+        other_bill = self.create_bill(
+            content=self.generate_image_content())
+        ParseJob.objects.schedule(other_bill)
+        ParseJob.objects.record_first_view(other_bill, 'failed')
+        self.assertEqual(
+            ParseJob.objects.get_first_view_stats(),
+            {
+                'hits': 2,
+                'misses': 0
+            })
+
+    @patch('apps.bills.models.Bill.parse_bill')
+    def test_run_job__done_status_saved(
+            self, parse_bill_mock):
+        """
+        We mark job as done if bill was parsed
+        """
+        parse_bill_mock.return_value = TEST_PARSED_DATA
+        job = ParseJob.objects.schedule(self.bill)
+        job.run()
+        job.refresh_from_db()
+        self.assertEqual(job.status, ParseJob.DONE)
+
+    @patch('apps.bills.models.Bill.parse_bill')
+    def test_run_job__parsing_error_saved(
+            self, parse_bill_mock):
+        """
+        We save parsing error if bill can not be parsed
+        """
+        parse_bill_mock.side_effect = ValueError('No date found')
+        job = ParseJob.objects.schedule(self.bill)
+        job.run()
+        job.refresh_from_db()
+        self.assertEqual(job.status, ParseJob.FAILED)
+        self.assertEqual(job.error, 'No date found')
+
+    @patch('apps.bills.models.Bill.parse_bill')
+    def test_process_parse_jobs_command__bills_parsed(
+            self, parse_bill_mock):
+        """
+        Worker command parses all scheduled bills
+        """
+        parse_bill_mock.return_value = TEST_PARSED_DATA
+        ParseJob.objects.schedule(self.bill)
+        call_command(
+            'process_parse_jobs', once=True, processes=0)
+        self.assertTrue(parse_bill_mock.called)
+        self.assertTrue(
+            ParseJob.objects.filter(
+                bill=self.bill,
+                status=ParseJob.DONE).exists())
+
+    @patch(
+        'apps.bills.management.commands.process_parse_jobs.OCRPool')
+    def test_process_parse_jobs_command_ocr_failed__bill_failed(
+            self, pool_mock):
+        """
+        We save OCR error of the pool as parsing error of the bill,
+        so the bill is not sent to OCR again
+        """
+        from apps.bills import models
+        pool_mock.return_value.processes = 1
+        pool_mock.return_value.images_to_text.return_value = [
+            (None, 'File not found')]
+        job = ParseJob.objects.schedule(self.bill)
+        call_command(
+            'process_parse_jobs', once=True, processes=1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ParseJob.FAILED)
+        bill = Bill.objects.get(id=self.bill.id)
+        self.assertEqual(bill.parse_error, 'File not found')
+        self.assertEqual(
+            bill.parser_version, models.parser.get_version())
+        self.assertEqual(
+            bill.get_parse_status(),
+            ('failed', None, 'File not found'))
+        self.assertEqual(
+            ParseJob.objects.filter(bill=self.bill).count(), 1)
+
+
+class ParseFailureTestCase(BillTestCase):
+    """
+    Test saving of parsing failures
+    """
+
+    def setUp(self):
+        from apps.bills import models
+        from apps.bills.parsers import TestParser
+        models.parser = TestParser()
+        self.bill = self.create_bill()
+
+    def test_parse_bill_failed__error_saved(self):
+        """
+        We save parsing error and parser version
+        """
+        from apps.bills import models
+        with self.assertRaises(ValueError):
+            self.bill.parse_bill(bill_text='no date')
+        self.bill.refresh_from_db()
+        self.assertEqual(self.bill.parse_error, 'No date found')
+        self.assertEqual(
+            self.bill.parser_version, models.parser.get_version())
+
+    def test_reparse_bill_failed__error_returned(self):
+        """
+        We return parsing error instead of previous results
+        if reparsing of the bill failed
+        """
+        self.bill.save_parsed_data(TEST_PARSED_DATA)
+        with self.assertRaises(ValueError):
+            self.bill.parse_bill(reparse=True, bill_text='no date')
+        bill = Bill.objects.get(id=self.bill.id)
+        self.assertEqual(
+            bill.get_parse_status(),
+            ('failed', None, 'No date found'))
+        self.assertFalse(bill.parsed_items.exists())
+
+    def test_get_parse_status_after_parser_update__reparse_scheduled(
+            self):
+        """
+        We parse failed bill again if parser was changed
+        """
+        self.bill.parse_error = 'No date found'
+        self.bill.parser_version = 'test_parser:0'
+        self.bill.save()
+        ParseJob.objects.create(
+            bill=self.bill,
+            status=ParseJob.FAILED,
+            error='No date found')
+        parse_status, _, _ = self.bill.get_parse_status()
+        self.assertEqual(parse_status, 'pending')
+        self.assertTrue(
+            ParseJob.objects.filter(
+                bill=self.bill,
+                status=ParseJob.PENDING,
+                reparse=True).exists())
+
+
+class BillParseStatusRestAPITest(BillTestCase):
+    """
+    Test rest api endpoint for polling parsing status
+    """
+
+    def setUp(self):
+        self.user = self.get_or_create_user()
+        self.bill = self.create_bill(user=self.user)
+
+    def get_parse_status(
+            self, auth_needed=True):
+        if auth_needed:
+            self.client.force_login(self.user)
+        return self.client.get(
+            reverse(
+                'bill-parse-status',
+                kwargs={
+                    'bill_id': self.bill.id
+                }))
+
+    def test_not_parsed_bill__pending_status_returned(self):
+        """
+        We return pending status for bill that is not parsed yet
+        """
+        response = self.get_parse_status()
+        self.assertDictEqual(
+            response.data,
+            {
+                'bill': self.bill.id,
+                'status': 'pending',
+                'error': None
+            })
+
+    def test_parsed_bill__done_status_returned(self):
+        """
+        We return done status for parsed bill
+        """
+        self.bill.save_parsed_data(TEST_PARSED_DATA)
+        response = self.get_parse_status()
+        self.assertEqual(
+            response.data['status'], 'done')
+
+    def test_failed_bill__error_returned(self):
+        """
+        We return parsing error if parsing failed
+        """
+        ParseJob.objects.create(
+            bill=self.bill,
+            status=ParseJob.FAILED,
+            error='No items found')
+        response = self.get_parse_status()
+        self.assertDictEqual(
+            response.data,
+            {
+                'bill': self.bill.id,
+                'status': 'failed',
+                'error': 'No items found'
+            })
+
+    def test_reparse_failed_bill__pending_status_returned(self):
+        """
+        We schedule parsing of failed bill again on request
+        """
+        from apps.bills import models
+        self.bill.parse_error = 'No items found'
+        self.bill.parser_version = models.parser.get_version()
+        self.bill.save()
+        ParseJob.objects.create(
+            bill=self.bill,
+            status=ParseJob.FAILED,
+            error='No items found')
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse(
+                'bill-parse-status',
+                kwargs={
+                    'bill_id': self.bill.id
+                }))
+        self.assertEqual(
+            response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(
+            self.get_parse_status().data['status'], 'pending')
+        self.assertTrue(
+            ParseJob.objects.filter(
+                bill=self.bill,
+                status=ParseJob.PENDING,
+                reparse=True).exists())
+
+    def test_not_authenticated__error_returned(self):
+        """
+        We return 403 forbidden if user is not logged in
+        """
+        response = self.get_parse_status(
+            auth_needed=False)
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_403_FORBIDDEN)
+
+
+class ReparseBillsTestCase(BillTestCase):
+    """
+    Test reparsing of bills parsed by older parser version
+    """
+
+    def setUp(self):
+        from apps.bills import models
+        from apps.bills.parsers import TestParser
+        models.parser = TestParser()
+        self.bill = self.create_bill()
+        self.bill.save_parsed_data(TEST_PARSED_DATA)
+        self.bill.parser_version = 'test_parser:0'
+        self.bill.set_ocr_text('ITEM 1 10.00\nTOTAL 10.00\n04.07.17')
+        self.bill.save()
+
+    def test_stale_bills__only_older_versions_returned(self):
+        """
+        We select bills parsed by other parser version
+        and do not select bills that were never parsed
+        """
+        from apps.bills import models
+        Bill.objects.filter(id=self.bill.id).update(
+            parser_version=models.parser.get_version())
+        stale_bill = self.create_bill(
+            content=self.generate_image_content())
+        Bill.objects.filter(id=stale_bill.id).update(
+            parser_version='test_parser:0')
+        self.create_bill(
+            content=self.generate_image_content(color=255))
+        self.assertEqual(
+            list(Bill.objects.stale()), [stale_bill])
+
+    def test_schedule_reparse__existing_job_restarted(self):
+        """
+        We restart finished job for bill scheduled for reparsing
+        """
+        ParseJob.objects.create(
+            bill=self.bill, status=ParseJob.DONE)
+        ParseJob.objects.schedule_reparse([self.bill])
+        self.assertTrue(
+            ParseJob.objects.filter(
+                bill=self.bill,
+                status=ParseJob.PENDING,
+                reparse=True).exists())
+
+    @patch('apps.bills.models.image_to_text')
+    def test_reparse_bills_command__bills_reparsed_from_text(
+            self, image_to_text_mock):
+        """
+        Command reparses stale bills without running OCR
+        """
+        call_command(
+            'reparse_bills', processes=0, restart=True,
+            checkpoint=self.get_checkpoint_path(),
+            stdout=StringIO())
+        from apps.bills import models
+        self.bill.refresh_from_db()
+        self.assertFalse(image_to_text_mock.called)
+        self.assertEqual(
+            self.bill.parser_version, models.parser.get_version())
+        self.assertEqual(
+            self.bill.get_parsed_data()['items'][0]['name'],
+            'ITEM')
+
+    @patch('apps.bills.models.Bill.parse_bill')
+    def test_reparse_bills_command__checkpoint_respected(
+            self, parse_bill_mock):
+        """
+        Command does not reparse bills before checkpoint
+        """
+        checkpoint_path = self.get_checkpoint_path()
+        with open(checkpoint_path, 'w') as checkpoint_file:
+            json.dump({'last_id': self.bill.id}, checkpoint_file)
+        call_command(
+            'reparse_bills', processes=0,
+            checkpoint=checkpoint_path,
+            stdout=StringIO())
+        self.assertFalse(parse_bill_mock.called)
+
+    @patch('apps.bills.models.Bill.parse_bill')
+    def test_reparse_bills_command__unexpected_error_counted_as_failed(
+            self, parse_bill_mock):
+        """
+        Command continues reparsing when bill fails
+        with unexpected error
+        """
+        parse_bill_mock.side_effect = IOError('Just for tests')
+        stdout = StringIO()
+        call_command(
+            'reparse_bills', processes=0, restart=True,
+            checkpoint=self.get_checkpoint_path(),
+            stdout=stdout)
+        self.assertIn('0 bills reparsed, 1 failed', stdout.getvalue())
+
+    def get_checkpoint_path(self):
+        import os
+        import shutil
+        import tempfile
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        return os.path.join(tmp_dir, 'checkpoint.json')
@@ -0,0 +1,87 @@
+"""
+Tests for bills images preprocessing before OCR
+"""
+import os
+import shutil
+import tempfile
+from mock import patch
+
+from django.test import TestCase
+from PIL import Image
+
+from apps.bills import preprocessing
+from .check_image import CHECK_IMAGE
+
+
+TEST_CONFIG = {
+    'target_dpi': 10,
+    'bill_width': 2,
+    'fix_orientation': True,
+    'grayscale': True,
+    'threshold': 'otsu',
+}
+
+
+class ImagePreprocessingTestCase(TestCase):
+    """
+    Test preprocessing stages
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.image_path = os.path.join(self.tmp_dir, 'check.jpg')
+        with open(self.image_path, 'wb') as image_file:
+            image_file.write(CHECK_IMAGE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_decode__image_decoded_at_reduced_scale(self):
+        """
+        We decode JPEG at smallest scale that keeps target dpi
+        """
+        image = preprocessing.decode(
+            self.image_path, TEST_CONFIG)
+        # test image is 60x100, minimal side is 20 pixels
+        self.assertEqual(image.size, (30, 50))
+        self.assertEqual(image.mode, 'L')
+
+    def test_decode_without_target_dpi__full_image_decoded(self):
+        """
+        We decode full image if target dpi is not set
+        """
+        config = dict(TEST_CONFIG, target_dpi=None)
+        image = preprocessing.decode(
+            self.image_path, config)
+        self.assertEqual(image.size, (60, 100))
+
+    @patch('apps.bills.preprocessing._get_orientation')
+    def test_fix_orientation__image_rotated(
+            self, get_orientation_mock):
+        """
+        We rotate image according to EXIF orientation
+        """
+        get_orientation_mock.return_value = 6
+        image = Image.new('L', (60, 100))
+        self.assertEqual(
+            preprocessing.fix_orientation(image, TEST_CONFIG).size,
+            (100, 60))
+
+    def test_binarize__only_black_and_white_pixels_left(self):
+        """
+        We leave only black and white pixels after binarization
+        """
+        image = preprocessing.open_image(
+            self.image_path, TEST_CONFIG)
+        self.assertEqual(
+            set(image.getdata()) - set([0, 255]), set())
+
+    def test_otsu_threshold__threshold_between_peaks(self):
+        """
+        We find threshold between dark and bright pixels
+        """
+        histogram = [0] * 256
+        histogram[20] = 100
+        histogram[200] = 300
+        threshold = preprocessing.otsu_threshold(histogram)
+        self.assertTrue(20 <= threshold < 200)
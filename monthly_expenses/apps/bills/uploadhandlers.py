@@ -0,0 +1,60 @@
+"""
+Upload handlers that calculate sha256 hash of uploaded files
+while request body is received.
+Hash is available as sha256_hash_hex attribute of uploaded file,
+so already uploaded bills images can be found
+before they are written to disk
+"""
+from hashlib import sha256
+
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler,
+    TemporaryFileUploadHandler)
+
+
+class HashingUploadHandlerMixin(object):
+    """
+    Attach sha256 hash to uploaded file.
+    Subclasses feed received chunks to self.sha256_hash
+    """
+
+    def new_file(self, *args, **kwargs):
+        self.sha256_hash = sha256()
+        return super(HashingUploadHandlerMixin, self).\
+            new_file(*args, **kwargs)
+
+    def file_complete(self, file_size):
+        uploaded_file = super(HashingUploadHandlerMixin, self).\
+            file_complete(file_size)
+        if uploaded_file is not None:
+            uploaded_file.sha256_hash_hex = \
+                self.sha256_hash.hexdigest()
+        return uploaded_file
+
+
+class HashingMemoryFileUploadHandler(
+        HashingUploadHandlerMixin,
+        MemoryFileUploadHandler):
+    """
+    Keep small files in memory and hash them
+    """
+
+    def receive_data_chunk(self, raw_data, start):
+        # not activated handler passes data to the next handler
+        if self.activated:
+            self.sha256_hash.update(raw_data)
+        return super(HashingMemoryFileUploadHandler, self).\
+            receive_data_chunk(raw_data, start)
+
+
+class HashingTemporaryFileUploadHandler(
+        HashingUploadHandlerMixin,
+        TemporaryFileUploadHandler):
+    """
+    Stream big files to temporary file and hash them
+    """
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256_hash.update(raw_data)
+        return super(HashingTemporaryFileUploadHandler, self).\
+            receive_data_chunk(raw_data, start)
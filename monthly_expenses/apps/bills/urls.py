@@ -2,13 +2,23 @@ from django.conf.urls import url
 
 from .api import (
     ListUploadUniqueBillAPI,
-    RetrieveUpdateBillAPI)
+    RetrieveUpdateBillAPI,
+    BillParseStatusAPI,
+    BulkUploadBillsAPI)
 
 
 urlpatterns = [
     url(r'^$', ListUploadUniqueBillAPI.as_view(), name='bill'),
+    url(
+        r'^bulk/$',
+        BulkUploadBillsAPI.as_view(),
+        name='bulk-upload-bills'),
     url(
         r'^(?P<bill_id>[0-9]+)/$', 
         RetrieveUpdateBillAPI.as_view(),
-        name='retrieve-update-bill')
+        name='retrieve-update-bill'),
+    url(
+        r'^(?P<bill_id>[0-9]+)/parse/$',
+        BillParseStatusAPI.as_view(),
+        name='bill-parse-status')
 ]
\ No newline at end of file
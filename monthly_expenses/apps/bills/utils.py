@@ -5,7 +5,9 @@ def generate_hash_from_image(image_binary_file):
     """
     Generate sha256 using binary contents of the image
     """
-    CHUNK_SIZE = 1024
+    # hashlib releases GIL for chunks bigger than 2KB,
+    # so images can be hashed in parallel threads
+    CHUNK_SIZE = 64 * 1024
     sha256_hash = sha256()
     image_binary_file.seek(0)
     while(True):
@@ -13,4 +15,21 @@ def generate_hash_from_image(image_binary_file):
         if not chunk: break
         sha256_hash.update(chunk)
     return sha256_hash.hexdigest()
-  
\ No newline at end of file
+  
+
+def generate_hashes_in_parallel(image_binary_files, max_workers=4):
+    """
+    Generate sha256 for every passed image in threads
+    Hash calculated on upload is reused
+    Returns hashes in order of passed images
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    def get_hash(image_binary_file):
+        return \
+            getattr(image_binary_file, 'sha256_hash_hex', None) or \
+            generate_hash_from_image(image_binary_file)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        return list(executor.map(get_hash, image_binary_files))
+    finally:
+        executor.shutdown()
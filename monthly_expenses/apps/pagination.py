@@ -0,0 +1,109 @@
+"""
+Keyset pagination shared by apps APIs
+"""
+import base64
+import binascii
+
+from rest_framework import exceptions, pagination, response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Keyset pagination of ordered items.
+    Next page is selected by filter on the last item of the page,
+    so database does not scan skipped items as with offset.
+    Pages are returned only when limit is passed,
+    otherwise all items are listed.
+    Cursor is opaque for api clients
+
+    Subclasses build cursor from item with format_cursor
+    and parse it with parse_cursor
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    max_limit = 500
+    invalid_cursor_message = 'Invalid cursor'
+
+    def prepare(self, request):
+        """
+        Read limit and cursor of the requested page
+        Raises NotFound if cursor is invalid
+        """
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.after = self.decode_cursor(request)
+        self.next_item = None
+
+    def get_fetch_limit(self):
+        """
+        Number of items to select from database.
+        One more item shows if next page exists
+        """
+        if self.limit is None:
+            return None
+        return self.limit + 1
+
+    def paginate_items(self, items):
+        """
+        Accepts items selected with get_fetch_limit
+        Returns items of the page
+        """
+        if self.limit is None:
+            return items
+        items = list(items)
+        self.next_item = items[self.limit - 1] \
+            if len(items) > self.limit else None
+        return items[:self.limit]
+
+    def get_paginated_response(self, data):
+        return response.Response({
+            'next': self.get_next_link(),
+            'results': data
+        })
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return None
+        if limit <= 0:
+            return None
+        return min(limit, self.max_limit)
+
+    def get_next_link(self):
+        if self.next_item is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_item))
+
+    def encode_cursor(self, item):
+        return base64.urlsafe_b64encode(
+            self.format_cursor(item).encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request):
+        """
+        Returns parsed cursor of the last item of previous page
+        or None for the first page
+        Raises NotFound if cursor is invalid
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            return self.parse_cursor(
+                base64.urlsafe_b64decode(
+                    encoded.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise exceptions.NotFound(self.invalid_cursor_message)
+
+    def format_cursor(self, item):
+        raise NotImplementedError
+
+    def parse_cursor(self, cursor):
+        """
+        Should raise ValueError if cursor is invalid
+        """
+        raise NotImplementedError
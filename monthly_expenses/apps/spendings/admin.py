@@ -6,4 +6,18 @@ from django.contrib import admin
 from .models import Spending
 
 
-admin.site.register(Spending)
+class SpendingAdmin(admin.ModelAdmin):
+    # spendings are changed only with rewrite of bill spendings,
+    # which keeps daily rollups in sync
+    list_display = ('name', 'bill', 'user', 'date', 'quantity', 'amount')
+    readonly_fields = (
+        'name', 'quantity', 'amount', 'date', 'bill', 'user', 'create_time')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(Spending, SpendingAdmin)
@@ -10,9 +10,10 @@ from rest_framework import (
     response, status,
     generics, permissions)
 
-from apps.bills.models import Bill
+from apps.bills.models import Bill, ParseJob
 from apps.users.permissions import IsOwner
 from .models import Spending
+from .pagination import SpendingsCursorPagination
 
 logger = logging.getLogger(__name__)
 
@@ -62,6 +63,8 @@ class AggregatedSpendingsInTimeFrame(
     spendings = AggregatedByNameSpendingSerializer(
         many=True)
     total = TotalSpendingsSerializer()
+    # link to the next page of spendings
+    next = serializers.CharField(allow_null=True)
 
 
 class BaseSpendingsAggregationView(
@@ -71,10 +74,15 @@ class BaseSpendingsAggregationView(
     """
     permission_classes = (
         permissions.IsAuthenticated, )
+    # aggregated value spendings are sorted by
+    ordering_field = None
 
     def get(self, request, *args, **kwargs):
         from rest_framework.response import Response
         self._validate_dates_format(request.GET)
+        self.spendings_paginator = SpendingsCursorPagination(
+            self.ordering_field)
+        self.spendings_paginator.prepare(request)
         queryset = self.get_queryset()
         serializer = self.get_serializer(queryset)
         return Response(serializer.data)
@@ -95,20 +103,24 @@ class ListMostExpensiveSpendings(
     sorted by total amount
     """
     serializer_class = AggregatedSpendingsInTimeFrame
+    ordering_field = 'total_amount'
 
     def get_queryset(self):
         AggregatedSpendings = namedtuple(
             'AggregatedSpendings',
-            ['spendings', 'total'])
-        return AggregatedSpendings(
-            spendings=Spending.objects.get_expensive_spendings_in_time_frame(
-                self.request.user,
-                begin_time=self.request.GET.get('begin_time', None),
-                end_time=self.request.GET.get('end_time', None)),
-            total=Spending.objects.get_total_spendings_in_time_frame(
+            ['spendings', 'total', 'next'])
+        paginator = self.spendings_paginator
+        spendings, total = Spending.objects.\
+            get_expensive_spendings_with_total_in_time_frame(
                 self.request.user,
                 begin_time=self.request.GET.get('begin_time', None),
-                end_time=self.request.GET.get('end_time', None)))
+                end_time=self.request.GET.get('end_time', None),
+                after=paginator.after,
+                limit=paginator.get_fetch_limit())
+        return AggregatedSpendings(
+            spendings=paginator.paginate_items(spendings),
+            total=total,
+            next=paginator.get_next_link())
 
 
 class AggregatedSpendingsWithoutTotal(
@@ -118,6 +130,8 @@ class AggregatedSpendingsWithoutTotal(
     """
     spendings = AggregatedByNameSpendingSerializer(
         many=True)
+    # link to the next page of spendings
+    next = serializers.CharField(allow_null=True)
 
 
 class ListMostPopularSpendings(
@@ -127,15 +141,21 @@ class ListMostPopularSpendings(
     sorted by total quantity
     """
     serializer_class = AggregatedSpendingsWithoutTotal
+    ordering_field = 'total_quantity'
 
     def get_queryset(self):
         AggregatedSpendings = namedtuple(
-            'AggregatedSpendings', ['spendings',])
+            'AggregatedSpendings', ['spendings', 'next'])
+        paginator = self.spendings_paginator
+        spendings = Spending.objects.get_popular_spendings_in_time_frame(
+            self.request.user,
+            begin_time=self.request.GET.get('begin_time', None),
+            end_time=self.request.GET.get('end_time', None),
+            after=paginator.after,
+            limit=paginator.get_fetch_limit())
         return AggregatedSpendings(
-            spendings=Spending.objects.get_popular_spendings_in_time_frame(
-                self.request.user,
-                begin_time=self.request.GET.get('begin_time', None),
-                end_time=self.request.GET.get('end_time', None)))
+            spendings=paginator.paginate_items(spendings),
+            next=paginator.get_next_link())
 
 
 ## Spendings modification API
@@ -237,6 +257,9 @@ class ListOrRewriteSpending(
         ],
        },
       'spendings_parsed': {
+        # bill is parsed in background,
+        # poll until status is not pending
+        'parse_status': [pending, done or failed],
         'parse_error': [error during parsing or None],
         'date': [spendings created date: %Y-%m-%d 00:00:00],
         'items': [
@@ -282,9 +305,11 @@ class ListOrRewriteSpending(
 
     def _get_parsed_spendings(self, bill):
         """
-        Try get parsed spendings from bill
+        Get parsed spendings from bill without running OCR.
+        Bill is parsed in background if it wasn't parsed yet
         return data in format:
         {
+          'parse_status': [pending, done or failed],
           'parse_error': [error during parsing or None],
           'date': [spendings created date: %Y-%m-%d 00:00:00],
           'items': [
@@ -296,19 +321,20 @@ class ListOrRewriteSpending(
           ]
         }
         """
-        try:
-            spendings = bill.parse_bill()
-            spendings['parse_error'] = None
-            return spendings
-        except ValueError as e:
+        parse_status, spendings, parse_error = \
+            bill.get_parse_status()
+        ParseJob.objects.record_first_view(bill, parse_status)
+        if spendings is None:
             logger.debug(
-                'Can not parse spendins in bill %d' % bill.id)
-            # Return parsing error if bill can not be parsed
-            return {
-                'parse_error': e.args[0],
+                'Spendings are not parsed for bill %d. Status: %s' % (
+                    bill.id, parse_status))
+            spendings = {
                 'date': None,
                 'items': []
             }
+        spendings['parse_status'] = parse_status
+        spendings['parse_error'] = parse_error
+        return spendings
 
     def post(self, request, *args, **kwargs):
         bill = self.get_object()
@@ -6,3 +6,6 @@ from django.apps import AppConfig
 
 class SpendingsConfig(AppConfig):
     name = 'apps.spendings'
+
+    def ready(self):
+        import handlers
@@ -0,0 +1,59 @@
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+
+from apps.bills.models import Bill
+from .models import DailySpending, Spending
+
+
+@receiver(
+    pre_delete,
+    sender=Bill,
+    dispatch_uid='bill.remove_spendings_from_rollups')
+def remove_spendings_from_rollups(
+        sender, instance, **kwargs):
+    """
+    Subtract spendings of deleted bill from daily rollups
+    Spendings are deleted in the same transaction
+    """
+    DailySpending.objects.apply_changes(
+        instance.user_id,
+        removed=[
+            (instance.id, ) + spending
+            for spending in instance.spendings.values_list(
+                'date', 'name', 'quantity', 'amount')
+        ])
+
+
+@receiver(
+    post_save,
+    sender=Bill,
+    dispatch_uid='bill.update_spendings_owner')
+def update_spendings_owner(
+        sender, instance, created, update_fields=None, **kwargs):
+    """
+    Keep owner of spendings the same as owner of the bill
+    Spendings are moved to rollups of the new owner
+    """
+    if created or (
+            update_fields is not None and 'user' not in update_fields):
+        return
+    spendings = list(
+        Spending.objects.\
+            filter(bill=instance).\
+            exclude(user_id=instance.user_id).\
+            values_list('user_id', 'date', 'name', 'quantity', 'amount'))
+    if not spendings:
+        return
+    for user_id in set(spending[0] for spending in spendings):
+        DailySpending.objects.apply_changes(
+            user_id,
+            removed=[
+                (instance.id, ) + spending[1:]
+                for spending in spendings if spending[0] == user_id
+            ])
+    DailySpending.objects.apply_changes(
+        instance.user_id,
+        added=[(instance.id, ) + spending[1:] for spending in spendings])
+    Spending.objects.\
+        filter(bill=instance).\
+        update(user_id=instance.user_id)
@@ -0,0 +1,107 @@
+"""
+Measure latency of bill spendings rewrite by number of items
+
+Benchmark bill and its spendings are created in a transaction
+which is rolled back, so database is not changed
+"""
+import datetime
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.bills.models import Bill
+from apps.spendings.models import Spending
+
+
+class Command(BaseCommand):
+    help = 'Measure latency of bill spendings rewrite by number of items'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--items',
+            type=int,
+            action='append',
+            dest='items_numbers',
+            help='Number of bill items. Defaults to 10, 60 and 200')
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Number of rewrites in every scenario')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            bill = self._create_bill()
+            for items_number in \
+                    options['items_numbers'] or [10, 60, 200]:
+                self._benchmark_items_number(
+                    bill, items_number, options['repeat'])
+            transaction.set_rollback(True)
+
+    def _create_bill(self):
+        user = User.objects.create(
+            username='benchmark-rewrite-spendings')
+        # image file is never read
+        return Bill.objects.create(
+            user=user,
+            image='benchmark.jpg',
+            sha256_hash_hex='benchmark-rewrite-spendings')
+
+    def _benchmark_items_number(self, bill, items_number, repeat):
+        date = datetime.datetime(2018, 6, 6)
+        items = self._generate_items(items_number, 1)
+        changed_items = self._generate_items(items_number, 2)
+        # half of items are replaced by new ones
+        half_replaced_items = \
+            items[:items_number // 2] + \
+            self._generate_items(items_number, 1, 'new')[
+                items_number // 2:]
+        self._measure(
+            items_number, 'all items created', repeat,
+            lambda: Spending.objects.filter(bill=bill).delete(),
+            lambda: Spending.objects.rewrite_spendings_for_bill(
+                bill, date, items))
+        self._measure(
+            items_number, 'nothing changed', repeat,
+            lambda: None,
+            lambda: Spending.objects.rewrite_spendings_for_bill(
+                bill, date, items))
+        self._measure(
+            items_number, 'all amounts changed', repeat,
+            lambda: Spending.objects.rewrite_spendings_for_bill(
+                bill, date, items),
+            lambda: Spending.objects.rewrite_spendings_for_bill(
+                bill, date, changed_items))
+        self._measure(
+            items_number, 'half items replaced', repeat,
+            lambda: Spending.objects.rewrite_spendings_for_bill(
+                bill, date, items),
+            lambda: Spending.objects.rewrite_spendings_for_bill(
+                bill, date, half_replaced_items))
+
+    def _generate_items(self, items_number, quantity, prefix='item'):
+        return [
+            {
+                'name': '%s-%d' % (prefix, index),
+                'quantity': quantity,
+                'amount': index * quantity + 0.5
+            }
+            for index in range(items_number)
+        ]
+
+    def _measure(self, items_number, name, repeat, prepare, rewrite):
+        """
+        Run rewrite repeat times. Prepare is run before
+        every rewrite and is not measured
+        """
+        duration = 0
+        for _ in range(repeat):
+            prepare()
+            start = time.time()
+            rewrite()
+            duration += time.time() - start
+        self.stdout.write(
+            '%d items, %s: %.2f ms per rewrite' % (
+                items_number, name, duration / repeat * 1000))
@@ -0,0 +1,143 @@
+"""
+Compare query plans of spendings aggregation
+filtered by owner of the bill and by owner of the spending
+
+Synthetic spendings can be generated in a transaction
+which is rolled back, so database is not changed
+"""
+import datetime
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+
+from apps.bills.models import Bill
+from apps.spendings.models import Spending
+
+
+class Command(BaseCommand):
+    help = 'Print EXPLAIN of spendings aggregation queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=0,
+            help='Number of synthetic spendings. '
+                 'Existing spendings are used by default')
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=100,
+            help='Number of synthetic users')
+        parser.add_argument(
+            '--user',
+            default=None,
+            help='Username to filter spendings by. '
+                 'Defaults to the first synthetic or existing user')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = None
+            if options['rows']:
+                user = self._generate_spendings(
+                    options['rows'], options['users'])
+            if options['user']:
+                user = User.objects.get(username=options['user'])
+            user = user or User.objects.order_by('id').first()
+            self._analyze()
+            begin_time = datetime.date(2018, 1, 1)
+            end_time = datetime.date(2018, 4, 1)
+            for name, filters in (
+                    ('by bill owner', {'bill__user': user}),
+                    ('by spending owner', {'user': user})):
+                queryset = Spending.objects.\
+                    filter(
+                        date__gte=begin_time,
+                        date__lt=end_time,
+                        **filters).\
+                    values('name').\
+                    annotate(
+                        bills_number=models.Count('bill', distinct=True),
+                        total_quantity=models.Sum('quantity'),
+                        total_amount=models.Sum('amount')).\
+                    order_by('-total_amount')
+                self._explain(name, queryset)
+            transaction.set_rollback(True)
+
+    def _generate_spendings(self, rows, users_number):
+        """
+        Create users with bills of 20 spendings
+        dated during 2017-2018
+        Returns first created user
+        """
+        start = time.time()
+        generator = random.Random(0)
+        users = [
+            User.objects.create(username='explain-spendings-%d' % index)
+            for index in range(users_number)
+        ]
+        bills_number = rows // 20 + 1
+        Bill.objects.bulk_create(
+            [
+                Bill(
+                    user=generator.choice(users),
+                    # image files are never read
+                    image='explain-%d.jpg' % index,
+                    sha256_hash_hex='explain-spendings-%d' % index)
+                for index in range(bills_number)
+            ])
+        bills = list(
+            Bill.objects.\
+                filter(sha256_hash_hex__startswith='explain-spendings-').\
+                values_list('id', 'user_id'))
+        first_date = datetime.date(2017, 1, 1)
+        spendings = []
+        for index in range(rows):
+            bill_id, user_id = bills[index // 20]
+            spendings.append(
+                Spending(
+                    bill_id=bill_id,
+                    user_id=user_id,
+                    name='item-%d' % generator.randint(0, 5000),
+                    quantity=generator.randint(1, 5),
+                    amount=generator.randint(10, 5000) / 100.0,
+                    # spendings of one bill have the same date
+                    date=first_date + datetime.timedelta(
+                        days=bill_id % 730)))
+            if len(spendings) == 10000:
+                self._create_spendings(spendings)
+                spendings = []
+        self._create_spendings(spendings)
+        self.stdout.write(
+            '%d spendings of %d bills generated in %.1fs' % (
+                rows, bills_number, time.time() - start))
+        return users[0]
+
+    def _create_spendings(self, spendings):
+        # unique names in every bill
+        Spending.objects.bulk_create(
+            dict(
+                ((spending.bill_id, spending.name), spending)
+                for spending in spendings).values())
+
+    def _analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def _explain(self, name, queryset):
+        sql, params = queryset.query.sql_with_params()
+        explain = 'EXPLAIN QUERY PLAN' \
+            if connection.vendor == 'sqlite' else 'EXPLAIN ANALYZE'
+        with connection.cursor() as cursor:
+            cursor.execute('%s %s' % (explain, sql), params)
+            plan = cursor.fetchall()
+        start = time.time()
+        list(queryset)
+        duration = time.time() - start
+        self.stdout.write('%s (%.1f ms):' % (name, duration * 1000))
+        for row in plan:
+            self.stdout.write(
+                '    ' + ' '.join(str(column) for column in row))
@@ -0,0 +1,33 @@
+"""
+Rebuild daily spendings rollups from spendings
+
+Rollups are maintained when spendings are rewritten,
+rebuild is needed only after spendings are changed
+bypassing SpendingsManager
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.spendings.models import DailySpending
+
+
+class Command(BaseCommand):
+    help = 'Rebuild daily spendings rollups from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            default=None,
+            help='Username. Defaults to all users')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(
+                    'User %s does not exist' % options['user'])
+        created = DailySpending.objects.rebuild(user)
+        self.stdout.write(
+            '%d daily spendings rollups created' % created)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-17 12:45
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_daily_rollups(apps, schema_editor):
+    """
+    Aggregate existing spendings to daily rollups
+    """
+    from django.db.models import Count, Sum
+    from django.db.models.functions import Lower
+    Spending = apps.get_model('spendings', 'Spending')
+    DailySpending = apps.get_model('spendings', 'DailySpending')
+    DailyBills = apps.get_model('spendings', 'DailyBills')
+    rollups = Spending.objects.\
+        annotate(normalized_name=Lower('name')).\
+        values('bill__user', 'date', 'normalized_name').\
+        annotate(
+            bills_number=Count('bill', distinct=True),
+            total_quantity=Sum('quantity'),
+            total_amount=Sum('amount')).\
+        order_by()
+    DailySpending.objects.bulk_create(
+        [
+            DailySpending(
+                user_id=rollup['bill__user'],
+                date=rollup['date'],
+                name=rollup['normalized_name'],
+                bills_number=rollup['bills_number'],
+                quantity=rollup['total_quantity'],
+                amount=rollup['total_amount'])
+            for rollup in rollups.iterator()
+        ],
+        batch_size=1000)
+    rollups = Spending.objects.\
+        values('bill__user', 'date').\
+        annotate(bills_number=Count('bill', distinct=True)).\
+        order_by()
+    DailyBills.objects.bulk_create(
+        [
+            DailyBills(
+                user_id=rollup['bill__user'],
+                date=rollup['date'],
+                bills_number=rollup['bills_number'])
+            for rollup in rollups.iterator()
+        ],
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('spendings', '0004_auto_20180506_1328'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBills',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('bills_number', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_bills', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailySpending',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('name', models.CharField(max_length=128)),
+                ('bills_number', models.PositiveIntegerField(default=0)),
+                ('quantity', models.IntegerField(default=0)),
+                ('amount', models.FloatField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_spendings', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyspending',
+            unique_together=set([('user', 'date', 'name')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailybills',
+            unique_together=set([('user', 'date')]),
+        ),
+        migrations.RunPython(
+            build_daily_rollups,
+            migrations.RunPython.noop),
+    ]
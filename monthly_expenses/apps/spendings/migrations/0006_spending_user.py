@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-17 12:46
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def backfill_spendings_user(apps, schema_editor):
+    """
+    Copy owner of the bill to its spendings.
+    Spendings are updated by batches of ids,
+    every batch is committed separately, so table
+    is not locked for the whole backfill.
+    Last id is read again after every batch, so spendings
+    created by previous version during backfill are updated too
+    """
+    from django.db import transaction
+    from django.db.models import Max, OuterRef, Subquery
+    Bill = apps.get_model('bills', 'Bill')
+    Spending = apps.get_model('spendings', 'Spending')
+    owner = Bill.objects.\
+        filter(id=OuterRef('bill_id')).\
+        values('user_id')[:1]
+    start = 0
+    while start <= (
+            Spending.objects.aggregate(Max('id'))['id__max'] or 0):
+        with transaction.atomic():
+            Spending.objects.\
+                filter(
+                    id__gte=start,
+                    id__lt=start + BACKFILL_BATCH_SIZE,
+                    user__isnull=True).\
+                update(user_id=Subquery(owner))
+        start += BACKFILL_BATCH_SIZE
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """
+    Add index without blocking writes to the table on Postgres.
+    Can be used only in not atomic migration
+    """
+
+    def database_forwards(
+            self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super(AddIndexConcurrently, self).database_forwards(
+                app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(
+                schema_editor.connection.alias, model):
+            schema_editor.execute(
+                self.index.create_sql(model, schema_editor).replace(
+                    'CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1))
+
+    def database_backwards(
+            self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super(AddIndexConcurrently, self).database_backwards(
+                app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(
+                schema_editor.connection.alias, model):
+            schema_editor.execute(
+                'DROP INDEX CONCURRENTLY IF EXISTS %s' %
+                schema_editor.quote_name(self.index.name))
+
+
+class Migration(migrations.Migration):
+    # backfill batches are committed one by one
+    # and indexes are created concurrently
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('spendings', '0005_daily_rollups'),
+        ('bills', '0013_bill_list_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='spending',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='spendings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(
+            backfill_spendings_user,
+            migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='spending',
+            index=models.Index(fields=['user', 'date'], name='spendings_s_user_id_776386_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='spending',
+            index=models.Index(fields=['user', 'name'], name='spendings_s_user_id_315875_idx'),
+        ),
+    ]
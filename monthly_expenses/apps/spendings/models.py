@@ -9,6 +9,50 @@ from .utils import aggregate_spendings_by_name
 
 
 logger = logging.getLogger(__name__)
+# number of query parameters is limited by some databases
+MAX_QUERY_PARAMETERS = 900
+
+
+def update_in_bulk(manager, rows, fields, **values):
+    """
+    Update fields of every row to its own values with one query
+    per batch of rows.
+    Accepts dictionary {row id: {field name: value}}
+    Values passed as keyword arguments are set for all rows
+    """
+    meta = manager.model._meta
+    row_ids = sorted(rows)
+    # every row adds two parameters per field and its id
+    batch_size = \
+        (MAX_QUERY_PARAMETERS - len(values)) // (2 * len(fields) + 1)
+    for start in range(0, len(row_ids), batch_size):
+        batch_ids = row_ids[start:start + batch_size]
+        updates = dict(
+            (
+                name,
+                models.Case(
+                    *[
+                        models.When(
+                            pk=row_id,
+                            then=models.Value(rows[row_id][name]))
+                        for row_id in batch_ids
+                    ],
+                    output_field=meta.get_field(name))
+            )
+            for name in fields)
+        updates.update(values)
+        manager.filter(pk__in=batch_ids).update(**updates)
+
+
+class ConstantSubquery(models.Subquery):
+    """
+    Subquery which does not reference outer query.
+    It has the same value for every group of aggregation,
+    so it is not added to GROUP BY
+    """
+
+    def get_group_by_cols(self):
+        return []
 
 
 class SpendingsManager(models.Manager):
@@ -17,25 +61,52 @@ class SpendingsManager(models.Manager):
     """
 
     def get_expensive_spendings_in_time_frame(
-            self, *args, **kwargs):
+            self, user,
+            begin_time=None, end_time=None,
+            after=None, limit=None):
         """
         Return aggrergated spndings by item in given time frame
         sorted by total amount
         """
-        return \
-            self.get_spendings_in_time_frame(*args, **kwargs).\
-                 order_by('-total_amount')
+        return self.get_sorted_spendings_page(
+            self.get_spendings_in_time_frame(
+                user, begin_time, end_time),
+            'total_amount', after, limit)
 
     def get_popular_spendings_in_time_frame(
-            self, *args, **kwargs):
+            self, user,
+            begin_time=None, end_time=None,
+            after=None, limit=None):
         """
         Return aggrergated spndings by item in given time frame
         sorted by total quantity
         """
-        return \
-            self.get_spendings_in_time_frame(*args, **kwargs).\
-                 order_by('-total_quantity')
-   
+        return self.get_sorted_spendings_page(
+            self.get_spendings_in_time_frame(
+                user, begin_time, end_time),
+            'total_quantity', after, limit)
+
+    def get_sorted_spendings_page(
+            self, spendings, field,
+            after=None, limit=None):
+        """
+        Sort aggregated spendings by field descending.
+        Spendings with the same value are sorted by name,
+        so order of pages is stable.
+        After is tuple (value of field, name) of the last spending
+        of previous page. Only spendings after it are returned
+        Limit is maximum number of returned spendings
+        """
+        spendings = spendings.order_by('-' + field, 'name')
+        if after is not None:
+            value, name = after
+            spendings = spendings.filter(
+                models.Q(**{field + '__lt': value}) |
+                models.Q(**{field: value, 'name__gt': name}))
+        if limit is not None:
+            spendings = spendings[:limit]
+        return spendings
+
     def get_spendings_in_time_frame(
             self, user, 
             begin_time=None, end_time=None):
@@ -44,16 +115,14 @@ class SpendingsManager(models.Manager):
         Returns sorted list of items with their quanuity and total amount
         in given time frame.time
         End time is not included.
+        Spendings are aggregated from daily rollups.
         Returns annotated QuerySet.
         """
-        qs = self.filter(bill__user=user)
-        if begin_time:
-            qs = qs.filter(date__gte=begin_time)
-        if end_time:
-            qs = qs.filter(date__lt=end_time)
-        return qs.values('name').\
+        return DailySpending.objects.\
+               in_time_frame(user, begin_time, end_time).\
+               values('name').\
                annotate(
-                   bills_number=models.Count('bill', distinct=True),
+                   bills_number=models.Sum('bills_number'),
                    total_quantity=models.Sum('quantity'),
                    total_amount=models.Sum('amount'))
 
@@ -69,15 +138,17 @@ class SpendingsManager(models.Manager):
             'total_amunt': [total spendings amount int],
         }
         """
-        qs = self.filter(bill__user=user)
-        if begin_time:
-            qs = qs.filter(date__gte=begin_time)
-        if end_time:
-            qs = qs.filter(date__lt=end_time)
-        result = qs.aggregate(
-            total_bills_number=models.Count('bill', distinct=True),
-            total_quantity=models.Sum('quantity'),
-            total_amount=models.Sum('amount'))
+        result = DailySpending.objects.\
+            in_time_frame(user, begin_time, end_time).\
+            aggregate(
+                total_quantity=models.Sum('quantity'),
+                total_amount=models.Sum('amount'))
+        # bill has one date, so bills of different days are different
+        result.update(
+            DailyBills.objects.\
+                in_time_frame(user, begin_time, end_time).\
+                aggregate(
+                    total_bills_number=models.Sum('bills_number')))
         # return 0 instead of None for aggregated data
         for key in [
                 'total_amount',
@@ -86,12 +157,156 @@ class SpendingsManager(models.Manager):
             result[key] = result[key] or 0
         return result
 
+    def get_expensive_spendings_with_total_in_time_frame(
+            self, user,
+            begin_time=None, end_time=None,
+            after=None, limit=None):
+        """
+        Aggregates spendings by item sorted by total amount
+        together with their total with one query.
+        After and limit select page of spendings
+        as in get_sorted_spendings_page, total is not limited.
+        Returns tuple (list of aggregated spendings,
+        total in format of get_total_spendings_in_time_frame)
+        """
+        from django.db import connections
+        connection = connections[self.db]
+        if connection.vendor == 'postgresql':
+            return self._get_expensive_spendings_with_grouping_sets(
+                connection, user, begin_time, end_time, after, limit)
+        if after is not None or limit is not None:
+            # total can not be summed up from the page
+            return (
+                list(
+                    self.get_expensive_spendings_in_time_frame(
+                        user, begin_time, end_time, after, limit)),
+                self.get_total_spendings_in_time_frame(
+                    user, begin_time, end_time))
+        # total quantity and amount are summed up from grouped rows
+        spendings = list(
+            self.get_expensive_spendings_in_time_frame(
+                user, begin_time, end_time).\
+            annotate(
+                total_bills_number=ConstantSubquery(
+                    self._get_total_bills_number_query(
+                        user, begin_time, end_time),
+                    output_field=models.IntegerField())))
+        total = {
+            'total_bills_number': 0,
+            'total_quantity': 0,
+            'total_amount': 0,
+        }
+        for spending in spendings:
+            total['total_bills_number'] = \
+                spending.pop('total_bills_number') or 0
+            total['total_quantity'] += spending['total_quantity']
+            total['total_amount'] += spending['total_amount']
+        return spendings, total
+
+    def _get_total_bills_number_query(
+            self, user, begin_time, end_time):
+        return DailyBills.objects.\
+            in_time_frame(user, begin_time, end_time).\
+            order_by().\
+            values('user').\
+            annotate(
+                total_bills_number=models.Sum('bills_number')).\
+            values('total_bills_number')
+
+    def _get_expensive_spendings_with_grouping_sets(
+            self, connection, user, begin_time, end_time, after, limit):
+        """
+        Totals are computed by the database
+        as additional grouping set of the same scan.
+        Total row is sorted first, so page filter and limit
+        are applied to spendings only
+        """
+        sql, params = self._build_grouping_sets_query(
+            connection, user, begin_time, end_time, after, limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        # total row is the first one
+        # and is returned even if there are no spendings
+        total_quantity, total_amount, total_bills_number = rows[0][3:]
+        # rows are (name, is total, bills number,
+        # quantity, amount, total bills number)
+        spendings = [
+            {
+                'name': row[0],
+                'bills_number': row[2],
+                'total_quantity': row[3],
+                'total_amount': row[4],
+            }
+            for row in rows[1:]
+        ]
+        return spendings, {
+            'total_bills_number': total_bills_number or 0,
+            'total_quantity': total_quantity or 0,
+            'total_amount': total_amount or 0,
+        }
+
+    def _build_grouping_sets_query(
+            self, connection, user, begin_time, end_time, after, limit):
+        """
+        Build query of spendings aggregated by name with total row.
+        Only quoted names are formatted into the query,
+        all passed values are query parameters
+        Returns tuple (sql, params)
+        """
+        quote_name = connection.ops.quote_name
+        name_column = quote_name('name')
+        amount_sum = 'SUM(%s)' % quote_name('amount')
+        conditions = ['%s = %%s' % quote_name('user_id')]
+        params = [user.pk]
+        if begin_time:
+            conditions.append('%s >= %%s' % quote_name('date'))
+            params.append(begin_time)
+        if end_time:
+            conditions.append('%s < %%s' % quote_name('date'))
+            params.append(end_time)
+        where = ' AND '.join(conditions)
+        params = params + params
+        having = ''
+        if after is not None:
+            having = \
+                'HAVING GROUPING({name}) = 1 OR {amount} < %s ' \
+                'OR ({amount} = %s AND {name} > %s) '.format(
+                    name=name_column, amount=amount_sum)
+            params.extend([after[0], after[0], after[1]])
+        sql = \
+            'SELECT {name}, GROUPING({name}), SUM({bills_number}), ' \
+            'SUM({quantity}), {amount}, ' \
+            '(SELECT SUM({bills_number}) FROM {daily_bills} ' \
+            'WHERE {where}) ' \
+            'FROM {daily_spending} WHERE {where} ' \
+            'GROUP BY GROUPING SETS (({name}), ()) ' \
+            '{having}' \
+            'ORDER BY GROUPING({name}) DESC, {amount} DESC, {name}'.format(
+                name=name_column,
+                amount=amount_sum,
+                bills_number=quote_name('bills_number'),
+                quantity=quote_name('quantity'),
+                daily_bills=quote_name(DailyBills._meta.db_table),
+                daily_spending=quote_name(DailySpending._meta.db_table),
+                where=where,
+                having=having)
+        if limit is not None:
+            # total row is selected in addition to the page
+            sql += ' LIMIT %s'
+            params.append(limit + 1)
+        return sql, params
+
     @transaction.atomic
     def rewrite_spendings_for_bill(
             self, bill, date, spendings):
         """
-        Delete all spendings for bill
-        and create new one form passed spendings.
+        Replace all spendings for bill
+        with passed spendings.
+        Only difference with existing spendings is written:
+        removed spendings are deleted with one query,
+        changed spendings are updated with one query
+        and new spendings are created in bulk
 
         Accept spendings as a list of dics:
         [
@@ -102,25 +317,60 @@ class SpendingsManager(models.Manager):
             }
         ]
         """
-        # delete all previous spendings
-        self.filter(
-            bill=bill).delete()
-        # create new spendings
         items = aggregate_spendings_by_name(
             spendings)
-        for name, item in items.items():
-            # impossible to get Integrity error here
-            # because all items were aggregated by name
-            self.create(
+        date = date.date()
+        # {name: (id, quantity, amount, date)}
+        existing_spendings = dict(
+            (name, (spending_id, quantity, amount, spending_date))
+            for name, spending_id, quantity, amount, spending_date in
+            self.select_for_update().\
+                filter(bill=bill).\
+                values_list('name', 'id', 'quantity', 'amount', 'date'))
+        new_names = set(items) - set(existing_spendings)
+        DailySpending.objects.apply_changes(
+            bill.user_id,
+            removed=[
+                (bill.id, spending_date, name, quantity, amount)
+                for name, (_, quantity, amount, spending_date)
+                in existing_spendings.items()
+            ],
+            added=[
+                (bill.id, date, name, item['quantity'], item['amount'])
+                for name, item in items.items()
+            ])
+        removed_ids = [
+            spending[0]
+            for name, spending in existing_spendings.items()
+            if name not in items
+        ]
+        if removed_ids:
+            self.filter(id__in=removed_ids).delete()
+        changed = dict(
+            (existing_spendings[name][0], item)
+            for name, item in items.items()
+            if name in existing_spendings and
+            existing_spendings[name][1:] != (
+                item['quantity'], item['amount'], date))
+        if changed:
+            update_in_bulk(
+                self, changed, ('quantity', 'amount'), date=date)
+        # impossible to get Integrity error here
+        # because all items were aggregated by name
+        self.bulk_create([
+            self.model(
+                user_id=bill.user_id,
                 name=name,
-                quantity=item['quantity'],
-                amount=item['amount'],
-                date=date.date(),
+                quantity=items[name]['quantity'],
+                amount=items[name]['amount'],
+                date=date,
                 bill=bill)
-            logger.debug(
-                'Created item with name %s details %s' % (
-                name, item)) 
-
+            for name in sorted(new_names)
+        ])
+        logger.debug(
+            'Rewritten spendings for bill %d: '
+            '%d deleted, %d updated, %d created' % (
+                bill.id, len(removed_ids), len(changed), len(new_names)))
 
 class Spending(models.Model):
     """
@@ -140,6 +390,14 @@ class Spending(models.Model):
     bill = models.ForeignKey(
         'bills.Bill', 
         related_name='spendings')
+    # Owner of the bill, so spendings of the user
+    # are filtered without join with bills.
+    # Nullable only to be added without table rewrite
+    user = models.ForeignKey(
+        'auth.User',
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='spendings')
     create_time = models.DateTimeField(
         verbose_name='Speding was logged',
         auto_now_add=True)
@@ -149,3 +407,250 @@ class Spending(models.Model):
     class Meta:
         unique_together = (
                 'name', 'bill') # requires preaggregation of the same items in one bill
+        indexes = [
+            models.Index(fields=['user', 'date']),
+            models.Index(fields=['user', 'name']),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.user_id is None:
+            self.user_id = self.bill.user_id
+        return super(Spending, self).save(*args, **kwargs)
+
+
+def _update_rollups(manager, user_id, key_fields, changes):
+    """
+    Add changes to rollups of the user.
+    Accepts dictionary {key: {field name: change}}, where key is tuple
+    of key_fields values. First key field is date.
+    Rollups without bills are deleted
+    """
+    if not changes:
+        return
+    rollups = manager.filter(
+        user_id=user_id,
+        date__in=set(key[0] for key in changes))
+    if len(key_fields) > 1:
+        rollups = rollups.filter(**{
+            '%s__in' % key_fields[1]: set(key[1] for key in changes)
+        })
+    rollups = dict(
+        (tuple(getattr(rollup, field) for field in key_fields), rollup)
+        for rollup in rollups.select_for_update())
+    fields = sorted(next(iter(changes.values())))
+    new_rollups = []
+    updated_rollups = {}
+    deleted_ids = []
+    for key, change in changes.items():
+        rollup = rollups.get(key)
+        if rollup is None and change['bills_number'] <= 0:
+            # rollups are out of date, they are fixed by rebuild
+            continue
+        if rollup is None:
+            values = dict(zip(key_fields, key))
+            values.update(change)
+            new_rollups.append(manager.model(user_id=user_id, **values))
+            continue
+        values = dict(
+            (field, getattr(rollup, field) + change[field])
+            for field in fields)
+        if values['bills_number'] <= 0:
+            deleted_ids.append(rollup.id)
+        else:
+            updated_rollups[rollup.id] = values
+    if deleted_ids:
+        manager.filter(id__in=deleted_ids).delete()
+    if updated_rollups:
+        update_in_bulk(manager, updated_rollups, fields)
+    manager.bulk_create(new_rollups)
+
+
+class RollupQuerySet(models.QuerySet):
+    """
+    Rollups filtering
+    """
+
+    def in_time_frame(self, user, begin_time=None, end_time=None):
+        """
+        Rollups of the user in given time frame
+        End time is not included
+        """
+        qs = self.filter(user=user)
+        if begin_time:
+            qs = qs.filter(date__gte=begin_time)
+        if end_time:
+            qs = qs.filter(date__lt=end_time)
+        return qs
+
+
+class RollupManager(
+        models.Manager.from_queryset(RollupQuerySet)):
+    """
+    Creation of rollups
+    """
+
+    def create_in_batches(self, rollups, batch_size=1000):
+        """
+        Create rollups from iterable in bulk by batches
+        Returns number of created rollups
+        """
+        created = 0
+        batch = []
+        for rollup in rollups:
+            batch.append(rollup)
+            if len(batch) == batch_size:
+                self.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        self.bulk_create(batch)
+        return created + len(batch)
+
+
+class DailySpendingsManager(RollupManager):
+    """
+    Maintenance of spendings rollups
+    """
+
+    def apply_changes(self, user_id, removed=(), added=()):
+        """
+        Update daily rollups of the user by changed spendings.
+        Accepts lists of removed and added spendings
+        as tuples (bill id, date, name, quantity, amount)
+        Should be called in transaction that changes spendings
+        """
+        from django.contrib.auth.models import User
+        spendings_changes = {}
+        for sign, spendings in ((-1, removed), (1, added)):
+            for _, date, name, quantity, amount in spendings:
+                change = spendings_changes.setdefault(
+                    (date, name.lower()),
+                    {'bills_number': 0, 'quantity': 0, 'amount': 0})
+                change['bills_number'] += sign
+                change['quantity'] += sign * quantity
+                change['amount'] += sign * amount
+        spendings_changes = dict(
+            (key, change) for key, change in spendings_changes.items()
+            if any(change.values()))
+        # bill is counted once per day
+        removed_bills = set(spending[:2] for spending in removed)
+        added_bills = set(spending[:2] for spending in added)
+        bills_changes = {}
+        for sign, bills in (
+                (-1, removed_bills - added_bills),
+                (1, added_bills - removed_bills)):
+            for _, date in bills:
+                change = bills_changes.setdefault(
+                    (date, ), {'bills_number': 0})
+                change['bills_number'] += sign
+        bills_changes = dict(
+            (key, change) for key, change in bills_changes.items()
+            if change['bills_number'])
+        if not spendings_changes and not bills_changes:
+            return
+        # rollups of the user are changed by one transaction at a time
+        list(
+            User.objects.\
+                select_for_update().\
+                filter(id=user_id).\
+                values_list('id'))
+        _update_rollups(
+            self, user_id, ('date', 'name'), spendings_changes)
+        _update_rollups(
+            DailyBills.objects, user_id, ('date', ), bills_changes)
+
+    @transaction.atomic
+    def rebuild(self, user=None):
+        """
+        Build rollups from all spendings or spendings of the user
+        Spendings without owner are skipped: owner should be
+        copied from the bill by spendings migration first
+        Returns number of created spendings rollups
+        """
+        from django.db.models.functions import Lower
+        without_user = Spending.objects.filter(user__isnull=True).count()
+        if without_user:
+            logger.warning(
+                '%d spendings without owner are skipped' % without_user)
+        spendings = Spending.objects.filter(user__isnull=False)
+        daily_spendings = self.all()
+        daily_bills = DailyBills.objects.all()
+        if user is not None:
+            spendings = spendings.filter(user=user)
+            daily_spendings = daily_spendings.filter(user=user)
+            daily_bills = daily_bills.filter(user=user)
+        daily_spendings.delete()
+        daily_bills.delete()
+        rollups = spendings.\
+            annotate(normalized_name=Lower('name')).\
+            values('user', 'date', 'normalized_name').\
+            annotate(
+                bills_number=models.Count('bill', distinct=True),
+                total_quantity=models.Sum('quantity'),
+                total_amount=models.Sum('amount')).\
+            order_by()
+        created = self.create_in_batches(
+            self.model(
+                user_id=rollup['user'],
+                date=rollup['date'],
+                name=rollup['normalized_name'],
+                bills_number=rollup['bills_number'],
+                quantity=rollup['total_quantity'],
+                amount=rollup['total_amount'])
+            for rollup in rollups.iterator())
+        rollups = spendings.\
+            values('user', 'date').\
+            annotate(bills_number=models.Count('bill', distinct=True)).\
+            order_by()
+        DailyBills.objects.create_in_batches(
+            DailyBills(
+                user_id=rollup['user'],
+                date=rollup['date'],
+                bills_number=rollup['bills_number'])
+            for rollup in rollups.iterator())
+        return created
+
+
+class DailySpending(models.Model):
+    """
+    Spendings of the user aggregated by date and item name.
+    Updated in the same transaction as spendings,
+    can be rebuilt by rebuild_spendings_rollups command
+    """
+    user = models.ForeignKey(
+        'auth.User',
+        on_delete=models.CASCADE,
+        related_name='daily_spendings')
+    date = models.DateField()
+    # lowercased name of spendings
+    name = models.CharField(max_length=128)
+    # number of bills with the item
+    bills_number = models.PositiveIntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    amount = models.FloatField(default=0)
+
+    objects = DailySpendingsManager()
+
+    class Meta:
+        unique_together = (
+            ('user', 'date', 'name'),
+        )
+
+
+class DailyBills(models.Model):
+    """
+    Number of the user bills with spendings by date.
+    Maintained together with daily spendings
+    """
+    user = models.ForeignKey(
+        'auth.User',
+        on_delete=models.CASCADE,
+        related_name='daily_bills')
+    date = models.DateField()
+    bills_number = models.PositiveIntegerField(default=0)
+
+    objects = RollupManager()
+
+    class Meta:
+        unique_together = (
+            ('user', 'date'),
+        )
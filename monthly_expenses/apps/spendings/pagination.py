@@ -0,0 +1,26 @@
+"""
+Pagination of aggregated spendings
+"""
+from apps.pagination import KeysetPagination
+
+
+class SpendingsCursorPagination(KeysetPagination):
+    """
+    Keyset pagination of spendings aggregated by name
+    ordered by aggregated value descending and name.
+    Page is selected by database with filter on the last
+    spending of previous page and limit,
+    so only spendings of the page are serialized.
+    """
+
+    def __init__(self, ordering_field):
+        self.ordering_field = ordering_field
+
+    def format_cursor(self, spending):
+        # repr keeps all digits of aggregated amount
+        return '%r|%s' % (
+            float(spending[self.ordering_field]), spending['name'])
+
+    def parse_cursor(self, cursor):
+        value, name = cursor.split('|', 1)
+        return float(value), name
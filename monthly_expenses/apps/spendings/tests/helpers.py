@@ -5,7 +5,7 @@ import datetime
 from mock import patch
 
 from apps.bills.tests.helpers import BillTestCase
-from apps.spendings.models import Spending
+from apps.spendings.models import DailySpending, Spending
 
 
 class SpendingsTestCase(BillTestCase):
@@ -14,7 +14,7 @@ class SpendingsTestCase(BillTestCase):
     """
 
     @patch(
-        'apps.bills.handlers.generate_hash_from_image')
+        'apps.bills.models.generate_hash_from_image')
     def create_bill_with_mock_hash(
             self, bill_hash, 
             generate_hash_from_image_mock):
@@ -66,3 +66,5 @@ class SpendingsTestCase(BillTestCase):
         for spending_dict in SPENDINGS:
             Spending.objects.create(
                 **spending_dict)
+        # spendings are created bypassing rollups maintenance
+        DailySpending.objects.rebuild()
@@ -0,0 +1,73 @@
+"""
+Test admin of spendings
+"""
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from rest_framework import status
+
+from apps.spendings.models import DailySpending, Spending
+from .helpers import SpendingsTestCase
+
+
+class SpendingAdminTestCase(
+        SpendingsTestCase):
+    """
+    Test that spendings can not be changed in admin,
+    so daily rollups are not broken
+    """
+
+    def setUp(self):
+        self.user = self.get_or_create_user()
+        self.create_spendings()
+        self.spending = Spending.objects.order_by('id').first()
+        self.client.force_login(
+            User.objects.create_superuser(
+                'admin', 'admin@test.com', 'password'))
+
+    def get_rollups(self):
+        return list(
+            DailySpending.objects.\
+                order_by('date', 'name').\
+                values_list('date', 'name', 'quantity', 'amount'))
+
+    def test_add_spending__forbidden(self):
+        """
+        We do not allow to add spendings in admin
+        """
+        response = self.client.get(
+            reverse('admin:spendings_spending_add'))
+        self.assertEqual(
+            response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_delete_spending__forbidden(self):
+        """
+        We do not allow to delete spendings in admin
+        """
+        response = self.client.post(
+            reverse(
+                'admin:spendings_spending_delete',
+                args=(self.spending.id, )),
+            {'post': 'yes'})
+        self.assertEqual(
+            response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertTrue(
+            Spending.objects.filter(id=self.spending.id).exists())
+
+    def test_change_spending__spending_and_rollups_not_changed(self):
+        """
+        We show spending in admin as read only
+        """
+        rollups = self.get_rollups()
+        self.client.post(
+            reverse(
+                'admin:spendings_spending_change',
+                args=(self.spending.id, )),
+            {
+                'name': 'changed',
+                'quantity': 100,
+                'amount': 1000,
+            })
+        spending = Spending.objects.get(id=self.spending.id)
+        self.assertEqual(spending.name, self.spending.name)
+        self.assertEqual(spending.amount, self.spending.amount)
+        self.assertListEqual(self.get_rollups(), rollups)
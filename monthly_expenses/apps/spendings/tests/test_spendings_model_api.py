@@ -3,11 +3,13 @@
 Test python api for spendings model
 """
 import datetime
-from mock import patch
+from unittest import skipUnless
+from mock import MagicMock, patch
 
+from django.db import connection
 from django.test import TestCase
 
-from apps.spendings.models import Spending
+from apps.spendings.models import DailyBills, DailySpending, Spending
 from .helpers import SpendingsTestCase
 
 
@@ -111,12 +113,16 @@ class SpendingAggregationAPITestCase(
             self.get_or_create_user(
                 email='test-1@test.com')
         new_bill = self.create_bill(user=new_user)
-        spending = Spending.objects.create(
-            date=datetime.date(2018, 6, 6),
-            bill=new_bill,
-            name='new-test-1',
-            amount=10.10,
-            quantity=1)
+        Spending.objects.rewrite_spendings_for_bill(
+            new_bill,
+            datetime.datetime(2018, 6, 6),
+            [
+                {
+                    'name': 'new-test-1',
+                    'amount': 10.10,
+                    'quantity': 1
+                }
+            ])
         aggregation = Spending.objects.\
             get_expensive_spendings_in_time_frame(new_user)
         self.assertListEqual(
@@ -182,16 +188,20 @@ class SpendingTotalAPITestCase(
             self.get_or_create_user(
                 email='test-1@test.com')
         new_bill = self.create_bill(user=new_user)
-        spending = Spending.objects.create(
-            date=datetime.date(2018, 6, 6),
-            bill=new_bill,
-            name='new-test-1',
-            amount=10.10,
-            quantity=1)
+        Spending.objects.rewrite_spendings_for_bill(
+            new_bill,
+            datetime.datetime(2018, 6, 6),
+            [
+                {
+                    'name': 'new-test-1',
+                    'amount': 10.10,
+                    'quantity': 1
+                }
+            ])
         aggregation = Spending.objects.\
             get_total_spendings_in_time_frame(new_user)
         self.assertDictEqual(
-            aggregation, 
+            aggregation,
             {
                 'total_amount': 10.1,
                 'total_quantity': 1,
@@ -199,6 +209,225 @@ class SpendingTotalAPITestCase(
             })
 
 
+class SpendingsWithTotalAPITestCase(
+        SpendingsTestCase):
+    """
+    Test python api for spendings aggregation
+    together with total spendings
+    """
+
+    def setUp(self):
+        self.user = self.get_or_create_user()
+        self.create_spendings()
+
+    def test_spendings_with_total__same_as_separate_aggregations(self):
+        """
+        We return the same spendings and total
+        as separate aggregations
+        """
+        for begin_time in [None, datetime.datetime(2018, 4, 4)]:
+            spendings, total = Spending.objects.\
+                get_expensive_spendings_with_total_in_time_frame(
+                    self.user, begin_time=begin_time)
+            self.assertListEqual(
+                spendings,
+                list(
+                    Spending.objects.get_expensive_spendings_in_time_frame(
+                        self.user, begin_time=begin_time)))
+            self.assertDictEqual(
+                total,
+                Spending.objects.get_total_spendings_in_time_frame(
+                    self.user, begin_time=begin_time))
+
+    def test_spendings_with_total__one_query(self):
+        """
+        We aggregate spendings and total with one query
+        """
+        with self.assertNumQueries(1):
+            spendings, total = Spending.objects.\
+                get_expensive_spendings_with_total_in_time_frame(
+                    self.user)
+        self.assertEqual(len(spendings), 3)
+        self.assertEqual(total['total_bills_number'], 3)
+
+    def test_spendings_with_total__no_spendings(self):
+        """
+        We return zeros in total if there are no spendings
+        """
+        new_user = self.get_or_create_user(
+            email='test-1@test.com')
+        spendings, total = Spending.objects.\
+            get_expensive_spendings_with_total_in_time_frame(new_user)
+        self.assertListEqual(spendings, [])
+        self.assertDictEqual(
+            total,
+            {
+                'total_amount': 0,
+                'total_quantity': 0,
+                'total_bills_number': 0,
+            })
+
+    def test_spendings_with_total__page_with_full_total(self):
+        """
+        We return only spendings of the page
+        and total of all spendings
+        """
+        spendings, total = Spending.objects.\
+            get_expensive_spendings_with_total_in_time_frame(
+                self.user, after=(210, 'test-3'), limit=1)
+        self.assertListEqual(
+            [spending['name'] for spending in spendings],
+            ['test-1'])
+        self.assertDictEqual(
+            total,
+            Spending.objects.get_total_spendings_in_time_frame(
+                self.user))
+
+    def test_grouping_sets_query__values_passed_as_params(self):
+        """
+        We pass all values of grouping sets query as parameters
+        """
+        begin_time = datetime.datetime(2018, 4, 4)
+        end_time = datetime.datetime(2018, 5, 5)
+        name = "test-3' OR 1=1 --"
+        sql, params = Spending.objects._build_grouping_sets_query(
+            connection, self.user, begin_time, end_time,
+            after=(210, name), limit=2)
+        self.assertNotIn(name, sql)
+        self.assertIn('GROUP BY GROUPING SETS', sql)
+        self.assertEqual(sql.count('%s'), len(params))
+        self.assertListEqual(
+            params,
+            [
+                self.user.pk, begin_time, end_time,
+                self.user.pk, begin_time, end_time,
+                210, 210, name, 3
+            ])
+
+    def test_grouping_sets_rows__total_row_separated(self):
+        """
+        We return the first row of grouping sets query as total
+        and other rows as spendings
+        """
+        connection_mock = MagicMock()
+        connection_mock.ops.quote_name = connection.ops.quote_name
+        cursor = connection_mock.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [
+            (None, 1, 3, 4, 310.0, 2),
+            ('test-1', 0, 2, 3, 210.0, 2),
+            ('test-2', 0, 1, 1, 100.0, 2),
+        ]
+        spendings, total = Spending.objects.\
+            _get_expensive_spendings_with_grouping_sets(
+                connection_mock, self.user, None, None, None, None)
+        self.assertListEqual(
+            spendings,
+            [
+                {
+                    'name': 'test-1',
+                    'bills_number': 2,
+                    'total_quantity': 3,
+                    'total_amount': 210.0,
+                },
+                {
+                    'name': 'test-2',
+                    'bills_number': 1,
+                    'total_quantity': 1,
+                    'total_amount': 100.0,
+                },
+            ])
+        self.assertDictEqual(
+            total,
+            {
+                'total_bills_number': 2,
+                'total_quantity': 4,
+                'total_amount': 310.0,
+            })
+
+    @skipUnless(
+        connection.vendor == 'postgresql',
+        'GROUPING SETS are supported only by postgresql')
+    def test_grouping_sets_page__same_as_separate_aggregations(self):
+        """
+        We return the same page and total with grouping sets query
+        as separate aggregations
+        """
+        spendings, total = Spending.objects.\
+            _get_expensive_spendings_with_grouping_sets(
+                connection, self.user, None, None,
+                after=(210, 'test-3'), limit=1)
+        self.assertListEqual(
+            spendings,
+            list(
+                Spending.objects.get_expensive_spendings_in_time_frame(
+                    self.user, after=(210, 'test-3'), limit=1)))
+        self.assertDictEqual(
+            total,
+            Spending.objects.get_total_spendings_in_time_frame(
+                self.user))
+
+
+class SpendingsPagesAPITestCase(
+        SpendingsTestCase):
+    """
+    Test python api for pages of aggregated spendings
+    """
+
+    def setUp(self):
+        self.user = self.get_or_create_user()
+        bill = self.create_bill(user=self.user)
+        Spending.objects.rewrite_spendings_for_bill(
+            bill,
+            datetime.datetime(2018, 6, 6),
+            [
+                {'name': 'test-%d' % index, 'amount': 10, 'quantity': 1}
+                for index in [3, 1, 4, 2]
+            ] + [
+                {'name': 'test-5', 'amount': 20, 'quantity': 1}
+            ])
+
+    def test_spendings_pages__ties_sorted_by_name(self):
+        """
+        We sort spendings with the same amount by name
+        """
+        spendings = Spending.objects.\
+            get_expensive_spendings_in_time_frame(self.user)
+        self.assertListEqual(
+            [spending['name'] for spending in spendings],
+            ['test-5', 'test-1', 'test-2', 'test-3', 'test-4'])
+
+    def test_spendings_pages__pages_cover_all_spendings(self):
+        """
+        We return every spending once
+        when pages follow the last spending of previous page
+        """
+        names = []
+        after = None
+        while True:
+            page = list(
+                Spending.objects.get_popular_spendings_in_time_frame(
+                    self.user, after=after, limit=2))
+            if not page:
+                break
+            names.extend(spending['name'] for spending in page)
+            after = (page[-1]['total_quantity'], page[-1]['name'])
+        self.assertListEqual(
+            names,
+            ['test-1', 'test-2', 'test-3', 'test-4', 'test-5'])
+
+    def test_spendings_pages__limit_in_query(self):
+        """
+        We select only spendings of the page from database
+        """
+        spendings = Spending.objects.\
+            get_expensive_spendings_in_time_frame(
+                self.user, after=(10, 'test-1'), limit=2)
+        self.assertIn('LIMIT 2', str(spendings.query))
+        self.assertListEqual(
+            [spending['name'] for spending in spendings],
+            ['test-2', 'test-3'])
+
+
 class RewriteSpendingsAPITestCase(
         SpendingsTestCase):
     """
@@ -312,3 +541,294 @@ class RewriteSpendingsAPITestCase(
             Spending.objects.\
                 filter(id=previous_spending.id).\
                 exists())
+
+    def test_rewriting_spendings__not_changed_spendings_kept(self):
+        """
+        We keep existing spendings with the same name
+        and update their quantity, amount and date
+        """
+        date = datetime.datetime(2018, 5, 6)
+        kept_spending, changed_spending = [
+            Spending.objects.create(
+                name=name,
+                quantity=1,
+                amount=10.10,
+                date=date.date(),
+                bill=self.bill)
+            for name in ('test-0', 'test-1')
+        ]
+        new_date = datetime.datetime(2018, 5, 7)
+        Spending.objects.\
+            rewrite_spendings_for_bill(
+                self.bill, new_date, [
+                    {
+                        'name': 'test-0',
+                        'quantity': 1,
+                        'amount': 10.10
+                    },
+                    {
+                        'name': 'test-1',
+                        'quantity': 2,
+                        'amount': 20.20
+                    },
+                ])
+        self.assertListEqual(
+            list(
+                Spending.objects.\
+                    order_by('id').\
+                    values_list('id', 'quantity', 'amount', 'date')),
+            [
+                (kept_spending.id, 1, 10.10, new_date.date()),
+                (changed_spending.id, 2, 20.20, new_date.date()),
+            ])
+
+    def test_rewriting_spendings__number_of_queries_does_not_grow(self):
+        """
+        We delete, update and create spendings
+        with one query each
+        """
+        date = datetime.datetime(2018, 5, 6)
+        Spending.objects.rewrite_spendings_for_bill(
+            self.bill, date, [
+                {
+                    'name': 'test-%d' % index,
+                    'quantity': 1,
+                    'amount': 10
+                }
+                for index in range(10)
+            ])
+        items = [
+            {
+                'name': 'test-%d' % index,
+                'quantity': 2,
+                'amount': 20
+            }
+            for index in range(5, 15)
+        ]
+        # savepoint, select, user lock,
+        # select, delete, update and insert of rollups,
+        # delete, update and insert of spendings, savepoint release
+        with self.assertNumQueries(11):
+            Spending.objects.\
+                rewrite_spendings_for_bill(self.bill, date, items)
+        self.assertEqual(
+            Spending.objects.filter(
+                bill=self.bill, quantity=2, amount=20).count(),
+            10)
+
+
+class DailySpendingRollupsTestCase(
+        SpendingsTestCase):
+    """
+    Test maintenance of daily spendings rollups
+    """
+
+    def setUp(self):
+        self.user = self.get_or_create_user()
+        self.bill_1 = self.create_bill_with_mock_hash('bill-1')
+        self.bill_2 = self.create_bill_with_mock_hash('bill-2')
+        self.date = datetime.datetime(2018, 5, 6)
+        for bill in (self.bill_1, self.bill_2):
+            Spending.objects.rewrite_spendings_for_bill(
+                bill, self.date, [
+                    {
+                        'name': 'Test-1',
+                        'quantity': 1,
+                        'amount': 10.0
+                    },
+                    {
+                        'name': 'test-2',
+                        'quantity': 2,
+                        'amount': 20.0
+                    }
+                ])
+
+    def get_rollups(self):
+        return (
+            sorted(
+                DailySpending.objects.values_list(
+                    'date', 'name', 'bills_number', 'quantity', 'amount')),
+            sorted(
+                DailyBills.objects.values_list('date', 'bills_number')))
+
+    def test_rewrite_spendings__rollups_updated(self):
+        """
+        We aggregate spendings of all bills
+        by date and lowercased name
+        """
+        self.assertEqual(
+            self.get_rollups(),
+            (
+                [
+                    (self.date.date(), 'test-1', 2, 2, 20.0),
+                    (self.date.date(), 'test-2', 2, 4, 40.0),
+                ],
+                [
+                    (self.date.date(), 2),
+                ]
+            ))
+
+    def test_rewrite_spendings_with_new_date__rollups_moved(self):
+        """
+        We move bill spendings to rollups of the new date
+        and delete rollups without bills
+        """
+        new_date = datetime.datetime(2018, 5, 7)
+        Spending.objects.rewrite_spendings_for_bill(
+            self.bill_1, new_date, [
+                {
+                    'name': 'test-1',
+                    'quantity': 3,
+                    'amount': 30.0
+                }
+            ])
+        self.assertEqual(
+            self.get_rollups(),
+            (
+                [
+                    (self.date.date(), 'test-1', 1, 1, 10.0),
+                    (self.date.date(), 'test-2', 1, 2, 20.0),
+                    (new_date.date(), 'test-1', 1, 3, 30.0),
+                ],
+                [
+                    (self.date.date(), 1),
+                    (new_date.date(), 1),
+                ]
+            ))
+
+    def test_delete_bill__spendings_removed_from_rollups(self):
+        """
+        We subtract spendings of deleted bill from rollups
+        """
+        self.bill_1.delete()
+        self.bill_2.delete()
+        self.assertEqual(self.get_rollups(), ([], []))
+
+    def test_rebuild_rollups_command__same_rollups_created(self):
+        """
+        We build the same rollups from spendings
+        """
+        from django.core.management import call_command
+        from django.utils.six import StringIO
+        rollups = self.get_rollups()
+        DailySpending.objects.all().delete()
+        call_command(
+            'rebuild_spendings_rollups', stdout=StringIO())
+        self.assertEqual(self.get_rollups(), rollups)
+
+
+class SpendingOwnerTestCase(
+        SpendingsTestCase):
+    """
+    Test denormalized owner of spendings
+    """
+
+    def setUp(self):
+        self.user = self.get_or_create_user()
+        self.bill = self.create_bill()
+        self.date = datetime.datetime(2018, 5, 6)
+        Spending.objects.rewrite_spendings_for_bill(
+            self.bill, self.date, [
+                {
+                    'name': 'test-1',
+                    'quantity': 1,
+                    'amount': 10.0
+                }
+            ])
+
+    def test_rewrite_spendings__owner_of_bill_saved(self):
+        """
+        We save owner of the bill to created spendings
+        """
+        self.assertTrue(
+            Spending.objects.filter(user=self.user).exists())
+
+    def test_create_spending__owner_of_bill_saved(self):
+        """
+        We take owner from the bill if it is not passed
+        """
+        spending = Spending.objects.create(
+            name='test-2',
+            amount=10.0,
+            date=self.date.date(),
+            bill=self.bill)
+        self.assertEqual(spending.user_id, self.user.id)
+
+    def test_change_bill_owner__spendings_moved_to_new_owner(self):
+        """
+        We change owner of spendings and move them
+        to rollups of the new owner
+        """
+        new_user = self.get_or_create_user(
+            email='new-test-1@test.com')
+        self.bill.user = new_user
+        self.bill.save(update_fields=['user'])
+        self.assertTrue(
+            Spending.objects.filter(user=new_user).exists())
+        self.assertEqual(
+            list(
+                DailySpending.objects.values_list('user_id', 'name')),
+            [(new_user.id, 'test-1')])
+
+    def test_rebuild_rollups__spendings_without_owner_skipped(self):
+        """
+        We do not fail rebuild of rollups on spendings
+        that were not backfilled with owner yet
+        """
+        Spending.objects.create(
+            name='test-2',
+            amount=10.0,
+            date=self.date.date(),
+            bill=self.bill)
+        Spending.objects.filter(name='test-2').update(user=None)
+        DailySpending.objects.rebuild()
+        self.assertEqual(
+            list(
+                DailySpending.objects.values_list('user_id', 'name')),
+            [(self.user.id, 'test-1')])
+
+
+class BenchmarkRewriteSpendingsTestCase(TestCase):
+    """
+    Test spendings rewrite latency benchmark
+    """
+
+    def test_benchmark__all_scenarios_reported(self):
+        """
+        We report latency of every scenario
+        and leave no benchmark data in database
+        """
+        from django.core.management import call_command
+        from django.utils.six import StringIO
+        stdout = StringIO()
+        call_command(
+            'benchmark_rewrite_spendings',
+            items_numbers=[5],
+            repeat=1,
+            stdout=stdout)
+        self.assertEqual(
+            len(stdout.getvalue().splitlines()), 4)
+        self.assertFalse(Spending.objects.exists())
+
+
+class ExplainSpendingsQueriesTestCase(TestCase):
+    """
+    Test comparison of spendings aggregation query plans
+    """
+
+    def test_explain_synthetic_spendings__plans_reported(self):
+        """
+        We report plans of both queries
+        and leave no synthetic data in database
+        """
+        from django.core.management import call_command
+        from django.utils.six import StringIO
+        stdout = StringIO()
+        call_command(
+            'explain_spendings_queries',
+            rows=100,
+            users=2,
+            stdout=stdout)
+        self.assertIn('by bill owner', stdout.getvalue())
+        self.assertIn('by spending owner', stdout.getvalue())
+        self.assertFalse(Spending.objects.exists())
@@ -9,6 +9,7 @@ from django.core.urlresolvers import reverse
 from django.test import TestCase
 from rest_framework import status
 
+from apps.bills.models import ParseJob
 from apps.spendings.models import Spending
 from .helpers import SpendingsTestCase
 
@@ -27,12 +28,17 @@ class SpendingAggregationAPIBaseTestCase(
     def get_aggregated_by_name_spendings(
             self, 
             begin_time=None, end_time=None,
-            need_auth=True, user=None):
+            need_auth=True, user=None,
+            limit=None, cursor=None):
         get_request = {}
         if begin_time:
             get_request['begin_time'] = begin_time
         if end_time:
             get_request['end_time'] = end_time
+        if limit:
+            get_request['limit'] = limit
+        if cursor:
+            get_request['cursor'] = cursor
         if need_auth:
             self.client.force_login(user or self.user)
         return self.client.get(
@@ -92,7 +98,8 @@ class PopularSpendingsAPITestCase(
             user=new_user)
         self.assertDictEqual(
             response.data, {
-                'spendings': []
+                'spendings': [],
+                'next': None
             })       
 
     def test_aggregated_by_name_spendings__aggregated_spendings_returned(self):   
@@ -118,8 +125,24 @@ class PopularSpendingsAPITestCase(
                         'bills_number': 2,
                     },
                 ],
+                'next': None
             })
 
+    def test_limit_passed__next_page_link_returned(self):
+        """
+        We return first spendings and link to the next page
+        if limit is passed
+        """
+        response = self.get_aggregated_by_name_spendings(limit=2)
+        self.assertListEqual(
+            [spending['name'] for spending in response.data['spendings']],
+            ['test-2', 'test-3'])
+        response = self.client.get(response.data['next'])
+        self.assertListEqual(
+            [spending['name'] for spending in response.data['spendings']],
+            ['test-1'])
+        self.assertIsNone(response.data['next'])
+
 
 class ExpensiveSpendingsAPITestCase(
         SpendingAggregationAPIBaseTestCase):
@@ -177,7 +200,8 @@ class ExpensiveSpendingsAPITestCase(
                     'total_quantity': 0,
                     'total_amount': 0,
                 },
-                'spendings': []
+                'spendings': [],
+                'next': None
             })       
 
     def test_aggregated_by_name_spendings__aggregated_spendings_returned(self):   
@@ -207,9 +231,42 @@ class ExpensiveSpendingsAPITestCase(
                     'total_bills_number': 2,
                     'total_quantity': 22,
                     'total_amount': 100,
-                }
+                },
+                'next': None
             })
 
+    def test_limit_passed__pages_with_full_total_returned(self):
+        """
+        We return spendings page by page following next link
+        and total of all spendings on every page
+        """
+        names = []
+        response = self.get_aggregated_by_name_spendings(limit=1)
+        while True:
+            self.assertDictEqual(
+                response.data['total'],
+                {
+                    'total_bills_number': 3,
+                    'total_quantity': 32,
+                    'total_amount': 310,
+                })
+            names.extend(
+                spending['name'] for spending in response.data['spendings'])
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertListEqual(names, ['test-3', 'test-1', 'test-2'])
+
+    def test_pass_wrong_cursor__not_found_response_returned(self):
+        """
+        We return 404 not found response if cursor can not be decoded
+        """
+        response = self.get_aggregated_by_name_spendings(
+            limit=1, cursor='not-a-cursor')
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_404_NOT_FOUND)
+
 
 class RewriteSpendinRestAPITestCase(
         SpendingsTestCase):
@@ -413,14 +470,13 @@ class ListSpendinRestAPITestCase(
               ]
             })
 
-    @patch('apps.bills.models.Bill.parse_bill')
     def test_successfully_list_spendings__parsed_spendings_returned(
-            self, parse_bill_mock):
+            self):
         """
         Successfully list parsed spendings
         """
-        parse_bill_mock.return_value = {
-            'date': '2018-06-05',
+        self.bill.save_parsed_data({
+            'date': '2018-06-05 00:00:00',
             'items': [
                 {
                   'name': 'test-1',
@@ -428,13 +484,14 @@ class ListSpendinRestAPITestCase(
                   'quantity': 1
                 },
             ]
-        }
+        })
         self.create_spendings_for_bill(self.bill)
         response = self.get_spendings_for_bill()
         self.assertDictEqual(
             response.data['spendings_parsed'],
             {
-              'date': '2018-06-05',
+              'date': '2018-06-05 00:00:00',
+              'parse_status': 'done',
               'parse_error': None,
               'items': [
                 {
@@ -445,22 +502,83 @@ class ListSpendinRestAPITestCase(
               ]
             })
 
-    @patch('apps.bills.models.Bill.parse_bill')
     def test_successfully_list_spendings__parsed_error_returned(
-            self, parse_bill_mock):
+            self):
         """
         Return parsing error if parsing failed
         """
-        parse_bill_mock.side_effect = ValueError('test')
+        ParseJob.objects.create(
+            bill=self.bill,
+            status=ParseJob.FAILED,
+            error='test')
         response = self.get_spendings_for_bill()
         self.assertDictEqual(
             response.data['spendings_parsed'],
             {
               'date': None,
+              'parse_status': 'failed',
               'parse_error': 'test',
               'items': []
             })
 
+    @patch('apps.bills.models.Bill.parse_bill')
+    def test_list_spendings_of_failed_bill__bill_not_parsed(
+            self, parse_bill_mock):
+        """
+        We return saved parsing error of the current parser
+        without parsing bill again
+        """
+        from apps.bills import models
+        self.bill.parse_error = 'No date found'
+        self.bill.parser_version = models.parser.get_version()
+        self.bill.save()
+        response = self.get_spendings_for_bill()
+        self.assertEqual(
+            response.data['spendings_parsed']['parse_error'],
+            'No date found')
+        self.assertFalse(parse_bill_mock.called)
+        self.assertFalse(
+            ParseJob.objects.filter(bill=self.bill).exists())
+
+    @patch('apps.bills.models.Bill.parse_bill')
+    def test_list_not_parsed_spendings__pending_status_returned(
+            self, parse_bill_mock):
+        """
+        We do not parse bill in request and return pending status
+        """
+        response = self.get_spendings_for_bill()
+        self.assertDictEqual(
+            response.data['spendings_parsed'],
+            {
+              'date': None,
+              'parse_status': 'pending',
+              'parse_error': None,
+              'items': []
+            })
+        self.assertFalse(parse_bill_mock.called)
+
+    def test_list_not_parsed_spendings__parse_job_scheduled(self):
+        """
+        We schedule background parsing for not parsed bill
+        """
+        self.get_spendings_for_bill()
+        self.assertTrue(
+            ParseJob.objects.filter(
+                bill=self.bill,
+                status=ParseJob.PENDING).exists())
+
+    def test_list_not_parsed_spendings__first_view_miss_recorded(self):
+        """
+        We record that bill was not parsed by first view
+        """
+        self.get_spendings_for_bill()
+        self.assertEqual(
+            ParseJob.objects.get_first_view_stats(),
+            {
+                'hits': 0,
+                'misses': 1
+            })
+
     def test_user_is_not_logged_in__forbidden_returned(self):
         """
         We return 403 forbidden if user is not logged in
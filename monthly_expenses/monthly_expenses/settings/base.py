@@ -115,6 +115,12 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'monthly_expenses', 'static')
 # Checks images
 MEDIA_ROOT = os.path.join(BASE_DIR, 'apps', 'bills')
 
+# Uploaded files are hashed while request is received
+FILE_UPLOAD_HANDLERS = [
+    'apps.bills.uploadhandlers.HashingMemoryFileUploadHandler',
+    'apps.bills.uploadhandlers.HashingTemporaryFileUploadHandler',
+]
+
 
 # Logging
 LOGGING = {
@@ -145,9 +151,52 @@ LOGGING = {
     },
 }
 
+# OCR and parsing results are shared between bills
+# with the same image. Entries never expire.
+# When cache has more than MAX_ENTRIES entries,
+# 1/CULL_FREQUENCY of entries is removed in order of cache key,
+# not of age: OCR texts ("bills:ocr:" keys) are removed
+# before parsing results, in order of image hash.
+# Cache table is created by createcachetable command
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'bills': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'bills_cache',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+BILLS_CACHE = 'bills'
+
 # only one parser is supported - for finnish checks
 PARSER = 'fi_parser'
 
+# Bills are parsed in background by process_parse_jobs command
+# Job is considered stuck and is retried after timeout (in seconds)
+PARSE_JOB_TIMEOUT = 10 * 60
+# Job which is stuck after that many attempts is failed,
+# as it probably kills or hangs the worker
+PARSE_JOB_MAX_ATTEMPTS = 3
+
+# Bills images preprocessing before OCR
+OCR_PREPROCESSING = {
+    # JPEG images are decoded at the smallest scale
+    # that keeps target dpi for bill of given width (in inches).
+    # None disables decoding at reduced scale
+    'target_dpi': 300,
+    'bill_width': 3.15, # 80mm bills paper
+    'fix_orientation': True,
+    'grayscale': True,
+    # binarization threshold: 0-255, 'otsu' or None to disable
+    'threshold': 'otsu',
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'monthly_expenses.authentication.no_csrf.CsrfExemptSessionAuthentication',